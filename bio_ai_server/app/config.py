@@ -27,3 +27,62 @@ FATSECRET_CLIENT_SECRET = os.getenv("FATSECRET_CLIENT_SECRET")
 FATSECRET_BASE_URL = "https://platform.fatsecret.com/rest/server.api"
 FATSECRET_TOKEN_URL = "https://oauth.fatsecret.com/connect/token"
 FATSECRET_RECOGNITION_URL = "https://platform.fatsecret.com/rest/image-recognition/v2"
+FATSECRET_TIMEOUT_S = float(os.getenv("FATSECRET_TIMEOUT_S", "10"))
+# Pooled keep-alive connections shared by all FatSecret calls
+FATSECRET_MAX_CONNECTIONS = int(os.getenv("FATSECRET_MAX_CONNECTIONS", "20"))
+FATSECRET_RETRIES = int(os.getenv("FATSECRET_RETRIES", "2"))
+# Fraction of vision requests whose full upstream payloads are logged (0 = off)
+VISION_DEBUG_SAMPLE_RATE = float(os.getenv("VISION_DEBUG_SAMPLE_RATE", "0"))
+# Search/autocomplete/barcode response cache: in-process entries, plus the shared Mongo tier
+FATSECRET_CACHE_SIZE = int(os.getenv("FATSECRET_CACHE_SIZE", "5000"))
+FATSECRET_SHARED_CACHE = os.getenv("FATSECRET_SHARED_CACHE", "true").lower() in ("1", "true", "yes")
+
+# Local prefix index over food_products/global_foods (autocomplete and /capture/search)
+FOOD_INDEX_ENABLED = os.getenv("FOOD_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+FOOD_INDEX_REFRESH_S = float(os.getenv("FOOD_INDEX_REFRESH_S", "60"))
+FOOD_INDEX_REBUILD_S = float(os.getenv("FOOD_INDEX_REBUILD_S", "3600"))
+# global_foods is written by bio_nexus; set this when it lives in another database
+FOOD_CATALOG_DB_NAME = os.getenv("FOOD_CATALOG_DB_NAME") or None
+# health_metrics (device samples) is written by bio_worker / bio_nexus into their database
+HEALTH_DB_NAME = os.getenv("HEALTH_DB_NAME", "bio_nexus_db")
+
+# Numeric document IDs (get_next_sequence): counter | hilo | time, see app/db/ids.py
+ID_ALLOCATOR = os.getenv("ID_ALLOCATOR", "hilo").lower()
+ID_BLOCK_SIZE = int(os.getenv("ID_BLOCK_SIZE", "100"))
+# Required per process with ID_ALLOCATOR=time when several processes share a database (0-1023)
+ID_NODE_ID = int(os.getenv("ID_NODE_ID")) if os.getenv("ID_NODE_ID") else None
+
+# Metric history rollups: trailing days recomputed from raw points (device data may still arrive),
+# at most once per user every METRIC_ROLLUP_SETTLE_INTERVAL_S
+METRIC_ROLLUP_SETTLE_DAYS = int(os.getenv("METRIC_ROLLUP_SETTLE_DAYS", "2"))
+METRIC_ROLLUP_SETTLE_INTERVAL_S = float(os.getenv("METRIC_ROLLUP_SETTLE_INTERVAL_S", "300"))
+# Correlation matrices cached per (user, period, end date); new entries invalidate them regardless of TTL
+CORRELATION_CACHE_SIZE = int(os.getenv("CORRELATION_CACHE_SIZE", "512"))
+CORRELATION_CACHE_TTL_S = float(os.getenv("CORRELATION_CACHE_TTL_S", "300"))
+
+# Optional Redis (shared response cache tier); unset = in-process caches only
+REDIS_URL = os.getenv("REDIS_URL") or None
+# /analytics/summary response cache (per user and date, invalidated on writes)
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "10000"))
+SUMMARY_CACHE_TTL_S = float(os.getenv("SUMMARY_CACHE_TTL_S", "300"))
+# /dashboard/state: per-user state of the day, kept up to date by writes; the TTL bounds drift from
+# writers that do not report to it (device data pushed straight to health_metrics)
+DASHBOARD_STATE_CACHE_SIZE = int(os.getenv("DASHBOARD_STATE_CACHE_SIZE", "10000"))
+DASHBOARD_STATE_TTL_S = float(os.getenv("DASHBOARD_STATE_TTL_S", "900"))
+# users documents shared by /profile reads and the dashboard; writes update it in place
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_S = float(os.getenv("USER_CACHE_TTL_S", "600"))
+
+# /sync/batch: points per zlib-compressed chunk on the ingest:health stream, points per request,
+# largest single point (bytes of JSON), and how long a batch status stays pollable
+SYNC_CHUNK_POINTS = int(os.getenv("SYNC_CHUNK_POINTS", "500"))
+SYNC_MAX_POINTS = int(os.getenv("SYNC_MAX_POINTS", "100000"))
+SYNC_MAX_POINT_BYTES = int(os.getenv("SYNC_MAX_POINT_BYTES", "16384"))
+SYNC_STATUS_TTL_S = int(os.getenv("SYNC_STATUS_TTL_S", "86400"))
+
+# Food scan inference (detect_food.py pipeline run in a process pool)
+INFERENCE_ENABLED = os.getenv("INFERENCE_ENABLED", "false").lower() in ("1", "true", "yes")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+# Scans allowed to wait for a free worker before new requests are rejected with 429
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "4"))
+INFERENCE_TIMEOUT_S = float(os.getenv("INFERENCE_TIMEOUT_S", "30"))
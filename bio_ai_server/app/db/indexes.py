@@ -0,0 +1,98 @@
+"""Indexes of every collection bio_ai_server queries, created idempotently at startup.
+
+`INDEXES` is the single place indexes are declared; the lifespan hook calls `ensure_indexes()`,
+which issues one `createIndexes` per collection. MongoDB treats an index that already exists with
+the same keys and options as a no-op, so this is safe on every start and from several processes.
+An index that conflicts with an existing one (same name or keys, different options) is logged and
+skipped rather than failing startup.
+
+Compound keys follow the equality / sort / range order of the queries they serve;
+`tools/check_query_plans.py` runs those queries through `explain()` and fails on any COLLSCAN.
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence, Tuple
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    keys: Sequence[Tuple[str, Any]]
+    options: Dict[str, Any] = field(default_factory=dict)
+    # "app" (MONGO_DB_NAME), "catalog" (FOOD_CATALOG_DB_NAME, written by bio_nexus) or "health"
+    # (HEALTH_DB_NAME, written by bio_worker / bio_nexus)
+    database: str = "app"
+    # For collections another service creates with special options (time-series, ...): creating
+    # the index first would create a plain collection in their place
+    only_if_exists: bool = False
+
+    def model(self) -> IndexModel:
+        return IndexModel(list(self.keys), **self.options)
+
+
+INDEXES: List[IndexSpec] = [
+    # /analytics/entries pages (equality on user/day/deleted, then time order); day rollups
+    IndexSpec("analytics_entries", [("user_id", ASCENDING), ("date", ASCENDING), ("is_deleted", ASCENDING), ("time", ASCENDING), ("_id", ASCENDING)]),
+    # /capture/history keyset pages and the analysis cache lookups
+    IndexSpec("food_analyses", [("user_id", ASCENDING), ("uploaded_at", DESCENDING), ("_id", DESCENDING)]),
+    IndexSpec("food_analyses", [("user_id", ASCENDING), ("image_sha256", ASCENDING)]),
+    IndexSpec("food_analyses", [("user_id", ASCENDING), ("image_phash_bands", ASCENDING)]),
+    # /analytics/summary
+    IndexSpec("daily_metrics", [("user_id", ASCENDING), ("date", ASCENDING)]),
+    # /analytics/insights: latest insight of a type with end_date <= the requested day; the sort
+    # key comes before the range so the newest match is the first index entry
+    IndexSpec("ai_insights", [("user_id", ASCENDING), ("type", ASCENDING), ("generated_at", DESCENDING), ("end_date", ASCENDING)]),
+    # Barcode lookups, /capture/search fallback and the food index delta refresh
+    IndexSpec("food_products", [("barcode", ASCENDING)]),
+    IndexSpec("food_products", [("name", TEXT), ("brand", TEXT)], {"name": "food_products_text"}),
+    IndexSpec("food_products", [("updated_at", ASCENDING)]),
+    IndexSpec("global_foods", [("external_source_id", ASCENDING)], database="catalog", only_if_exists=True),
+    IndexSpec("global_foods", [("updated_at", ASCENDING)], database="catalog", only_if_exists=True),
+    # daily_totals: per-day reads go by _id; range scans and change detection by user
+    IndexSpec("daily_totals", [("user_id", ASCENDING), ("date", ASCENDING)]),
+    IndexSpec("daily_totals", [("user_id", ASCENDING), ("updated_at", ASCENDING)]),
+    # Metric history rollups
+    IndexSpec("metric_rollups_daily", [("user_id", ASCENDING), ("metric", ASCENDING), ("date", ASCENDING)]),
+    IndexSpec("metric_rollups_daily", [("user_id", ASCENDING), ("week", ASCENDING)]),
+    IndexSpec("metric_rollups_daily", [("user_id", ASCENDING), ("date", ASCENDING), ("updated_at", ASCENDING)]),
+    IndexSpec("metric_rollups_weekly", [("user_id", ASCENDING), ("metric", ASCENDING), ("week", ASCENDING)]),
+    # health_metrics is a time-series collection created by bio_nexus
+    IndexSpec("health_metrics", [("metadata.user_id", ASCENDING), ("metadata.sensor_type", ASCENDING), ("timestamp", ASCENDING)], database="health", only_if_exists=True),
+    # FatSecret response cache: documents expire on their own expires_at
+    IndexSpec("fatsecret_cache", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    IndexSpec("leftovers", [("id", ASCENDING)]),
+]
+
+
+async def ensure_indexes(db, catalog_db=None, health_db=None) -> Dict[str, List[str]]:
+    """Create the `INDEXES` missing from `db` / `catalog_db` / `health_db`. Returns index names per collection."""
+    databases = {
+        "app": db,
+        "catalog": catalog_db if catalog_db is not None else db,
+        "health": health_db if health_db is not None else db,
+    }
+    grouped: Dict[Tuple[str, str], List[IndexSpec]] = {}
+    for spec in INDEXES:
+        grouped.setdefault((spec.database, spec.collection), []).append(spec)
+
+    existing = {}
+    created: Dict[str, List[str]] = {}
+    for (database, collection), specs in grouped.items():
+        target = databases[database]
+        if any(spec.only_if_exists for spec in specs):
+            if database not in existing:
+                existing[database] = set(await target.list_collection_names())
+            if collection not in existing[database]:
+                logger.info("Skipping indexes on %s.%s: collection does not exist yet", target.name, collection)
+                continue
+        try:
+            created[collection] = await target[collection].create_indexes([spec.model() for spec in specs])
+        except OperationFailure as e:
+            # Usually an existing index with the same name/keys and other options
+            logger.warning("Could not create indexes on %s.%s: %s", target.name, collection, e)
+    return created
@@ -1,6 +1,8 @@
+from typing import List
+
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import ReturnDocument
-from app.config import MONGODB_URI, MONGO_DB_NAME
+from app.config import MONGODB_URI, MONGO_DB_NAME, FOOD_CATALOG_DB_NAME, HEALTH_DB_NAME, ID_ALLOCATOR, ID_BLOCK_SIZE, ID_NODE_ID
+from app.db.ids import make_allocator
 
 _client: AsyncIOMotorClient | None = None
 
@@ -15,9 +17,31 @@ def get_db():
     return get_client()[MONGO_DB_NAME]
 
 
+def get_catalog_db():
+    """Database holding the shared food catalog (`global_foods`, written by bio_nexus)."""
+    return get_client()[FOOD_CATALOG_DB_NAME or MONGO_DB_NAME]
+
+
+def get_health_db():
+    """Database holding device samples (`health_metrics`, written by bio_worker / bio_nexus)."""
+    return get_client()[HEALTH_DB_NAME]
+
+
+_allocator = None
+
+
+def get_id_allocator():
+    global _allocator
+    if _allocator is None:
+        _allocator = make_allocator(ID_ALLOCATOR, lambda: get_db().counters, block_size=ID_BLOCK_SIZE, node_id=ID_NODE_ID)
+    return _allocator
+
+
 async def get_next_sequence(name: str) -> int:
-    db = get_db()
-    res = await db.counters.find_one_and_update(
-        {"_id": name}, {"$inc": {"seq": 1}}, upsert=True, return_document=ReturnDocument.AFTER
-    )
-    return int(res["seq"]) if res and "seq" in res else 1
+    """Next numeric ID for `name` from the configured allocator (see app/db/ids.py)."""
+    return await get_id_allocator().next_id(name)
+
+
+async def get_next_sequences(name: str, count: int) -> List[int]:
+    """`count` numeric IDs for `name` in one step (at most one round-trip)."""
+    return await get_id_allocator().next_ids(name, count)
@@ -0,0 +1,35 @@
+"""Shared Redis connection (optional: features degrade when REDIS_URL is unset or redis is missing)."""
+import logging
+
+from app.config import REDIS_URL
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # pragma: no cover - redis is optional
+    aioredis = None
+
+    class RedisError(Exception):
+        pass
+
+logger = logging.getLogger(__name__)
+
+_redis = None
+
+if REDIS_URL and aioredis is None:
+    logger.warning("REDIS_URL is set but the redis package is not installed; Redis features are off")
+
+
+def get_redis():
+    """The shared `redis.asyncio.Redis` client, or None when Redis is not configured."""
+    global _redis
+    if _redis is None and REDIS_URL and aioredis is not None:
+        _redis = aioredis.from_url(REDIS_URL)
+    return _redis
+
+
+async def close_redis() -> None:
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
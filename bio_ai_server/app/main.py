@@ -6,10 +6,17 @@ env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
 load_dotenv(env_path)
 
 from fastapi import FastAPI
+from prometheus_client import make_asgi_app
 from app.routers import router as api_router
 from app.config import DEBUG
 from contextlib import asynccontextmanager
-from app.db.mongodb import get_client
+from app.db.mongodb import get_client, get_db, get_catalog_db, get_health_db
+from app.db.indexes import ensure_indexes
+from app.services.inference import get_inference_service
+from app.services.fatsecret import close_fatsecret_client
+from app.services.food_index import get_food_index
+from app.services import response_cache
+from app.db.redis_client import close_redis
 
 
 @asynccontextmanager
@@ -18,15 +25,34 @@ async def lifespan(app):
     client = get_client()
     try:
         await client.admin.command("ping")
+        await ensure_indexes(get_db(), get_catalog_db(), get_health_db())
     except Exception:
         # let the app start; operations will fail if DB is unavailable
         pass
+    # Spawn the model workers up front so the first scan does not pay for loading
+    inference = get_inference_service()
+    if inference is not None:
+        inference.start()
+    # Build the local food index in the background; lookups fall back until it is ready
+    food_index = get_food_index()
+    if food_index is not None:
+        food_index.start()
+    # Drop cached responses other processes invalidate (needs REDIS_URL)
+    response_cache.start()
     yield
+    await response_cache.stop()
+    if food_index is not None:
+        await food_index.stop()
+    if inference is not None:
+        inference.shutdown()
+    await close_fatsecret_client()
+    await close_redis()
 
 
 app = FastAPI(title="Bio AI BFF (dev)", lifespan=lifespan)
 
 app.include_router(api_router, prefix="/api")
+app.mount("/metrics", make_asgi_app())
 
 
 @app.get("/")
@@ -1,6 +1,6 @@
-from fastapi import APIRouter, HTTPException, Query, status
+from fastapi import APIRouter, Header, HTTPException, Query, status
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Dict, Literal, Optional, List
 from app.schemas import (
     DailySummary,
     EnergyScore,
@@ -11,12 +11,16 @@ from app.schemas import (
     SleepMetric,
     InsightResponse,
     CorrelationData,
+    LaggedCorrelation,
     AxisData,
     DataPoint,
     EntryList,
     Entry,
     EntryCreate,
     EntryUpdate,
+    BulkEntryRequest,
+    BulkEntryResponse,
+    BulkEntryResult,
     MetricHistory,
     MetricDataPoint,
     MetricStatistics,
@@ -24,7 +28,14 @@ from app.schemas import (
     MetricType,
     PeriodType,
 )
-from app.db.mongodb import get_db, get_next_sequence
+from app.db.mongodb import get_db, get_next_sequence, get_next_sequences
+from app.services import daily_totals, metric_rollups
+from app.services.correlation import get_correlation_engine, MAX_LAG
+from app.services.dashboard_state import get_dashboard_engine
+from app.services.pagination import InvalidCursor, after, decode_cursor, page
+from app.services.response_cache import get_summary_cache
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 import random
 
 router = APIRouter()
@@ -32,6 +43,40 @@ router = APIRouter()
 # Mock user ID for development
 MOCK_USER_ID = "user_123"
 
+METRIC_LABELS = {
+    "calorie_intake": "Calorie Intake",
+    "protein_intake": "Protein Intake",
+    "carb_intake": "Carb Intake",
+    "fat_intake": "Fat Intake",
+    "active_burn": "Active Burn",
+    "hydration": "Hydration",
+    "steps": "Steps",
+    "sleep_quality": "Sleep Quality",
+    "energy_score": "Energy Score",
+    "hrv_stress": "HRV Stress",
+    "mood": "Mood",
+}
+
+METRIC_UNITS = {
+    "calorie_intake": "kcal",
+    "protein_intake": "g",
+    "carb_intake": "g",
+    "fat_intake": "g",
+    "active_burn": "kcal",
+    "hydration": "ml",
+    "steps": "steps",
+    "sleep_quality": "score",
+    "energy_score": "score",
+    "hrv_stress": "ms",
+    "mood": "score",
+}
+
+# /entries: keyset order within a day and the fields an Entry is built from
+ENTRY_SORT = [("time", 1), ("_id", 1)]
+ENTRY_PROJECTION = [
+    "type", "title", "subtitle", "time", "value", "value_display", "unit", "metadata", "created_at", "updated_at"
+]
+
 
 # Helper functions
 def format_time_label(time_str: str) -> str:
@@ -43,12 +88,70 @@ def format_time_label(time_str: str) -> str:
     return f"{display_hour:02d} {period}"
 
 
+def format_value_display(entry_type: str, value: float) -> str:
+    """Timeline display of an entry value ("-300" burned, "+250ml" water, "540" otherwise)"""
+    if entry_type == "EXERCISE":
+        return f"-{value}"
+    if entry_type == "HYDRATION":
+        return f"+{value}ml"
+    return str(value)
+
+
+def value_display_expression(value: float) -> dict:
+    """Aggregation expression for `format_value_display` of the stored entry's type (pipeline updates)"""
+    return {"$switch": {
+        "branches": [
+            {"case": {"$eq": ["$type", entry_type]}, "then": format_value_display(entry_type, value)}
+            for entry_type in ("EXERCISE", "HYDRATION")
+        ],
+        "default": format_value_display("", value),
+    }}
+
+
+def new_entry(entry_id: str, data: EntryCreate, now: datetime) -> dict:
+    """analytics_entries document for a new entry of the mock user"""
+    return {
+        "_id": entry_id,
+        "user_id": MOCK_USER_ID,
+        "date": data.date,
+        "time": data.time,
+        "type": data.type,
+        "title": data.title,
+        "subtitle": data.subtitle or "",
+        "value": data.value,
+        "value_display": format_value_display(data.type, data.value),
+        "unit": "kcal" if data.type in ["MEAL", "EXERCISE"] else ("ml" if data.type == "HYDRATION" else "score"),
+        "metadata": data.metadata or {},
+        "is_deleted": False,
+        "created_at": now,
+        "updated_at": now
+    }
+
+
 def parse_period(period: PeriodType) -> int:
     """Convert period string to number of days"""
     periods = {"1W": 7, "1M": 30, "3M": 90, "6M": 180, "1Y": 365}
     return periods.get(period, 30)
 
 
+def correlation_insights(metric_left: str, metric_right: str, lagged: List[LaggedCorrelation]) -> List[str]:
+    """Plain-language reading of the lagged correlations (significant, at least moderate)."""
+    left, right = METRIC_LABELS[metric_left].lower(), METRIC_LABELS[metric_right].lower()
+    if all(result.pearson is None for result in lagged):
+        return [f"Not enough days with both {left} and {right} logged yet"]
+    
+    insights = []
+    for result in lagged:
+        if result.pearson is None or result.p_value is None:
+            continue
+        if result.p_value >= 0.05 or abs(result.pearson) < 0.3:
+            continue
+        direction = "higher" if result.pearson > 0 else "lower"
+        when = {0: "the same day", 1: "the next day"}.get(result.lag_days, f"{result.lag_days} days later")
+        insights.append(f"Higher {left} tends to come with {direction} {right} {when} (r = {result.pearson:.2f})")
+    return insights or [f"No clear relationship between {left} and {right} in this period"]
+
+
 def get_date_range(end_date: str, period: PeriodType):
     """Get start and end dates for a period"""
     end = datetime.fromisoformat(end_date)
@@ -63,24 +166,41 @@ def get_date_range(end_date: str, period: PeriodType):
 
 @router.get("/summary", response_model=DailySummary)
 async def get_daily_summary(
-    date: Optional[str] = Query(None, description="Target date (ISO-8601)")
+    date: Optional[str] = Query(None, description="Target date (ISO-8601)"),
+    if_none_match: Optional[str] = Header(None)
 ):
-    """Get daily summary including energy score and metrics."""
+    """
+    Get daily summary including energy score and metrics.
+    
+    Served from the per-user response cache (invalidated by entry and daily_metrics writes);
+    send the ETag back as If-None-Match to get a 304 when nothing changed.
+    """
     if not date:
         date = datetime.utcnow().date().isoformat()
     
+    cache = get_summary_cache()
+    cached = await cache.get(MOCK_USER_ID, date)
+    if cached is None:
+        version = await cache.version(MOCK_USER_ID)
+        summary = await build_daily_summary(MOCK_USER_ID, date)
+        cached = await cache.put(MOCK_USER_ID, date, summary.model_dump_json().encode(), version=version)
+    return cached.response(if_none_match)
+
+
+async def build_daily_summary(user_id: str, date: str) -> DailySummary:
+    """Build the summary from the day's daily_metrics document (created with sample data if missing)."""
     db = get_db()
     
     # Get or create daily metrics
     daily_metric = await db.daily_metrics.find_one({
-        "user_id": MOCK_USER_ID,
+        "user_id": user_id,
         "date": date
     })
     
     if not daily_metric:
         # Create mock data for development
         daily_metric = {
-            "user_id": MOCK_USER_ID,
+            "user_id": user_id,
             "date": date,
             "energy_score": {
                 "value": 88,
@@ -188,57 +308,23 @@ async def get_correlation(
     metric_left: MetricType = Query(..., description="First metric"),
     metric_right: MetricType = Query(..., description="Second metric"),
     period: PeriodType = Query("1M", description="Time period"),
-    end_date: Optional[str] = Query(None, description="End date (ISO-8601)")
+    end_date: Optional[str] = Query(None, description="End date (ISO-8601)"),
+    lag_days: int = Query(0, ge=0, le=MAX_LAG, description="Compare the right metric this many days later")
 ):
-    """Get correlation data between two metrics."""
+    """
+    Get correlation data between two metrics.
+    
+    Pearson and Spearman coefficients over the days both metrics have data, with p-values, for
+    the requested lag and for every lag up to MAX_LAG (e.g. carbs today vs sleep tomorrow).
+    """
     if not end_date:
         end_date = datetime.utcnow().date().isoformat()
     
     start_date, end_date = get_date_range(end_date, period)
     
-    # Mock data generation
-    days = parse_period(period)
-    left_data = []
-    right_data = []
-    
-    for i in range(days):
-        current_date = (datetime.fromisoformat(start_date) + timedelta(days=i)).date().isoformat()
-        left_data.append(DataPoint(
-            date=current_date,
-            value=round(2000 + random.uniform(-300, 300), 1)
-        ))
-        right_data.append(DataPoint(
-            date=current_date,
-            value=round(70 + random.uniform(-15, 15), 1)
-        ))
-    
-    metric_labels = {
-        "calorie_intake": "Calorie Intake",
-        "protein_intake": "Protein Intake",
-        "carb_intake": "Carb Intake",
-        "fat_intake": "Fat Intake",
-        "active_burn": "Active Burn",
-        "hydration": "Hydration",
-        "steps": "Steps",
-        "sleep_quality": "Sleep Quality",
-        "energy_score": "Energy Score",
-        "hrv_stress": "HRV Stress",
-        "mood": "Mood",
-    }
-    
-    metric_units = {
-        "calorie_intake": "kcal",
-        "protein_intake": "g",
-        "carb_intake": "g",
-        "fat_intake": "g",
-        "active_burn": "kcal",
-        "hydration": "ml",
-        "steps": "steps",
-        "sleep_quality": "score",
-        "energy_score": "score",
-        "hrv_stress": "ms",
-        "mood": "score",
-    }
+    matrix = await get_correlation_engine().matrix(get_db(), MOCK_USER_ID, period, start_date, end_date)
+    lagged = [LaggedCorrelation(**matrix.pair(metric_left, metric_right, lag)) for lag in range(MAX_LAG + 1)]
+    selected = lagged[lag_days]
     
     return CorrelationData(
         period=period,
@@ -246,18 +332,23 @@ async def get_correlation(
         end_date=end_date,
         left_axis=AxisData(
             metric=metric_left,
-            label=metric_labels[metric_left],
-            unit=metric_units[metric_left],
-            data=left_data
+            label=METRIC_LABELS[metric_left],
+            unit=METRIC_UNITS[metric_left],
+            data=[DataPoint(date=day, value=round(value, 1)) for day, value in matrix.series(metric_left)]
         ),
         right_axis=AxisData(
             metric=metric_right,
-            label=metric_labels[metric_right],
-            unit=metric_units[metric_right],
-            data=right_data
+            label=METRIC_LABELS[metric_right],
+            unit=METRIC_UNITS[metric_right],
+            data=[DataPoint(date=day, value=round(value, 1)) for day, value in matrix.series(metric_right)]
         ),
-        correlation_coefficient=round(random.uniform(-0.5, 0.8), 2),
-        insights=[f"Higher {metric_labels[metric_left].lower()} correlates with {metric_labels[metric_right].lower()}"]
+        correlation_coefficient=round(selected.pearson, 2) if selected.pearson is not None else None,
+        spearman_coefficient=round(selected.spearman, 2) if selected.spearman is not None else None,
+        p_value=selected.p_value,
+        sample_size=selected.sample_size,
+        lag_days=lag_days,
+        lagged=lagged,
+        insights=correlation_insights(metric_left, metric_right, lagged)
     )
 
 
@@ -268,9 +359,15 @@ async def get_correlation(
 @router.get("/entries", response_model=EntryList)
 async def get_entries(
     date: Optional[str] = Query(None, description="Target date (ISO-8601)"),
-    type: Optional[EntryType] = Query(None, description="Filter by entry type")
+    type: Optional[EntryType] = Query(None, description="Filter by entry type"),
+    limit: int = Query(100, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page")
 ):
-    """Get timeline entries for a specific date."""
+    """
+    Get timeline entries for a specific date, in time order.
+    
+    Keyset-paginated on (time, _id) within the day; total_count is the day's entry count.
+    """
     if not date:
         date = datetime.utcnow().date().isoformat()
     
@@ -284,8 +381,21 @@ async def get_entries(
     if type:
         query["type"] = type
     
-    cursor = db.analytics_entries.find(query).sort("time", 1)
-    entries = await cursor.to_list(length=100)
+    if cursor:
+        try:
+            position = decode_cursor(cursor)
+            if (position["date"], position.get("type")) != (date, type):
+                raise InvalidCursor("Cursor belongs to another query")
+            query.update(after(ENTRY_SORT, [position["time"], position["id"]]))
+        except (InvalidCursor, KeyError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    cursor_docs = db.analytics_entries.find(query, ENTRY_PROJECTION).sort(ENTRY_SORT).limit(limit + 1)
+    entries, next_cursor = page(
+        await cursor_docs.to_list(length=limit + 1),
+        limit,
+        lambda entry: {"date": date, "type": type, "time": entry["time"], "id": entry["_id"]}
+    )
     
     entry_list = []
     for entry in entries:
@@ -305,10 +415,18 @@ async def get_entries(
             updated_at=entry["updated_at"]
         ))
     
+    if not cursor and next_cursor is None:
+        total_count = len(entry_list)
+    else:
+        # Maintained per day and type on every write, so counting is one lookup
+        totals = await daily_totals.get_totals(db, MOCK_USER_ID, date)
+        total_count = int(totals["types"].get(type, {}).get("count", 0) if type else totals["count"])
+    
     return EntryList(
         date=date,
-        total_count=len(entry_list),
-        entries=entry_list
+        total_count=total_count,
+        entries=entry_list,
+        next_cursor=next_cursor
     )
 
 
@@ -322,33 +440,12 @@ async def create_entry(data: EntryCreate):
     db = get_db()
     
     entry_id = f"ent_{await get_next_sequence('analytics_entries')}"
-    now = datetime.utcnow()
-    
-    # Format value display based on type
-    value_display = str(data.value)
-    if data.type == "EXERCISE":
-        value_display = f"-{data.value}"
-    elif data.type == "HYDRATION":
-        value_display = f"+{data.value}ml"
-    
-    entry = {
-        "_id": entry_id,
-        "user_id": MOCK_USER_ID,
-        "date": data.date,
-        "time": data.time,
-        "type": data.type,
-        "title": data.title,
-        "subtitle": data.subtitle or "",
-        "value": data.value,
-        "value_display": value_display,
-        "unit": "kcal" if data.type in ["MEAL", "EXERCISE"] else ("ml" if data.type == "HYDRATION" else "score"),
-        "metadata": data.metadata or {},
-        "is_deleted": False,
-        "created_at": now,
-        "updated_at": now
-    }
+    entry = new_entry(entry_id, data, datetime.utcnow())
     
     await db.analytics_entries.insert_one(entry)
+    totals = await daily_totals.record_created(db, entry)
+    await get_summary_cache().invalidate(MOCK_USER_ID, entry["date"])
+    await get_dashboard_engine().entry_written(MOCK_USER_ID, totals, after=entry)
     
     return Entry(
         id=entry["_id"],
@@ -372,40 +469,34 @@ async def update_entry(entry_id: str, data: EntryUpdate):
     """Update an existing entry."""
     db = get_db()
     
-    # Verify ownership
-    entry = await db.analytics_entries.find_one({
-        "_id": entry_id,
-        "user_id": MOCK_USER_ID,
-        "is_deleted": False
-    })
-    
-    if not entry:
-        raise HTTPException(status_code=404, detail="Entry not found")
-    
     update_data = data.dict(exclude_unset=True)
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
     
     update_data["updated_at"] = datetime.utcnow()
     
-    # Update value_display if value changed
+    # Pipeline update, so value_display can follow the stored type in the same write
+    update = {field: {"$literal": value} for field, value in update_data.items()}
     if "value" in update_data:
-        if entry["type"] == "EXERCISE":
-            update_data["value_display"] = f"-{update_data['value']}"
-        elif entry["type"] == "HYDRATION":
-            update_data["value_display"] = f"+{update_data['value']}ml"
-        else:
-            update_data["value_display"] = str(update_data["value"])
+        update["value_display"] = value_display_expression(update_data["value"])
     
-    result = await db.analytics_entries.find_one_and_update(
-        {"_id": entry_id, "user_id": MOCK_USER_ID},
-        {"$set": update_data},
-        return_document=True
+    # Atomically read the previous version (ownership + not deleted) to update the daily totals
+    before = await db.analytics_entries.find_one_and_update(
+        {"_id": entry_id, "user_id": MOCK_USER_ID, "is_deleted": False},
+        [{"$set": update}],
+        return_document=ReturnDocument.BEFORE
     )
     
-    if not result:
+    if not before:
         raise HTTPException(status_code=404, detail="Entry not found")
     
+    result = {**before, **update_data}
+    if "value" in update_data:
+        result["value_display"] = format_value_display(before["type"], update_data["value"])
+    totals = await daily_totals.record_updated(db, before, result)
+    await get_summary_cache().invalidate(MOCK_USER_ID, *{before["date"], result["date"]})
+    await get_dashboard_engine().entry_written(MOCK_USER_ID, totals, before=before, after=result)
+    
     return Entry(
         id=result["_id"],
         type=result["type"],
@@ -428,7 +519,7 @@ async def delete_entry(entry_id: str):
     """Delete a timeline entry (soft delete)."""
     db = get_db()
     
-    result = await db.analytics_entries.update_one(
+    entry = await db.analytics_entries.find_one_and_update(
         {
             "_id": entry_id,
             "user_id": MOCK_USER_ID,
@@ -442,12 +533,132 @@ async def delete_entry(entry_id: str):
         }
     )
     
-    if result.matched_count == 0:
+    if entry is None:
         raise HTTPException(status_code=404, detail="Entry not found")
     
+    totals = await daily_totals.record_deleted(db, entry)
+    await get_summary_cache().invalidate(MOCK_USER_ID, entry["date"])
+    await get_dashboard_engine().entry_written(MOCK_USER_ID, totals, before=entry)
+    
     return None
 
 
+BULK_STATUS = {"create": "created", "update": "updated", "delete": "deleted"}
+
+
+@router.post("/entries/bulk", response_model=BulkEntryResponse)
+async def bulk_entries(data: BulkEntryRequest):
+    """
+    Apply mixed create/update/delete operations, e.g. edits an offline client replays.
+    
+    IDs for new entries are allocated in one step, the entries to change are read with one query
+    and all writes go out as one unordered bulk_write, so a failing operation does not stop the
+    others. Every operation gets its own result. Daily totals get one update per affected day.
+    Operations have no order, so an entry may be the target of only one of them per request.
+    """
+    db = get_db()
+    now = datetime.utcnow()
+    ops = data.operations
+    results: List[Optional[BulkEntryResult]] = [None] * len(ops)
+    
+    def done(i: int, status_: str, entry_id: Optional[str], error: Optional[str] = None):
+        results[i] = BulkEntryResult(
+            index=i, op=ops[i].op, status=status_, id=entry_id,
+            client_ref=getattr(ops[i], "client_ref", None), error=error
+        )
+    
+    creates = [i for i, op in enumerate(ops) if op.op == "create"]
+    new_ids = [f"ent_{n}" for n in await get_next_sequences("analytics_entries", len(creates))]
+    
+    # entry id -> index of the update/delete targeting it
+    targets: Dict[str, int] = {}
+    for i, op in enumerate(ops):
+        if op.op == "create":
+            continue
+        if op.id in targets:
+            done(i, "conflict", op.id, "Entry is the target of another operation in this request")
+        elif op.op == "update" and not op.changes.model_dump(exclude_unset=True):
+            done(i, "invalid", op.id, "No fields to update")
+        else:
+            targets[op.id] = i
+    
+    before: Dict[str, dict] = {}
+    if targets:
+        async for doc in db.analytics_entries.find(
+            {"_id": {"$in": list(targets)}, "user_id": MOCK_USER_ID, "is_deleted": False}
+        ):
+            before[doc["_id"]] = doc
+    
+    # Parallel lists: bulk_write operations, the request index of each, the entry after it (None when deleted)
+    writes, positions, after = [], [], []
+    for i, entry_id in zip(creates, new_ids):
+        entry = new_entry(entry_id, ops[i].entry, now)
+        writes.append(InsertOne(entry))
+        positions.append(i)
+        after.append(entry)
+    for entry_id, i in targets.items():
+        doc = before.get(entry_id)
+        if doc is None:
+            done(i, "not_found", entry_id, "Entry not found")
+            continue
+        # Only applied if the entry is still the version the totals delta is computed from
+        guard = {"_id": entry_id, "user_id": MOCK_USER_ID, "is_deleted": False, "updated_at": doc.get("updated_at")}
+        if ops[i].op == "update":
+            changes = ops[i].changes.model_dump(exclude_unset=True)
+            if "value" in changes:
+                changes["value_display"] = format_value_display(doc["type"], changes["value"])
+            changes["updated_at"] = now
+            writes.append(UpdateOne(guard, {"$set": changes}))
+            after.append({**doc, **changes})
+        else:
+            writes.append(UpdateOne(guard, {"$set": {"is_deleted": True, "deleted_at": now}}))
+            after.append(None)
+        positions.append(i)
+    
+    errors: Dict[int, str] = {}
+    matched = 0
+    if writes:
+        try:
+            matched = (await db.analytics_entries.bulk_write(writes, ordered=False)).matched_count
+        except BulkWriteError as e:
+            errors = {err["index"]: err.get("errmsg", "Write failed") for err in e.details.get("writeErrors", [])}
+            matched = e.details.get("nMatched", 0)
+    
+    changed = [ops[i].id for pos, i in enumerate(positions) if ops[i].op != "create" and pos not in errors]
+    applied = set(changed)
+    if matched < len(changed):
+        # Some entries changed between the read and the write: find out which writes applied
+        applied = {
+            doc["_id"] async for doc in db.analytics_entries.find(
+                {"_id": {"$in": changed}, "$or": [{"updated_at": now}, {"deleted_at": now}]}, {"_id": 1}
+            )
+        }
+    
+    deltas: Dict[str, Dict[str, float]] = {}
+    for pos, i in enumerate(positions):
+        op = ops[i]
+        entry_id = after[pos]["_id"] if op.op == "create" else op.id
+        if pos in errors:
+            done(i, "failed", entry_id, errors[pos])
+            continue
+        if op.op != "create" and entry_id not in applied:
+            done(i, "conflict", entry_id, "Entry was changed concurrently")
+            continue
+        if entry_id in before:
+            daily_totals.add(deltas.setdefault(before[entry_id]["date"], {}), daily_totals.contribution(before[entry_id], sign=-1))
+        if after[pos] is not None:
+            daily_totals.add(deltas.setdefault(after[pos]["date"], {}), daily_totals.contribution(after[pos]))
+        done(i, BULK_STATUS[op.op], entry_id)
+    
+    if deltas:
+        await daily_totals.apply_many(db, MOCK_USER_ID, deltas)
+        await get_summary_cache().invalidate(MOCK_USER_ID, *deltas)
+        await get_dashboard_engine().days_changed(MOCK_USER_ID, deltas)
+    
+    succeeded = sum(1 for result in results if result.status in BULK_STATUS.values())
+    return BulkEntryResponse(results=results, succeeded=succeeded, failed=len(results) - succeeded)
+
+
 # ============================================================================
 # 6. Metric History
 # ============================================================================
@@ -456,72 +667,40 @@ async def delete_entry(entry_id: str):
 async def get_metric_history(
     metric: MetricType = Query(..., description="Metric name"),
     period: PeriodType = Query("1M", description="Time period"),
-    end_date: Optional[str] = Query(None, description="End date (ISO-8601)")
+    end_date: Optional[str] = Query(None, description="End date (ISO-8601)"),
+    granularity: Literal["day", "week"] = Query("day", description="One point per day, or per week (daily average)")
 ):
-    """Get historical data for a specific metric."""
+    """
+    Get historical data for a specific metric.
+    
+    Served from the daily/weekly rollups (one indexed read whatever the period); days without any
+    samples are omitted.
+    """
     if not end_date:
         end_date = datetime.utcnow().date().isoformat()
     
     start_date, end_date = get_date_range(end_date, period)
     
-    # Mock data generation
-    days = parse_period(period)
-    data = []
-    values = []
-    
-    for i in range(days):
-        current_date = (datetime.fromisoformat(start_date) + timedelta(days=i)).date().isoformat()
-        value = round(2000 + random.uniform(-400, 400), 1)
-        goal = 2300
-        values.append(value)
-        
-        data.append(MetricDataPoint(
-            date=current_date,
-            value=value,
-            goal=goal,
-            percentage=round((value / goal) * 100, 1)
-        ))
+    history = await metric_rollups.get_history(get_db(), MOCK_USER_ID, metric, start_date, end_date, granularity)
+    percentages = history.percentages()
     
-    metric_labels = {
-        "calorie_intake": "Calorie Intake",
-        "protein_intake": "Protein Intake",
-        "carb_intake": "Carb Intake",
-        "fat_intake": "Fat Intake",
-        "active_burn": "Active Burn",
-        "hydration": "Hydration",
-        "steps": "Steps",
-        "sleep_quality": "Sleep Quality",
-        "energy_score": "Energy Score",
-        "hrv_stress": "HRV Stress",
-        "mood": "Mood",
-    }
-    
-    metric_units = {
-        "calorie_intake": "kcal",
-        "protein_intake": "g",
-        "carb_intake": "g",
-        "fat_intake": "g",
-        "active_burn": "kcal",
-        "hydration": "ml",
-        "steps": "steps",
-        "sleep_quality": "score",
-        "energy_score": "score",
-        "hrv_stress": "ms",
-        "mood": "score",
-    }
+    data = [
+        MetricDataPoint(
+            date=day,
+            value=round(float(value), 1),
+            goal=history.goal,
+            percentage=float(percentages[i]) if percentages is not None else None
+        )
+        for i, (day, value) in enumerate(zip(history.dates, history.values))
+    ]
     
     return MetricHistory(
         metric=metric,
-        label=metric_labels[metric],
-        unit=metric_units[metric],
+        label=METRIC_LABELS[metric],
+        unit=METRIC_UNITS[metric],
         period=period,
         start_date=start_date,
         end_date=end_date,
         data=data,
-        statistics=MetricStatistics(
-            average=round(sum(values) / len(values), 1),
-            min=round(min(values), 1),
-            max=round(max(values), 1),
-            goal_achievement_rate=round(sum(1 for v in values if v >= 2300) / len(values), 2)
-        )
+        statistics=MetricStatistics(**history.statistics())
     )
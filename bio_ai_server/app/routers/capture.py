@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query, status
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Literal, Optional
 from app.schemas import (
     ImageAnalysisResponse,
     DetectedItem,
@@ -20,13 +20,39 @@ from app.schemas import (
     FoodSearchResult,
 )
 from app.db.mongodb import get_db, get_next_sequence
+from app.services.inference import (
+    get_inference_service,
+    InferenceSaturated,
+    InferenceTimeout,
+    InferenceUnavailable,
+)
+from app.services.uploads import read_upload, UploadTooLarge, MAX_IMAGE_BYTES
+from app.services.analysis_cache import get_analysis_cache
+from app.services.food_index import get_food_index
+from app.services import daily_totals
+from app.services.dashboard_state import get_dashboard_engine
+from app.services.pagination import InvalidCursor, after, decode_cursor, page
+from app.services.response_cache import get_summary_cache
+from itertools import zip_longest
 import random
+import re
 
 router = APIRouter()
 
 # Mock user ID for development
 MOCK_USER_ID = "user_123"
 
+# /capture/history: keyset order, summary-only projection and the count=estimate cap
+HISTORY_SORT = [("uploaded_at", -1), ("_id", -1)]
+HISTORY_PROJECTION = {
+    "uploaded_at": 1,
+    "thumbnail_url": 1,
+    "was_logged": 1,
+    "detected_items_count": {"$size": {"$ifNull": ["$detected_items", []]}},
+    "primary_item": {"$arrayElemAt": ["$detected_items.name", 0]},
+}
+HISTORY_COUNT_CAP = 1000
+
 # Mock food database
 MOCK_BARCODE_DB = {
     "5449000000996": {
@@ -79,56 +105,45 @@ def format_time_label(time_str: str) -> str:
     return f"{display_hour:02d} {period}"
 
 
-def get_meal_type_from_time(time_str: str) -> str:
-    """Determine meal type from time"""
-    hour = int(time_str.split(":")[0])
-    if 5 <= hour < 11:
-        return "breakfast"
-    elif 11 <= hour < 16:
-        return "lunch"
-    elif 16 <= hour < 22:
-        return "dinner"
-    else:
-        return "snack"
+def parse_grams(value) -> float:
+    """Parse macro values from the nutrient model ("12g", "12.5 g", 12) into grams"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r"[-+]?\d*\.?\d+", str(value or ""))
+    return float(match.group()) if match else 0.0
 
 
-# ============================================================================
-# 1. Photo Analysis
-# ============================================================================
+# The nutrient model does not report a confidence; recognized items get this fixed prior
+SCAN_ITEM_CONFIDENCE = 0.8
 
-@router.post("/analyze/image", response_model=ImageAnalysisResponse)
-async def analyze_image(
-    image: UploadFile = File(...),
-    user_timezone: Optional[str] = Form(None)
-):
-    """
-    Upload an image for AI-powered food recognition.
-    
-    Returns detected food items with nutritional estimates.
-    """
-    # Validate file
-    if not image.content_type or not image.content_type.startswith("image/"):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid image format. Supported formats: jpg, png, heic"
-        )
-    
-    # Check file size (max 10MB)
-    contents = await image.read()
-    if len(contents) > 10 * 1024 * 1024:
-        raise HTTPException(
-            status_code=413,
-            detail="Image file too large. Maximum size is 10MB"
-        )
-    
-    db = get_db()
-    
-    # Generate analysis ID
-    analysis_id = f"scan_{await get_next_sequence('food_analyses')}_{''.join(random.choices('abcdefghijklmnopqrstuvwxyz', k=3))}"
-    now = datetime.utcnow()
-    
-    # Mock AI detection (in production, call actual ML model)
-    detected_items = [
+
+def detected_items_from_scan(scan: dict) -> list:
+    """Map segmentation items + nutrient analyses from the inference pool onto DetectedItems"""
+    detected = []
+    for idx, (item, analysis) in enumerate(zip_longest(scan.get("items", []), scan.get("analyses", []), fillvalue=None), start=1):
+        if item is None:
+            break
+        analysis = analysis or {}
+        recognized = "error" not in analysis and bool(analysis.get("name"))
+        macros = analysis.get("macros") or {}
+        detected.append(DetectedItem(
+            temp_id=f"tmp_{idx:02d}",
+            name=analysis["name"] if recognized else item["id"],
+            confidence=SCAN_ITEM_CONFIDENCE if recognized else 0.0,
+            default_serving=ServingInfo(amount=item["volume_ml"], unit="ml"),
+            nutrition=NutritionInfo(
+                calories=parse_grams(analysis.get("calories")),
+                protein=parse_grams(macros.get("p")),
+                carbs=parse_grams(macros.get("c")),
+                fat=parse_grams(macros.get("f")),
+            ),
+        ))
+    return detected
+
+
+def mock_detected_items() -> list:
+    """Fixed detection used when the inference service is disabled (dev without ML deps)"""
+    return [
         DetectedItem(
             temp_id="tmp_01",
             name="BBQ Pork Ribs",
@@ -175,6 +190,100 @@ async def analyze_image(
             )
         )
     ]
+
+
+def get_meal_type_from_time(time_str: str) -> str:
+    """Determine meal type from time"""
+    hour = int(time_str.split(":")[0])
+    if 5 <= hour < 11:
+        return "breakfast"
+    elif 11 <= hour < 16:
+        return "lunch"
+    elif 16 <= hour < 22:
+        return "dinner"
+    else:
+        return "snack"
+
+
+# ============================================================================
+# 1. Photo Analysis
+# ============================================================================
+
+@router.post("/analyze/image", response_model=ImageAnalysisResponse)
+async def analyze_image(
+    image: UploadFile = File(...),
+    user_timezone: Optional[str] = Form(None)
+):
+    """
+    Upload an image for AI-powered food recognition.
+    
+    Returns detected food items with nutritional estimates.
+    """
+    # Validate file
+    if not image.content_type or not image.content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid image format. Supported formats: jpg, png, heic"
+        )
+    
+    # Stream the upload in chunks; files over 10MB are cut off as soon as they cross the limit
+    try:
+        upload = await read_upload(image, max_bytes=MAX_IMAGE_BYTES)
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=413,
+            detail="Image file too large. Maximum size is 10MB"
+        )
+    contents = upload.data
+    
+    db = get_db()
+    
+    # Identical or near-identical re-uploads return the analysis already stored for them
+    analysis_cache = get_analysis_cache()
+    fingerprint = await analysis_cache.fingerprint(upload.sha256, contents)
+    previous = await analysis_cache.lookup(db, MOCK_USER_ID, fingerprint)
+    if previous is not None:
+        return ImageAnalysisResponse(
+            analysis_id=previous["_id"],
+            uploaded_at=previous["uploaded_at"],
+            detected_items=previous["detected_items"],
+            total_nutrition=previous["total_nutrition"],
+            meal_context=previous["meal_context"]
+        )
+    
+    # Run the segmentation + nutrient pipeline off the event loop
+    service = get_inference_service()
+    if service is not None:
+        try:
+            scan = await service.scan(contents)
+        except InferenceSaturated:
+            raise HTTPException(
+                status_code=429,
+                detail="Image analysis is busy. Please retry shortly.",
+                headers={"Retry-After": "2"}
+            )
+        except InferenceTimeout:
+            raise HTTPException(
+                status_code=504,
+                detail="Image analysis timed out. Please try again."
+            )
+        except InferenceUnavailable:
+            raise HTTPException(
+                status_code=503,
+                detail="Image analysis is temporarily unavailable."
+            )
+        detected_items = detected_items_from_scan(scan)
+        if not detected_items:
+            raise HTTPException(
+                status_code=422,
+                detail="No food items detected in the image. Please try a clearer photo or adjust lighting."
+            )
+    else:
+        detected_items = mock_detected_items()
+    
+    # Generate analysis ID
+    analysis_id = f"scan_{await get_next_sequence('food_analyses')}_{''.join(random.choices('abcdefghijklmnopqrstuvwxyz', k=3))}"
+    now = datetime.utcnow()
     
     # Calculate total nutrition
     total_nutrition = NutritionInfo(
@@ -206,10 +315,12 @@ async def analyze_image(
         "meal_context": meal_context.dict(),
         "user_timezone": user_timezone,
         "was_logged": False,
-        "created_at": now
+        "created_at": now,
+        **analysis_cache.fingerprint_fields(fingerprint)
     }
     
     await db.food_analyses.insert_one(analysis_doc)
+    analysis_cache.remember(MOCK_USER_ID, fingerprint, analysis_doc)
     
     return ImageAnalysisResponse(
         analysis_id=analysis_id,
@@ -332,43 +443,16 @@ async def confirm_entry(data: CaptureConfirm):
             }
         )
     
-    # Calculate daily totals
-    pipeline = [
-        {
-            "$match": {
-                "user_id": MOCK_USER_ID,
-                "date": data.date,
-                "is_deleted": False
-            }
-        },
-        {
-            "$group": {
-                "_id": None,
-                "total_calories": {"$sum": "$value"},
-                "total_protein": {"$sum": "$metadata.protein"},
-                "total_carbs": {"$sum": "$metadata.carbs"},
-                "total_fat": {"$sum": "$metadata.fat"}
-            }
-        }
-    ]
-    
-    result = await db.analytics_entries.aggregate(pipeline).to_list(length=1)
-    
-    if result:
-        totals = result[0]
-        daily_totals = DailyTotals(
-            calories=totals["total_calories"],
-            protein=totals["total_protein"],
-            carbs=totals["total_carbs"],
-            fat=totals["total_fat"]
-        )
-    else:
-        daily_totals = DailyTotals(
-            calories=data.value,
-            protein=data.nutrition.protein,
-            carbs=data.nutrition.carbs,
-            fat=data.nutrition.fat
-        )
+    # Daily totals are maintained incrementally: one atomic $inc, no aggregation over the day
+    totals = await daily_totals.record_created(db, entry_doc)
+    await get_summary_cache().invalidate(MOCK_USER_ID, data.date)
+    await get_dashboard_engine().entry_written(MOCK_USER_ID, totals, after=entry_doc)
+    daily_totals_out = DailyTotals(
+        calories=totals["value"],
+        protein=totals["protein"],
+        carbs=totals["carbs"],
+        fat=totals["fat"]
+    )
     
     return CaptureConfirmResponse(
         id=entry_id,
@@ -381,7 +465,7 @@ async def confirm_entry(data: CaptureConfirm):
             value=data.value,
             type=data.type
         ),
-        daily_totals=daily_totals
+        daily_totals=daily_totals_out
     )
 
 
@@ -392,41 +476,57 @@ async def confirm_entry(data: CaptureConfirm):
 @router.get("/history", response_model=AnalysisHistoryResponse)
 async def get_analysis_history(
     limit: int = Query(10, ge=1, le=50),
-    offset: int = Query(0, ge=0)
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    count: Literal["exact", "estimate", "none"] = Query("exact", description="How to compute total_count"),
+    offset: int = Query(0, ge=0, deprecated=True, description="Use cursor instead")
 ):
     """
-    Get recent image analysis sessions.
+    Get recent image analysis sessions, newest first.
     
     Useful for re-using previous scans or reviewing detection results.
+    Pages are keyset-paginated on (uploaded_at, _id), so every page costs the same; only the
+    summary fields are read (detected_items is reduced server-side to its size and first name).
     """
     db = get_db()
-    
-    # Get total count
-    total_count = await db.food_analyses.count_documents({"user_id": MOCK_USER_ID})
-    
-    # Get analyses
-    cursor = db.food_analyses.find(
-        {"user_id": MOCK_USER_ID}
-    ).sort("uploaded_at", -1).skip(offset).limit(limit)
-    
-    analyses_list = await cursor.to_list(length=limit)
-    
-    analyses = []
-    for analysis in analyses_list:
-        primary_item = analysis["detected_items"][0]["name"] if analysis["detected_items"] else "Unknown"
-        
-        analyses.append(AnalysisHistoryItem(
+    query = {"user_id": MOCK_USER_ID}
+    
+    if cursor:
+        try:
+            position = decode_cursor(cursor)
+            query.update(after(HISTORY_SORT, [position["uploaded_at"], position["id"]]))
+        except (InvalidCursor, KeyError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    docs = await db.food_analyses.find(query, HISTORY_PROJECTION).sort(HISTORY_SORT).skip(
+        0 if cursor else offset
+    ).limit(limit + 1).to_list(length=limit + 1)
+    docs, next_cursor = page(docs, limit, lambda doc: {"uploaded_at": doc["uploaded_at"], "id": doc["_id"]})
+    
+    analyses = [
+        AnalysisHistoryItem(
             analysis_id=analysis["_id"],
             uploaded_at=analysis["uploaded_at"],
             thumbnail_url=analysis.get("thumbnail_url"),
-            detected_items_count=len(analysis["detected_items"]),
-            primary_item=primary_item,
+            detected_items_count=analysis["detected_items_count"],
+            primary_item=analysis.get("primary_item") or "Unknown",
             was_logged=analysis.get("was_logged", False)
-        ))
+        )
+        for analysis in docs
+    ]
+    
+    total_count, estimated = None, False
+    if count == "exact":
+        total_count = await db.food_analyses.count_documents({"user_id": MOCK_USER_ID})
+    elif count == "estimate":
+        # Counting stops at the cap, so the cost is bounded for users with long histories
+        total_count = await db.food_analyses.count_documents({"user_id": MOCK_USER_ID}, limit=HISTORY_COUNT_CAP)
+        estimated = total_count >= HISTORY_COUNT_CAP
     
     return AnalysisHistoryResponse(
         total_count=total_count,
-        analyses=analyses
+        total_count_estimated=estimated,
+        analyses=analyses,
+        next_cursor=next_cursor
     )
 
 
@@ -444,26 +544,40 @@ async def search_food(
     
     Fallback option when barcode scan fails or manual entry needed.
     """
-    db = get_db()
-    
-    # Text search on food products
-    cursor = db.food_products.find(
-        {"$text": {"$search": q}},
-        {"score": {"$meta": "textScore"}}
-    ).sort([("score", {"$meta": "textScore"})]).limit(limit)
-    
-    products = await cursor.to_list(length=limit)
+    # Prefix match on names/brands from the in-memory index, ranked by popularity
+    food_index = get_food_index()
+    foods = food_index.search(q, limit=limit) if food_index is not None else []
+    results = [
+        FoodSearchResult(
+            id=food.id,
+            name=food.name,
+            brand=food.brand,
+            serving_size=food.serving_size,
+            calories=food.calories,
+            image_url=food.image_url
+        )
+        for food in foods
+    ]
     
-    results = []
-    for product in products:
-        results.append(FoodSearchResult(
-            id=str(product["_id"]),
-            name=product["name"],
-            brand=product.get("brand"),
-            serving_size=product["serving_size"],
-            calories=product["nutrition"]["calories"],
-            image_url=product.get("image_url")
-        ))
+    if not results:
+        # Text search on food products (index not built yet, or no prefix match)
+        db = get_db()
+        cursor = db.food_products.find(
+            {"$text": {"$search": q}},
+            {"score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"})]).limit(limit)
+        
+        products = await cursor.to_list(length=limit)
+        
+        for product in products:
+            results.append(FoodSearchResult(
+                id=str(product["_id"]),
+                name=product["name"],
+                brand=product.get("brand"),
+                serving_size=product["serving_size"],
+                calories=product["nutrition"]["calories"],
+                image_url=product.get("image_url")
+            ))
     
     # If no results, add mock results
     if not results:
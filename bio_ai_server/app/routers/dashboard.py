@@ -1,15 +1,25 @@
-from fastapi import APIRouter
-from ..schemas import DashboardState, RingState
+from typing import Optional
+
+from fastapi import APIRouter, Header
+from ..db.mongodb import get_db
+from ..schemas import DashboardState
+from ..services.dashboard_state import get_dashboard_engine
+from ..services.response_cache import CachedResponse
 
 router = APIRouter()
 
+# Mock user ID for development (in production, extract from JWT)
+MOCK_USER_ID = "user_123"
+
+
 @router.get("/state", response_model=DashboardState)
-async def get_dashboard_state():
-    """Return cached or computed dashboard state. (Stubbed sample)"""
-    rings = {"outer_percent": 0.65, "inner_percent": 0.50}
-    return {
-        "rings": rings,
-        "status_msg": "Fuel Up - You are behind schedule.",
-        "fasting_active": False,
-        "ai_card": {"meal": "Salmon Bowl", "reason": "High Stress"}
-    }
+async def get_dashboard_state(if_none_match: Optional[str] = Header(None)):
+    """
+    Rings, status message and fasting state for today.
+
+    Rendered from the user's in-memory state of the day, which entry, goal and sync writes keep
+    up to date (loaded from Mongo on the first request of the day). Send the ETag back as
+    If-None-Match to get a 304 when nothing changed.
+    """
+    state = await get_dashboard_engine().state(get_db(), MOCK_USER_ID)
+    return CachedResponse.of(state.model_dump_json().encode()).response(if_none_match)
@@ -19,6 +19,8 @@ from app.schemas import (
     AccountDeletionResponse,
 )
 from app.db.mongodb import get_db
+from app.services.dashboard_state import get_dashboard_engine
+from app.services.user_cache import get_user_cache, update_user
 
 router = APIRouter()
 
@@ -34,7 +36,7 @@ MOCK_USER_ID = "user_123"
 async def get_profile():
     """Get user profile information."""
     db = get_db()
-    user = await db.users.find_one({"_id": MOCK_USER_ID})
+    user = await get_user_cache().get(db, MOCK_USER_ID)
     
     if not user:
         # Create mock user if doesn't exist (dev only)
@@ -46,6 +48,7 @@ async def get_profile():
             "profile_image_url": None,
         }
         await db.users.insert_one(user)
+        await get_user_cache().updated(MOCK_USER_ID, user)
     
     return ProfileInfo(
         user_id=user["_id"],
@@ -53,6 +56,7 @@ async def get_profile():
         email=user.get("email", ""),
         created_at=user.get("created_at", datetime.utcnow()),
         profile_image_url=user.get("profile_image_url"),
+        fasting_window=user.get("fasting_window"),
     )
 
 
@@ -61,27 +65,31 @@ async def update_profile(update: ProfileUpdate):
     """Update user profile information."""
     db = get_db()
     
-    update_data = {k: v for k, v in update.dict(exclude_unset=True).items() if v is not None}
-    if not update_data:
+    fields = update.dict(exclude_unset=True)
+    update_data = {k: v for k, v in fields.items() if v is not None}
+    clear_fasting = "fasting_window" in fields and fields["fasting_window"] is None
+    if not update_data and not clear_fasting:
         raise HTTPException(status_code=400, detail="No fields to update")
     
     update_data["updated_at"] = datetime.utcnow()
+    operations = {"$set": update_data}
+    if clear_fasting:
+        operations["$unset"] = {"fasting_window": ""}
     
-    result = await db.users.find_one_and_update(
-        {"_id": MOCK_USER_ID},
-        {"$set": update_data},
-        return_document=True,
-    )
+    result = await update_user(db, MOCK_USER_ID, operations)
     
     if not result:
         raise HTTPException(status_code=404, detail="Profile not found")
     
+    if "fasting_window" in fields:
+        await get_dashboard_engine().user_changed(MOCK_USER_ID, result)
     return ProfileInfo(
         user_id=result["_id"],
         name=result.get("name", ""),
         email=result.get("email", ""),
         created_at=result.get("created_at", datetime.utcnow()),
         profile_image_url=result.get("profile_image_url"),
+        fasting_window=result.get("fasting_window"),
     )
 
 
@@ -93,7 +101,7 @@ async def update_profile(update: ProfileUpdate):
 async def get_dietary_profile():
     """Get complete dietary profile."""
     db = get_db()
-    user = await db.users.find_one({"_id": MOCK_USER_ID})
+    user = await get_user_cache().get(db, MOCK_USER_ID)
     
     if not user:
         raise HTTPException(status_code=404, detail="Profile not found")
@@ -120,11 +128,7 @@ async def update_dietary_profile(update: DietaryProfileUpdate):
     set_data = {f"dietary_profile.{k}": v for k, v in update_data.items()}
     set_data["dietary_profile.updated_at"] = datetime.utcnow()
     
-    result = await db.users.find_one_and_update(
-        {"_id": MOCK_USER_ID},
-        {"$set": set_data},
-        return_document=True,
-    )
+    result = await update_user(db, MOCK_USER_ID, {"$set": set_data})
     
     if not result:
         raise HTTPException(status_code=404, detail="Profile not found")
@@ -142,7 +146,7 @@ async def update_dietary_profile(update: DietaryProfileUpdate):
 async def get_allergies():
     """Get allergies list."""
     db = get_db()
-    user = await db.users.find_one({"_id": MOCK_USER_ID})
+    user = await get_user_cache().get(db, MOCK_USER_ID)
     
     if not user:
         raise HTTPException(status_code=404, detail="Profile not found")
@@ -156,15 +160,15 @@ async def set_allergies(data: AllergiesList):
     """Set allergies list (replace)."""
     db = get_db()
     
-    result = await db.users.find_one_and_update(
-        {"_id": MOCK_USER_ID},
+    result = await update_user(
+        db,
+        MOCK_USER_ID,
         {
             "$set": {
                 "dietary_profile.allergies": data.allergies,
                 "dietary_profile.updated_at": datetime.utcnow(),
             }
         },
-        return_document=True,
     )
     
     if not result:
@@ -177,7 +181,7 @@ async def set_allergies(data: AllergiesList):
 async def get_dislikes():
     """Get dislikes list."""
     db = get_db()
-    user = await db.users.find_one({"_id": MOCK_USER_ID})
+    user = await get_user_cache().get(db, MOCK_USER_ID)
     
     if not user:
         raise HTTPException(status_code=404, detail="Profile not found")
@@ -191,15 +195,15 @@ async def set_dislikes(data: DislikesList):
     """Set dislikes list (replace)."""
     db = get_db()
     
-    result = await db.users.find_one_and_update(
-        {"_id": MOCK_USER_ID},
+    result = await update_user(
+        db,
+        MOCK_USER_ID,
         {
             "$set": {
                 "dietary_profile.dislikes": data.dislikes,
                 "dietary_profile.updated_at": datetime.utcnow(),
             }
         },
-        return_document=True,
     )
     
     if not result:
@@ -216,7 +220,7 @@ async def set_dislikes(data: DislikesList):
 async def get_preferences():
     """Get all user preferences."""
     db = get_db()
-    user = await db.users.find_one({"_id": MOCK_USER_ID})
+    user = await get_user_cache().get(db, MOCK_USER_ID)
     
     if not user:
         raise HTTPException(status_code=404, detail="Profile not found")
@@ -243,11 +247,7 @@ async def update_preferences(update: PreferencesUpdate):
     # Prefix all fields with preferences
     set_data = {f"preferences.{k}": v for k, v in update_data.items()}
     
-    result = await db.users.find_one_and_update(
-        {"_id": MOCK_USER_ID},
-        {"$set": set_data},
-        return_document=True,
-    )
+    result = await update_user(db, MOCK_USER_ID, {"$set": set_data})
     
     if not result:
         raise HTTPException(status_code=404, detail="Profile not found")
@@ -266,7 +266,7 @@ async def update_preferences(update: PreferencesUpdate):
 async def get_unit_preference():
     """Get unit preference."""
     db = get_db()
-    user = await db.users.find_one({"_id": MOCK_USER_ID})
+    user = await get_user_cache().get(db, MOCK_USER_ID)
     
     if not user:
         raise HTTPException(status_code=404, detail="Profile not found")
@@ -280,11 +280,7 @@ async def set_unit_preference(data: UnitPreference):
     """Set unit preference."""
     db = get_db()
     
-    result = await db.users.find_one_and_update(
-        {"_id": MOCK_USER_ID},
-        {"$set": {"preferences.metric_units": data.metric_units}},
-        return_document=True,
-    )
+    result = await update_user(db, MOCK_USER_ID, {"$set": {"preferences.metric_units": data.metric_units}})
     
     if not result:
         raise HTTPException(status_code=404, detail="Profile not found")
@@ -300,7 +296,7 @@ async def set_unit_preference(data: UnitPreference):
 async def get_goals():
     """Get user goals."""
     db = get_db()
-    user = await db.users.find_one({"_id": MOCK_USER_ID})
+    user = await get_user_cache().get(db, MOCK_USER_ID)
     
     if not user:
         raise HTTPException(status_code=404, detail="Profile not found")
@@ -318,8 +314,9 @@ async def set_goals(data: GoalsUpdate):
     """Set/replace goals."""
     db = get_db()
     
-    result = await db.users.find_one_and_update(
-        {"_id": MOCK_USER_ID},
+    result = await update_user(
+        db,
+        MOCK_USER_ID,
         {
             "$set": {
                 "goals.list": data.goals,
@@ -327,12 +324,12 @@ async def set_goals(data: GoalsUpdate):
                 "goals.updated_at": datetime.utcnow(),
             }
         },
-        return_document=True,
     )
     
     if not result:
         raise HTTPException(status_code=404, detail="Profile not found")
     
+    await get_dashboard_engine().user_changed(MOCK_USER_ID, result)
     goals = result.get("goals", {})
     return Goals(
         goals=goals.get("list", []),
@@ -346,18 +343,19 @@ async def add_goal(data: GoalAdd):
     """Add a goal to the list."""
     db = get_db()
     
-    result = await db.users.find_one_and_update(
-        {"_id": MOCK_USER_ID},
+    result = await update_user(
+        db,
+        MOCK_USER_ID,
         {
             "$addToSet": {"goals.list": data.goal},
             "$set": {"goals.updated_at": datetime.utcnow()},
         },
-        return_document=True,
     )
     
     if not result:
         raise HTTPException(status_code=404, detail="Profile not found")
     
+    await get_dashboard_engine().user_changed(MOCK_USER_ID, result)
     goals = result.get("goals", {})
     return Goals(
         goals=goals.get("list", []),
@@ -371,18 +369,19 @@ async def remove_goal(goal: str):
     """Remove a goal from the list."""
     db = get_db()
     
-    result = await db.users.find_one_and_update(
-        {"_id": MOCK_USER_ID},
+    result = await update_user(
+        db,
+        MOCK_USER_ID,
         {
             "$pull": {"goals.list": goal},
             "$set": {"goals.updated_at": datetime.utcnow()},
         },
-        return_document=True,
     )
     
     if not result:
         raise HTTPException(status_code=404, detail="Profile not found")
     
+    await get_dashboard_engine().user_changed(MOCK_USER_ID, result)
     goals = result.get("goals", {})
     return Goals(
         goals=goals.get("list", []),
@@ -399,7 +398,7 @@ async def remove_goal(goal: str):
 async def get_subscription():
     """Get subscription information."""
     db = get_db()
-    user = await db.users.find_one({"_id": MOCK_USER_ID})
+    user = await get_user_cache().get(db, MOCK_USER_ID)
     
     if not user:
         raise HTTPException(status_code=404, detail="Profile not found")
@@ -427,11 +426,7 @@ async def update_subscription(data: SubscriptionUpdate):
     set_data = {f"subscription.{k}": v for k, v in update_data.items()}
     set_data["subscription.updated_at"] = datetime.utcnow()
     
-    result = await db.users.find_one_and_update(
-        {"_id": MOCK_USER_ID},
-        {"$set": set_data},
-        return_document=True,
-    )
+    result = await update_user(db, MOCK_USER_ID, {"$set": set_data})
     
     if not result:
         raise HTTPException(status_code=404, detail="Profile not found")
@@ -460,8 +455,9 @@ async def delete_account(data: AccountDeletion):
     deleted_at = datetime.utcnow()
     
     # Soft delete: mark as deleted, keep data for 30 days
-    result = await db.users.find_one_and_update(
-        {"_id": MOCK_USER_ID},
+    result = await update_user(
+        db,
+        MOCK_USER_ID,
         {
             "$set": {
                 "deleted_at": deleted_at,
@@ -469,12 +465,12 @@ async def delete_account(data: AccountDeletion):
                 "status": "deleted",
             }
         },
-        return_document=True,
     )
     
     if not result:
         raise HTTPException(status_code=404, detail="Profile not found")
     
+    await get_dashboard_engine().invalidate(MOCK_USER_ID)
     return AccountDeletionResponse(
         status="account_deleted",
         deleted_at=deleted_at,
@@ -1,12 +1,80 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException
-from fastapi import Depends
-from ..schemas import DashboardState
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import JSONResponse
+
+from ..db.mongodb import get_db, get_next_sequence
+from ..db.redis_client import RedisError
+from ..schemas import SyncBatchStatus, SyncPoint
+from ..services import health_sync, metric_rollups
+from ..services.dashboard_state import get_dashboard_engine
 
 router = APIRouter()
 
-@router.post("/batch")
-async def post_sync_batch(background_tasks: BackgroundTasks, payload: dict):
-    """Accepts a health sync payload. (Stub)"""
-    # In production: validate, store time-series, enqueue energy score calculation
-    background_tasks.add_task(lambda: None)
-    return {"status": "accepted"}
+# Mock user ID for development
+MOCK_USER_ID = "user_123"
+
+
+# The body is read from the request stream, so FastAPI does not derive its schema
+SYNC_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "device_source": {"type": "string"},
+        "points": {"type": "array", "items": SyncPoint.model_json_schema()},
+    },
+    "required": ["points"],
+}
+
+
+@router.post(
+    "/batch",
+    response_model=SyncBatchStatus,
+    status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra={"requestBody": {"required": True, "content": {"application/json": {"schema": SYNC_BATCH_SCHEMA}}}},
+)
+async def post_sync_batch(request: Request):
+    """
+    Queue a batch of device samples for bio_worker and return 202 with a pollable batch id.
+    
+    The body is parsed and validated as it streams in and pushed to the `ingest:health` stream in
+    compressed chunks (see services/health_sync.py); invalid points are skipped and reported in the
+    status. Poll `GET /sync/batch/{batch_id}` until `status` is `done`.
+    """
+    batch_id = f"sync_{await get_next_sequence('sync_batches')}"
+    try:
+        result = await health_sync.ingest(request.stream(), MOCK_USER_ID, batch_id)
+    except health_sync.IngestUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except health_sync.BatchRejected as e:
+        # Chunks pushed before the problem are still inserted by bio_worker
+        await metric_rollups.invalidate(get_db(), MOCK_USER_ID, e.result.days, batch_id=batch_id)
+        await batch_completed(e.status)
+        return JSONResponse(
+            status_code=400,
+            content={"detail": str(e), "batch": e.status.model_dump(mode="json")},
+        )
+    except (RedisError, OSError):
+        raise HTTPException(status_code=503, detail="Health sync queue unavailable")
+    
+    # The rollups of the batch's days are recomputed once bio_worker has inserted its points
+    await metric_rollups.invalidate(get_db(), MOCK_USER_ID, result.days, batch_id=batch_id)
+    await batch_completed(result.status)
+    
+    return result.status
+
+
+async def batch_completed(batch: SyncBatchStatus) -> None:
+    """Reload the dashboard (steps) the first time a batch is seen finished (done, or failed and drained)."""
+    if health_sync.is_finished(batch) and await health_sync.claim_completion(batch.batch_id):
+        await get_dashboard_engine().invalidate(MOCK_USER_ID)
+
+
+@router.get("/batch/{batch_id}", response_model=SyncBatchStatus)
+async def get_sync_batch(batch_id: str):
+    """Progress of a batch queued by POST /sync/batch."""
+    try:
+        batch = await health_sync.get_status(batch_id, MOCK_USER_ID)
+    except health_sync.IngestUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    await batch_completed(batch)
+    return batch
@@ -1,87 +1,32 @@
 from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import Dict, List, Tuple
+from bson import ObjectId
 import os
-import time
-import base64
-import io
-import json
-import requests
-from PIL import Image
-from ..config import (
-    UPLOAD_DIR,
-    FATSECRET_CLIENT_ID,
-    FATSECRET_CLIENT_SECRET,
-    FATSECRET_BASE_URL,
-    FATSECRET_TOKEN_URL,
-    FATSECRET_RECOGNITION_URL,
-)
+import asyncio
+import logging
+from ..db.mongodb import get_db, get_catalog_db
+from ..services.uploads import read_upload, save_upload, UploadTooLarge, MAX_IMAGE_BYTES
+from ..services.fatsecret import get_fatsecret_client
+from ..services.fatsecret_cache import get_fatsecret_cache, search_key, autocomplete_key, barcode_key, is_not_found
+from ..services.gtin import to_gtin13, lookup_variants, InvalidBarcode
+from ..services.food_index import get_food_index
+from ..services.instrumentation import RequestTrace
+from ..services.preprocess import prepare_for_recognition
+from ..config import UPLOAD_DIR
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-# Token cache for FatSecret OAuth
-_token_cache = {"token": None, "expires_at": 0}
-
+AUTOCOMPLETE_LIMIT = 10
+BARCODE_BATCH_MAX = 100
+# FatSecret lookups in flight per batch request
+BARCODE_BATCH_CONCURRENCY = 8
 
-def get_fatsecret_token():
-    """Get OAuth token for FatSecret API with caching."""
-    global _token_cache
-    if _token_cache["token"] and time.time() < _token_cache["expires_at"]:
-        return _token_cache["token"]
-
-    try:
-        payload = {
-            "grant_type": "client_credentials",
-            "scope": "basic premier barcode image-recognition"
-        }
-        response = requests.post(
-            FATSECRET_TOKEN_URL,
-            auth=(FATSECRET_CLIENT_ID, FATSECRET_CLIENT_SECRET),
-            data=payload
-        )
-
-        if response.status_code != 200:
-            print("FatSecret Token Error:", response.text)
-            return None
-
-        data = response.json()
-        _token_cache["token"] = data["access_token"]
-        _token_cache["expires_at"] = time.time() + data["expires_in"] - 60
-        return _token_cache["token"]
-    except Exception as e:
-        print(f"FatSecret Auth Exception: {e}")
-        return None
-
-
-def fatsecret_request(method: str, params: dict):
-    """Make a request to FatSecret API."""
-    token = get_fatsecret_token()
-    if not token:
-        return {"error": "Authentication failed"}
-
-    headers = {"Authorization": f"Bearer {token}"}
-    final_params = {"method": method, "format": "json"}
-    final_params.update(params)
-
-    # Remove empty params
-    final_params = {k: v for k, v in final_params.items() if v is not None and v != ""}
-
-    print(f"📡 FatSecret API Request:")
-    print(f"   - URL: {FATSECRET_BASE_URL}")
-    print(f"   - Method: {method}")
-    print(f"   - Params: {final_params}")
-
-    try:
-        res = requests.get(FATSECRET_BASE_URL, headers=headers, params=final_params)
-        print(f"   - Response Status: {res.status_code}")
-        print(f"   - Response URL: {res.url}")
-        if res.status_code != 200:
-            return {"error": f"API Error {res.status_code}", "details": res.text}
-        return res.json()
-    except Exception as e:
-        return {"error": str(e)}
+os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 
 class BarcodeRequest(BaseModel):
@@ -89,6 +34,11 @@ class BarcodeRequest(BaseModel):
     region: str = "US"
 
 
+class BarcodeBatchRequest(BaseModel):
+    barcodes: List[str] = Field(..., min_length=1, max_length=BARCODE_BATCH_MAX)
+    region: str = "US"
+
+
 class SearchRequest(BaseModel):
     query: str
     max_results: int = 20
@@ -97,197 +47,146 @@ class SearchRequest(BaseModel):
 @router.post("/search")
 async def search_food(request: SearchRequest):
     """Search for food items using FatSecret API."""
-    return JSONResponse(content=fatsecret_request(
-        "foods.search",
-        {
-            "search_expression": request.query,
-            "max_results": request.max_results
-        }
+    return JSONResponse(content=await get_fatsecret_cache().get_or_fetch(
+        "search",
+        search_key(request.query, request.max_results),
+        lambda: get_fatsecret_client().request(
+            "foods.search",
+            {
+                "search_expression": request.query,
+                "max_results": request.max_results
+            }
+        )
     ))
 
 
+async def fatsecret_barcode_lookup(gtin: str, region: str, trace: RequestTrace) -> dict:
+    """FatSecret `food.find_id_for_barcode.v2` through the response cache."""
+    fatsecret = get_fatsecret_client()
+    return await get_fatsecret_cache().get_or_fetch(
+        "barcode",
+        barcode_key(gtin, region),
+        lambda: fatsecret.request(
+            "food.find_id_for_barcode.v2",
+            {
+                "barcode": gtin,
+                "region": region
+            },
+            trace=trace
+        )
+    )
+
+
 @router.post("/barcode")
 async def lookup_barcode(request: BarcodeRequest):
     """
     Look up food by barcode using FatSecret API.
     
     FatSecret requires GTIN-13 format (13-digit barcode).
-    Supports: UPC-A (12), EAN-13 (13), EAN-8 (8), UPC-E (6/8).
-    All barcodes are converted to GTIN-13 for API compatibility.
+    Supports: UPC-A (12), EAN-13 (13), EAN-8 (8), UPC-E (6/7/8), GTIN-14 (leading 0).
+    All barcodes are validated and converted to GTIN-13 for API compatibility.
     """
-    print("=" * 80)
-    print("🔍 BARCODE LOOKUP REQUEST RECEIVED")
-    print("=" * 80)
+    trace = RequestTrace("barcode")
     
-    code = request.barcode.strip()
-    print(f"📊 Step 1: Received barcode")
-    print(f"   - Original barcode: {request.barcode!r}")
-    print(f"   - Trimmed barcode: {code!r}")
-    print(f"   - Length: {len(code)} characters")
-    print(f"   - Region: {request.region}")
-    print(f"   - Is numeric: {code.isdigit()}")
-
-    # Convert various barcode formats to GTIN-13
-    original_code = code
-    conversion_applied = False
-    
-    if not code.isdigit():
-        print(f"\n⚠️  Step 2: Barcode validation")
-        print(f"   - Error: Barcode must contain only digits")
-        print(f"   - Received: {code!r}")
-        print("=" * 80)
-        print()
+    try:
+        gtin = to_gtin13(request.barcode)
+    except InvalidBarcode as e:
+        trace.finish(status="invalid_barcode")
         return JSONResponse(content={
             "error": "Invalid barcode format",
-            "message": "Barcode must contain only numeric digits"
+            "message": str(e)
         })
     
-    print(f"\n📐 Step 2: Barcode format conversion to GTIN-13")
+    with trace.stage("lookup"):
+        result = await fatsecret_barcode_lookup(gtin, request.region, trace)
+    trace.dump("fatsecret_response", result)
     
-    if len(code) == 13:
-        # EAN-13 / GTIN-13 (already correct format)
-        print(f"   - Format detected: EAN-13 / GTIN-13")
-        print(f"   - Already in correct format: {code!r}")
-        print(f"   - No conversion needed")
-    elif len(code) == 12:
-        # UPC-A → GTIN-13 (add leading zero)
-        code = "0" + code
-        conversion_applied = True
-        print(f"   - Format detected: UPC-A (12 digits)")
-        print(f"   - Conversion rule: Add '0' at front → GTIN-13")
-        print(f"   - Original: {original_code!r}")
-        print(f"   - Converted: {code!r}")
-    elif len(code) == 8:
-        # EAN-8 → GTIN-13 (pad with 5 leading zeros)
-        code = "00000" + code
-        conversion_applied = True
-        print(f"   - Format detected: EAN-8 (8 digits)")
-        print(f"   - Conversion rule: Add '00000' at front → GTIN-13")
-        print(f"   - Original: {original_code!r}")
-        print(f"   - Converted: {code!r}")
-    elif len(code) == 6:
-        # UPC-E → UPC-A → GTIN-13
-        # Note: Full UPC-E expansion is complex; this is a simplified version
-        print(f"   - Format detected: UPC-E (6 digits)")
-        print(f"   - Warning: UPC-E conversion requires manufacturer code expansion")
-        print(f"   - Attempting simple padding (may not work for all codes)")
-        code = "0" + code + "00000"  # Simplified; real UPC-E needs proper expansion
-        conversion_applied = True
-        print(f"   - Original: {original_code!r}")
-        print(f"   - Converted: {code!r} (experimental)")
-    elif len(code) > 13:
-        # Handle 14+ digit barcodes (strip leading zeros to get to 13 or 12 digits)
-        print(f"   - Format detected: {len(code)}-digit code (longer than standard)")
-        print(f"   - Strategy: Strip leading zeros to reach EAN-13 (13) or UPC-A (12)")
-        
-        # Try to strip leading zeros to get to 13 digits
-        stripped_code = code.lstrip('0')
-        if len(stripped_code) <= 13:
-            # Pad back to exactly 13 digits if needed
-            code = stripped_code.zfill(13)
-            conversion_applied = True
-            print(f"   - Stripped leading zeros")
-            print(f"   - Original: {original_code!r}")
-            print(f"   - Converted to EAN-13: {code!r}")
-        else:
-            # If still longer than 13, try to take rightmost 13 digits
-            code = code[-13:]
-            conversion_applied = True
-            print(f"   - Taking rightmost 13 digits")
-            print(f"   - Original: {original_code!r}")
-            print(f"   - Converted: {code!r}")
-    else:
-        print(f"   - Format: Unknown ({len(code)} digits)")
-        print(f"   - Supported formats: UPC-A(12), EAN-13(13), EAN-8(8), UPC-E(6)")
-        print(f"   - Will attempt lookup with original barcode")
-
-    print(f"\n🌐 Step 3: Calling FatSecret API")
-    print(f"   - API Endpoint: {FATSECRET_BASE_URL}")
-    print(f"   - Method: food.find_id_for_barcode.v2")
-    print(f"   - Barcode (GTIN-13): {code}")
-    print(f"   - Region: {request.region}")
-    print(f"   - Conversion applied: {conversion_applied}")
-    
-    result = fatsecret_request(
-        "food.find_id_for_barcode.v2",
-        {
-            "barcode": code,
-            "region": request.region
-        }
+    error = result.get("error") if isinstance(result, dict) else None
+    trace.finish(
+        barcode=gtin,
+        region=request.region,
+        converted=gtin != request.barcode.strip(),
+        status="error" if error else "ok",
+        # 211: no food item found for this barcode (FatSecret data is region-specific)
+        error_code=error.get("code") if isinstance(error, dict) else None,
     )
+    return JSONResponse(content=result)
 
-    print(f"\n✅ Step 4: FatSecret API Response")
-    print(f"\n📄 FULL RAW RESPONSE DATA:")
-    print("=" * 80)
-    try:
-        # Pretty print the full JSON response
-        print(json.dumps(result, indent=2, ensure_ascii=False))
-    except Exception as e:
-        # Fallback to regular print if JSON formatting fails
-        print(f"   (JSON formatting failed: {e})")
-        print(f"   Raw data: {result}")
-    print("=" * 80)
+
+async def lookup_local_products(gtins: List[str]) -> Dict[str, Tuple[str, dict]]:
+    """Find GTINs in `food_products` and `global_foods` (two `$in` queries, run concurrently)."""
+    variants = {variant: gtin for gtin in gtins for variant in lookup_variants(gtin)}
+    products, foods = await asyncio.gather(
+        get_db().food_products.find({"barcode": {"$in": list(variants)}}).to_list(length=None),
+        get_catalog_db().global_foods.find(
+            {"external_source_id": {"$in": [f"fatsecret:{v}" for v in variants]}},
+            {"embedding_vector": 0}
+        ).to_list(length=None),
+    )
+    found = {}
+    for doc in products:
+        found.setdefault(variants[doc["barcode"]], ("food_products", doc))
+    for doc in foods:
+        found.setdefault(variants[doc["external_source_id"].split(":", 1)[1]], ("global_foods", doc))
+    return found
+
+
+@router.post("/barcode/batch")
+async def lookup_barcode_batch(request: BarcodeBatchRequest):
+    """
+    Look up a batch of barcodes (e.g. a whole pantry shelf) in one call.
     
-    # Check for various error formats
-    is_error = False
-    if isinstance(result, dict):
-        # Check for direct error key
-        if "error" in result:
-            is_error = True
-            error_info = result["error"]
-            print(f"\n   - Status: ❌ ERROR")
-            
-            if isinstance(error_info, dict):
-                print(f"   - Error Code: {error_info.get('code', 'N/A')}")
-                print(f"   - Error Message: {error_info.get('message', 'N/A')}")
-            else:
-                print(f"   - Error: {error_info}")
-            
-            if "details" in result:
-                print(f"   - Details: {result.get('details')}")
-            
-            # Provide helpful context for common errors
-            if isinstance(error_info, dict) and error_info.get('code') == 211:
-                print(f"\n   💡 Troubleshooting:")
-                print(f"      - Error 211: No food item found for this barcode")
-                print(f"      - This barcode may not exist in the FatSecret database")
-                print(f"      - Verify the barcode is correct and matches the region")
-                print(f"      - FatSecret database is country-specific (region: {request.region})")
-        # Check if response itself is successful
-        elif "food_id" in result or "food" in result:
-            print(f"\n   - Status: ✅ SUCCESS")
-            if "food_id" in result:
-                food_id = result.get("food_id", {})
-                if isinstance(food_id, dict):
-                    print(f"   - Food ID: {food_id.get('value', 'N/A')}")
-                else:
-                    print(f"   - Food ID: {food_id}")
-            
-            if "food" in result:
-                food = result.get("food", {})
-                print(f"   - Food Name: {food.get('food_name', 'N/A')}")
-                print(f"   - Brand: {food.get('brand_name', 'N/A')}")
-                
-                # Show serving info if available
-                servings = food.get("servings", {})
-                if servings and "serving" in servings:
-                    serving = servings["serving"]
-                    if isinstance(serving, list) and len(serving) > 0:
-                        serving = serving[0]
-                    if isinstance(serving, dict):
-                        print(f"   - Serving: {serving.get('serving_description', 'N/A')}")
-                        print(f"   - Calories: {serving.get('calories', 'N/A')} kcal")
+    Codes are validated and normalized to GTIN-13 and deduplicated. Each distinct code is
+    resolved from the local food_products / global_foods collections first; only misses go to
+    FatSecret, concurrently. Results are returned in request order, one per input code.
+    """
+    trace = RequestTrace("barcode_batch")
+    
+    with trace.stage("normalize"):
+        normalized = {}
+        for code in request.barcodes:
+            try:
+                normalized[code] = to_gtin13(code)
+            except InvalidBarcode as e:
+                normalized[code] = e
+        gtins = list(dict.fromkeys(g for g in normalized.values() if isinstance(g, str)))
+    
+    with trace.stage("local"):
+        local = await lookup_local_products(gtins) if gtins else {}
+    
+    misses = [g for g in gtins if g not in local]
+    semaphore = asyncio.Semaphore(BARCODE_BATCH_CONCURRENCY)
+    
+    async def remote(gtin):
+        async with semaphore:
+            return await fatsecret_barcode_lookup(gtin, request.region, trace)
+    
+    with trace.stage("fatsecret"):
+        remote_results = dict(zip(misses, await asyncio.gather(*(remote(g) for g in misses))))
+    
+    results = []
+    for code in request.barcodes:
+        gtin = normalized[code]
+        if isinstance(gtin, InvalidBarcode):
+            results.append({"barcode": code, "gtin": None, "status": "invalid", "message": str(gtin)})
+        elif gtin in local:
+            source, doc = local[gtin]
+            results.append({"barcode": code, "gtin": gtin, "status": "found", "source": source, "product": doc})
         else:
-            print(f"\n   - Status: UNKNOWN")
-            print(f"   - Response keys: {list(result.keys())}")
-    else:
-        print(f"\n   - Status: UNEXPECTED RESPONSE TYPE")
-        print(f"   - Response type: {type(result)}")
+            result = remote_results[gtin]
+            error = result.get("error") if isinstance(result, dict) else None
+            if error is None:
+                results.append({"barcode": code, "gtin": gtin, "status": "found", "source": "fatsecret", "product": result})
+            elif is_not_found(result):
+                results.append({"barcode": code, "gtin": gtin, "status": "not_found"})
+            else:
+                results.append({"barcode": code, "gtin": gtin, "status": "error", "error": error})
     
-    print("=" * 80)
-    print()
-
-    return JSONResponse(content=result)
+    trace.finish(codes=len(request.barcodes), unique=len(gtins), local_hits=len(local), fatsecret_lookups=len(misses))
+    return JSONResponse(content=jsonable_encoder({
+        "region": request.region,
+        "results": results,
+    }, custom_encoder={ObjectId: str}))
 
 
 @router.post("/recognize")
@@ -295,47 +194,40 @@ async def recognize_image(file: UploadFile = File(...)):
     """
     Recognize food in an uploaded image using FatSecret Image Recognition API.
     """
-    token = get_fatsecret_token()
+    trace = RequestTrace("recognize")
+    fatsecret = get_fatsecret_client()
+    token = await fatsecret.get_token()
     if not token:
         raise HTTPException(status_code=401, detail="Authentication failed")
 
     try:
-        # Read and process image
-        img = Image.open(file.file)
-        if img.mode in ("RGBA", "P"):
-            img = img.convert("RGB")
-        img.thumbnail((512, 512))
-
-        # Convert to base64
-        buffer = io.BytesIO()
-        img.save(buffer, format="JPEG", quality=85)
-        buffer.seek(0)
-        image_data = buffer.read()
-        base64_encoded = base64.b64encode(image_data).decode('utf-8')
+        # Read the upload in bounded chunks, then decode it once
+        with trace.stage("read"):
+            upload = await read_upload(file, max_bytes=MAX_IMAGE_BYTES)
+        # Decode at reduced scale and encode off the event loop (small JPEGs are sent as-is)
+        prepared = await asyncio.to_thread(prepare_for_recognition, upload.data, trace)
 
         # Call FatSecret recognition API
-        payload = {
-            "image_b64": base64_encoded,
-            "include_food_data": True,
-            "region": "US",
-            "language": "en"
-        }
-
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-
-        res = requests.post(FATSECRET_RECOGNITION_URL, headers=headers, json=payload)
+        with trace.stage("upstream"):
+            res = await fatsecret.recognize(prepared.b64, region="US", language="en")
 
         if res.status_code != 200:
+            trace.finish(status="upstream_error", upstream_status=res.status_code)
             raise HTTPException(
                 status_code=res.status_code,
                 detail=f"FatSecret API error: {res.text}"
             )
 
-        return JSONResponse(content=res.json())
-
+        with trace.stage("parse"):
+            recognition_result = res.json()
+        trace.dump("recognition_response", recognition_result)
+        trace.finish(status="ok", size=upload.size, passthrough=prepared.passthrough)
+        return JSONResponse(content=recognition_result)
+
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Image file too large. Maximum size is 10MB")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -346,164 +238,86 @@ async def upload_vision(file: UploadFile = File(...)):
     Upload an image and recognize food using FatSecret.
     Saves file locally and returns recognition results.
     """
-    print("=" * 80)
-    print("🖼️  IMAGE RECOGNITION REQUEST")
-    print("=" * 80)
+    trace = RequestTrace("upload")
     
     try:
-        # Save uploaded file
-        out_path = os.path.join(UPLOAD_DIR, file.filename)
-        print(f"📁 Step 1: Saving uploaded file")
-        print(f"   - Filename: {file.filename}")
-        print(f"   - Save path: {out_path}")
-        
-        with open(out_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        print(f"   - File size: {len(content)} bytes")
-        print(f"   ✅ File saved successfully")
-
-        # Reset file pointer and recognize
-        await file.seek(0)
-        token = get_fatsecret_token()
+        # Stream the upload to disk in chunks (hashing as we go) instead of buffering it
+        with trace.stage("save"):
+            upload = await save_upload(file, UPLOAD_DIR, max_bytes=MAX_IMAGE_BYTES)
+        out_path = upload.path
+
+        fatsecret = get_fatsecret_client()
+        token = await fatsecret.get_token()
         if not token:
-            print(f"\n❌ Step 2: Authentication failed")
-            print(f"   - No valid FatSecret token available")
-            print("=" * 80)
+            trace.finish(status="auth_failed", file=out_path)
             return JSONResponse(
                 content={"status": "saved", "file": out_path, "recognition": None}
             )
 
-        print(f"\n🔐 Step 2: Authentication successful")
-        print(f"   - Token obtained")
-
-        # Process image for recognition
-        print(f"\n🎨 Step 3: Processing image")
-        img = Image.open(io.BytesIO(content))
-        print(f"   - Original size: {img.size}")
-        print(f"   - Original mode: {img.mode}")
-        
-        if img.mode in ("RGBA", "P"):
-            img = img.convert("RGB")
-            print(f"   - Converted to RGB mode")
-        
-        img.thumbnail((512, 512))
-        print(f"   - Resized to: {img.size}")
-
-        buffer = io.BytesIO()
-        img.save(buffer, format="JPEG", quality=85)
-        buffer.seek(0)
-        image_data = buffer.read()
-        base64_encoded = base64.b64encode(image_data).decode('utf-8')
-        
-        print(f"   - Base64 encoded length: {len(base64_encoded)} chars")
-
-        payload = {
-            "image_b64": base64_encoded,
-            "include_food_data": True,
-            "region": "US",
-            "language": "en"
-        }
-
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-
-        print(f"\n🌐 Step 4: Calling FatSecret Image Recognition API")
-        print(f"   - URL: {FATSECRET_RECOGNITION_URL}")
-        print(f"   - Region: US")
-        print(f"   - Language: en")
-        print(f"   - Include food data: True")
-
-        res = requests.post(FATSECRET_RECOGNITION_URL, headers=headers, json=payload)
-
-        print(f"\n📡 Step 5: FatSecret API Response")
-        print(f"   - Status code: {res.status_code}")
-        print(f"   - Response size: {len(res.content)} bytes")
+        # Process image for recognition straight from the saved file, off the event loop
+        prepared = await asyncio.to_thread(prepare_for_recognition, out_path, trace)
+
+        with trace.stage("upstream"):
+            res = await fatsecret.recognize(prepared.b64, region="US", language="en")
 
         if res.status_code != 200:
-            print(f"   ❌ Error response:")
-            print(f"   - {res.text}")
+            logger.warning("FatSecret recognition error %s: %s", res.status_code, res.text)
             recognition_result = None
         else:
-            recognition_result = res.json()
-            print(f"\n📄 FULL RECOGNITION RESPONSE:")
-            print("=" * 80)
-            try:
-                print(json.dumps(recognition_result, indent=2, ensure_ascii=False))
-            except Exception as e:
-                print(f"   (JSON formatting failed: {e})")
-                print(f"   Raw: {recognition_result}")
-            print("=" * 80)
-            
-            # Analyze the response structure
-            print(f"\n🔍 Response Analysis:")
-            if isinstance(recognition_result, dict):
-                print(f"   - Response is a dictionary")
-                print(f"   - Keys: {list(recognition_result.keys())}")
-                
-                if "foods" in recognition_result:
-                    foods = recognition_result["foods"]
-                    print(f"   - 'foods' key found")
-                    print(f"   - Type: {type(foods)}")
-                    if isinstance(foods, list):
-                        print(f"   - Number of foods: {len(foods)}")
-                        if len(foods) > 0:
-                            print(f"   - First food keys: {list(foods[0].keys()) if isinstance(foods[0], dict) else 'Not a dict'}")
-                    else:
-                        print(f"   - 'foods' is not a list!")
-                else:
-                    print(f"   - No 'foods' key in response")
-                
-                if "error" in recognition_result:
-                    print(f"   - ⚠️ Error in response: {recognition_result['error']}")
-            else:
-                print(f"   - Response is not a dictionary: {type(recognition_result)}")
-
-        final_response = {
+            with trace.stage("parse"):
+                recognition_result = res.json()
+            trace.dump("recognition_response", recognition_result)
+
+        foods = recognition_result.get("foods") if isinstance(recognition_result, dict) else None
+        trace.finish(
+            status="processed",
+            file=out_path,
+            size=upload.size,
+            passthrough=prepared.passthrough,
+            upstream_status=res.status_code,
+            foods=len(foods) if isinstance(foods, list) else None,
+        )
+        return JSONResponse(content={
             "status": "processed",
             "file": out_path,
             "recognition": recognition_result
-        }
-        
-        print(f"\n✅ Step 6: Returning response to Flutter client")
-        print(f"   - Status: {final_response['status']}")
-        print(f"   - Recognition data: {'Present' if recognition_result else 'None'}")
-        print("=" * 80)
-        print()
-
-        return JSONResponse(content=final_response)
+        })
 
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Image file too large. Maximum size is 10MB")
     except Exception as e:
-        print(f"\n❌ EXCEPTION OCCURRED:")
-        print(f"   - Error: {str(e)}")
-        print(f"   - Type: {type(e).__name__}")
-        import traceback
-        print(f"\n📋 Full traceback:")
-        traceback.print_exc()
-        print("=" * 80)
-        print()
+        logger.exception("Image recognition failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/autocomplete")
 async def autocomplete(q: str):
-    """Autocomplete food names using FatSecret API."""
-    return JSONResponse(content=fatsecret_request(
-        "foods.autocomplete.v2",
-        {"expression": q}
+    """Autocomplete food names from the local food index, falling back to FatSecret API."""
+    food_index = get_food_index()
+    if food_index is not None:
+        local = food_index.search(q, limit=AUTOCOMPLETE_LIMIT)
+        if local:
+            # Same shape as foods.autocomplete.v2 so the app handles both alike
+            names = list(dict.fromkeys(food.name for food in local))
+            return JSONResponse(content={"suggestions": {"suggestion": names}})
+    return JSONResponse(content=await get_fatsecret_cache().get_or_fetch(
+        "autocomplete",
+        autocomplete_key(q),
+        lambda: get_fatsecret_client().request(
+            "foods.autocomplete.v2",
+            {"expression": q}
+        )
     ))
 
 
 @router.get("/health")
-def vision_health():
+async def vision_health():
     """Check FatSecret API connectivity and configuration."""
-    token = get_fatsecret_token()
+    fatsecret = get_fatsecret_client()
+    token = await fatsecret.get_token()
     return {
         "ok": token is not None,
-        "fatsecret_configured": bool(FATSECRET_CLIENT_ID and FATSECRET_CLIENT_SECRET),
+        "fatsecret_configured": fatsecret.configured,
         "token_valid": token is not None,
     }
 
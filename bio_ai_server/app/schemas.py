@@ -1,5 +1,5 @@
-from typing import List, Optional, Dict, Any, Literal
-from pydantic import BaseModel, EmailStr
+from typing import Annotated, List, Optional, Dict, Any, Literal, Union
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
 
 
@@ -7,6 +7,12 @@ from datetime import datetime
 # Profile & User Management Schemas
 # ============================================================================
 
+class FastingWindow(BaseModel):
+    """Daily fasting window, HH:MM (UTC); it may wrap past midnight ("20:00" to "12:00")"""
+    start: str = Field(..., pattern=r"^([01]\d|2[0-3]):[0-5]\d$")
+    end: str = Field(..., pattern=r"^([01]\d|2[0-3]):[0-5]\d$")
+
+
 class ProfileInfo(BaseModel):
     """User profile information"""
     user_id: str
@@ -14,12 +20,14 @@ class ProfileInfo(BaseModel):
     email: EmailStr
     created_at: datetime
     profile_image_url: Optional[str] = None
+    fasting_window: Optional[FastingWindow] = None
 
 
 class ProfileUpdate(BaseModel):
-    """Update user profile"""
+    """Update user profile (`fasting_window: null` removes the window)"""
     name: Optional[str] = None
     profile_image_url: Optional[str] = None
+    fasting_window: Optional[FastingWindow] = None
 
 
 class DietaryProfile(BaseModel):
@@ -133,6 +141,34 @@ class DashboardState(BaseModel):
     ai_card: Optional[dict]
 
 
+SensorType = Literal["HR", "Steps", "Sleep", "Mood"]
+
+
+class SyncPoint(BaseModel):
+    """One device sample of a /sync/batch body (`points` array)"""
+    timestamp: datetime
+    sensor_type: SensorType
+    measurements: Dict[str, float] = Field(..., min_length=1)
+    # Defaults to the batch's top-level device_source
+    device_source: Optional[str] = None
+
+
+class SyncBatchStatus(BaseModel):
+    """Progress of a /sync/batch upload (poll GET /sync/batch/{batch_id})"""
+    batch_id: str
+    # receiving -> queued -> done; failed when the body was invalid part-way (chunks queued before still
+    # apply) or bio_worker could not insert a chunk (failed_chunks)
+    status: Literal["receiving", "queued", "done", "failed"]
+    points: int = 0
+    rejected: int = 0
+    chunks: int = 0
+    processed_chunks: int = 0
+    processed_points: int = 0
+    failed_chunks: int = 0
+    errors: List[str] = []
+    received_at: Optional[datetime] = None
+
+
 class Recommendation(BaseModel):
     meal_name: str
     ingredients_used: List[str]
@@ -254,6 +290,16 @@ class AxisData(BaseModel):
     data: List[DataPoint]
 
 
+class LaggedCorrelation(BaseModel):
+    """Correlation of the left metric on day t with the right metric on day t + lag_days"""
+    lag_days: int
+    pearson: Optional[float] = None
+    spearman: Optional[float] = None
+    p_value: Optional[float] = None
+    spearman_p_value: Optional[float] = None
+    sample_size: int = 0
+
+
 class CorrelationData(BaseModel):
     """Correlation analysis response"""
     period: PeriodType
@@ -262,6 +308,11 @@ class CorrelationData(BaseModel):
     left_axis: AxisData
     right_axis: AxisData
     correlation_coefficient: Optional[float] = None
+    spearman_coefficient: Optional[float] = None
+    p_value: Optional[float] = None
+    sample_size: Optional[int] = None
+    lag_days: int = 0
+    lagged: Optional[List[LaggedCorrelation]] = None
     insights: Optional[List[str]] = None
 
 
@@ -288,6 +339,8 @@ class EntryList(BaseModel):
     date: str
     total_count: int
     entries: List[Entry]
+    # Pass as `cursor` to get the next page; None on the last page
+    next_cursor: Optional[str] = None
 
 
 class EntryCreate(BaseModel):
@@ -310,6 +363,51 @@ class EntryUpdate(BaseModel):
     metadata: Optional[Dict[str, Any]] = None
 
 
+class BulkEntryCreate(BaseModel):
+    """Create an entry; `client_ref` (e.g. the client's local id) is echoed in the result"""
+    op: Literal["create"]
+    entry: EntryCreate
+    client_ref: Optional[str] = None
+
+
+class BulkEntryUpdate(BaseModel):
+    """Update an entry (partial)"""
+    op: Literal["update"]
+    id: str
+    changes: EntryUpdate
+
+
+class BulkEntryDelete(BaseModel):
+    """Delete an entry (soft delete)"""
+    op: Literal["delete"]
+    id: str
+
+
+BulkEntryOperation = Annotated[Union[BulkEntryCreate, BulkEntryUpdate, BulkEntryDelete], Field(discriminator="op")]
+
+
+class BulkEntryRequest(BaseModel):
+    """Mixed entry operations, applied in no particular order"""
+    operations: List[BulkEntryOperation] = Field(..., min_length=1, max_length=500)
+
+
+class BulkEntryResult(BaseModel):
+    """Outcome of one operation (results are in request order)"""
+    index: int
+    op: Literal["create", "update", "delete"]
+    status: Literal["created", "updated", "deleted", "invalid", "not_found", "conflict", "failed"]
+    id: Optional[str] = None
+    client_ref: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkEntryResponse(BaseModel):
+    """Per-operation results of a bulk entry request"""
+    results: List[BulkEntryResult]
+    succeeded: int
+    failed: int
+
+
 # Metric History Schemas
 class MetricDataPoint(BaseModel):
     """Data point with goal tracking"""
@@ -473,8 +571,12 @@ class AnalysisHistoryItem(BaseModel):
 
 class AnalysisHistoryResponse(BaseModel):
     """Analysis history list"""
-    total_count: int
+    total_count: Optional[int] = None
+    # True when total_count is a lower bound (count=estimate)
+    total_count_estimated: bool = False
     analyses: List[AnalysisHistoryItem]
+    # Pass as `cursor` to get the next page; None on the last page
+    next_cursor: Optional[str] = None
 
 
 # Food Search Schemas
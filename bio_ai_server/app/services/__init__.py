@@ -0,0 +1 @@
+"""Shared services used by the bio_ai_server routers"""
@@ -0,0 +1,150 @@
+"""Dedup cache for image analyses.
+
+Re-uploads of the same photo (mobile retries, users re-scanning a plate) return the existing
+analysis instead of running the pipeline again. Two fingerprints are used:
+
+- SHA-256 of the upload bytes, for byte-identical files;
+- a 64-bit difference hash (dHash) of the picture, for near-identical ones (re-encoded, resized,
+  slightly recompressed). Two images match when their hashes differ in at most
+  `PHASH_MAX_DISTANCE` bits.
+
+Lookups go to an in-process LRU with TTL first, then to `food_analyses` in Mongo. For the Mongo
+tier the dHash is also stored split into `PHASH_MAX_DISTANCE + 1` bands: by the pigeonhole principle
+any hash within the distance shares at least one band exactly, so an indexed `$in` on the bands
+finds every candidate.
+"""
+import asyncio
+import io
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from PIL import Image
+from prometheus_client import Counter
+
+from app.services.cache import TTLCache
+
+PHASH_MAX_DISTANCE = 5
+PHASH_BANDS = PHASH_MAX_DISTANCE + 1
+MEMORY_TTL_S = 3600
+MEMORY_MAXSIZE = 512
+# Only analyses this recent are reused from Mongo
+MONGO_LOOKBACK = timedelta(days=1)
+
+ANALYSIS_CACHE_LOOKUPS = Counter(
+    "bio_ai_analysis_cache_lookups_total",
+    "Image analysis dedup lookups by outcome (hit rate = hits / all)",
+    ["result"],
+)
+
+
+@dataclass
+class ImageFingerprint:
+    sha256: str
+    phash: Optional[int]
+
+    @property
+    def phash_hex(self) -> Optional[str]:
+        return None if self.phash is None else f"{self.phash:016x}"
+
+    @property
+    def phash_bands(self) -> List[str]:
+        if self.phash is None:
+            return []
+        bounds = [i * 64 // PHASH_BANDS for i in range(PHASH_BANDS + 1)]
+        return [
+            f"{i}:{(self.phash >> lo) & ((1 << (hi - lo)) - 1):x}"
+            for i, (lo, hi) in enumerate(zip(bounds, bounds[1:]))
+        ]
+
+
+def perceptual_hash(data) -> Optional[int]:
+    """64-bit dHash of an encoded image, or None if it cannot be decoded."""
+    try:
+        img = Image.open(io.BytesIO(data))
+        # JPEG: let the decoder downscale (DCT scaling) instead of decoding full resolution
+        img.draft("L", (64, 64))
+        img = img.convert("L").resize((9, 8), Image.Resampling.BILINEAR)
+    except Exception:
+        return None
+    pixels = img.tobytes()
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for col in range(8):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class AnalysisCache:
+    def __init__(self, maxsize: int = MEMORY_MAXSIZE, ttl: float = MEMORY_TTL_S):
+        # (user_id, sha256) -> (phash, analysis document)
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def fingerprint(self, sha256: str, data) -> ImageFingerprint:
+        phash = await asyncio.to_thread(perceptual_hash, data)
+        return ImageFingerprint(sha256=sha256, phash=phash)
+
+    def _memory_lookup(self, user_id: str, fp: ImageFingerprint) -> Optional[dict]:
+        hit = self._memory.get((user_id, fp.sha256))
+        if hit is not None:
+            return hit[1]
+        if fp.phash is None:
+            return None
+        for (uid, _), (phash, doc) in self._memory.items():
+            if uid == user_id and phash is not None and hamming(phash, fp.phash) <= PHASH_MAX_DISTANCE:
+                return doc
+        return None
+
+    async def _mongo_lookup(self, db, user_id: str, fp: ImageFingerprint) -> Optional[dict]:
+        since = datetime.utcnow() - MONGO_LOOKBACK
+        doc = await db.food_analyses.find_one({"user_id": user_id, "image_sha256": fp.sha256, "uploaded_at": {"$gte": since}})
+        if doc is not None or fp.phash is None:
+            return doc
+        cursor = db.food_analyses.find(
+            {"user_id": user_id, "image_phash_bands": {"$in": fp.phash_bands}, "uploaded_at": {"$gte": since}}
+        ).sort("uploaded_at", -1).limit(20)
+        async for candidate in cursor:
+            if hamming(int(candidate["image_phash"], 16), fp.phash) <= PHASH_MAX_DISTANCE:
+                return candidate
+        return None
+
+    async def lookup(self, db, user_id: str, fp: ImageFingerprint) -> Optional[dict]:
+        """Return a previous analysis document for this (or a near-identical) image, if any."""
+        doc = self._memory_lookup(user_id, fp)
+        if doc is not None:
+            ANALYSIS_CACHE_LOOKUPS.labels("memory_hit").inc()
+            return doc
+        doc = await self._mongo_lookup(db, user_id, fp)
+        if doc is not None:
+            ANALYSIS_CACHE_LOOKUPS.labels("mongo_hit").inc()
+            self.remember(user_id, fp, doc)
+            return doc
+        ANALYSIS_CACHE_LOOKUPS.labels("miss").inc()
+        return None
+
+    def remember(self, user_id: str, fp: ImageFingerprint, doc: dict) -> None:
+        self._memory.set((user_id, fp.sha256), (fp.phash, doc))
+
+    @staticmethod
+    def fingerprint_fields(fp: ImageFingerprint) -> dict:
+        """Fields stored on the `food_analyses` document so the Mongo tier can find it."""
+        return {
+            "image_sha256": fp.sha256,
+            "image_phash": fp.phash_hex,
+            "image_phash_bands": fp.phash_bands,
+        }
+
+
+_cache: Optional[AnalysisCache] = None
+
+
+def get_analysis_cache() -> AnalysisCache:
+    global _cache
+    if _cache is None:
+        _cache = AnalysisCache()
+    return _cache
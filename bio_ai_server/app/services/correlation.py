@@ -0,0 +1,194 @@
+"""Correlations between metric histories behind `/analytics/correlation`.
+
+For a (user, period, end date), every metric of `metric_rollups.METRICS` is loaded from the daily
+rollups in one read and laid out as an aligned `(metrics, days)` array (NaN where a metric has no
+value that day). Pearson and Spearman coefficients for all metric pairs are then computed at once
+with matrix products over the pairwise-complete days, for lags 0..`MAX_LAG` (lag k pairs the left
+metric on day t with the right metric on day t+k, e.g. carbs today vs sleep tomorrow).
+
+Spearman ranks each series over its own days; when two series have different gaps this is the
+usual pairwise approximation. Significance is the two-sided p-value of the Fisher z-transform.
+
+Matrices are cached in-process per (user, period, end date), so every pair of the same window is
+served from one computation. A cached matrix is only used while the user's latest `daily_totals`
+write is the one it was computed after, so new entries invalidate it in every process; device data
+relies on the TTL (`CORRELATION_CACHE_TTL_S`).
+"""
+import math
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from prometheus_client import Counter
+
+from app.config import CORRELATION_CACHE_SIZE, CORRELATION_CACHE_TTL_S
+from app.services import metric_rollups
+from app.services.cache import TTLCache
+
+MAX_LAG = 3
+# Fewer overlapping days than this give no coefficient
+MIN_SAMPLES = 5
+METRIC_NAMES: List[str] = list(metric_rollups.METRICS)
+METRIC_INDEX: Dict[str, int] = {name: i for i, name in enumerate(METRIC_NAMES)}
+
+CORRELATION_CACHE_LOOKUPS = Counter(
+    "bio_ai_correlation_cache_lookups_total", "Correlation matrix cache lookups by outcome", ["result"]
+)
+
+_erfc = np.vectorize(math.erfc, otypes=[float])
+
+
+def _center(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Zero-filled, per-series centered values and the 0/1 mask of observed days."""
+    mask = ~np.isnan(values)
+    counts = mask.sum(axis=1, keepdims=True)
+    filled = np.where(mask, values, 0.0)
+    means = np.divide(filled.sum(axis=1, keepdims=True), counts, out=np.zeros_like(counts, dtype=float), where=counts > 0)
+    return np.where(mask, filled - means, 0.0), mask.astype(float)
+
+
+def rank(values: np.ndarray) -> np.ndarray:
+    """Average ranks (1-based) of each row over its observed days; NaN stays NaN."""
+    ranks = np.full(values.shape, np.nan)
+    for i, row in enumerate(values):
+        observed = ~np.isnan(row)
+        if observed.any():
+            _, inverse, counts = np.unique(row[observed], return_inverse=True, return_counts=True)
+            # Tied values share the mean of the ranks they span
+            ranks[i, observed] = (np.cumsum(counts) - (counts - 1) / 2.0)[inverse]
+    return ranks
+
+
+def pairwise_pearson(left: np.ndarray, right: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pearson r between every row of `left` and every row of `right` (same number of days), over the
+    days both rows observe. Returns (r, n), each `(len(left), len(right))`; r is NaN below
+    `MIN_SAMPLES` days or for a constant series.
+    """
+    xl, ml = _center(left)
+    xr, mr = _center(right)
+    n = ml @ mr.T
+    sx, sy = xl @ mr.T, ml @ xr.T
+    sxx, syy = (xl * xl) @ mr.T, ml @ (xr * xr).T
+    sxy = xl @ xr.T
+    cov = n * sxy - sx * sy
+    var = (n * sxx - sx * sx) * (n * syy - sy * sy)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.clip(cov / np.sqrt(var), -1.0, 1.0)
+    r[(n < MIN_SAMPLES) | ~(var > 1e-12)] = np.nan
+    return r, n
+
+
+def p_values(r: np.ndarray, n: np.ndarray, spearman: bool = False) -> np.ndarray:
+    """Two-sided p-values for H0: no correlation (Fisher z; 1.06 variance factor for Spearman)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.arctanh(np.clip(r, -0.999999, 0.999999)) * np.sqrt((n - 3) / (1.06 if spearman else 1.0))
+        return np.where(np.isnan(r), np.nan, _erfc(np.nan_to_num(np.abs(z)) / math.sqrt(2)))
+
+
+@dataclass
+class CorrelationMatrix:
+    dates: List[str]
+    # (metrics, days), NaN where a metric has no value
+    values: np.ndarray
+    # (lags, metrics, metrics) each; [k, i, j] = left metric i on day t vs right metric j on day t+k
+    pearson: np.ndarray
+    spearman: np.ndarray
+    pearson_p: np.ndarray
+    spearman_p: np.ndarray
+    samples: np.ndarray
+    # Latest daily_totals write of the user when this was computed
+    version: Optional[datetime] = None
+
+    def series(self, metric: str) -> List[Tuple[str, float]]:
+        row = self.values[METRIC_INDEX[metric]]
+        return [(day, float(v)) for day, v in zip(self.dates, row) if not np.isnan(v)]
+
+    def pair(self, left: str, right: str, lag: int = 0) -> dict:
+        i, j = METRIC_INDEX[left], METRIC_INDEX[right]
+
+        def value(a):
+            v = a[lag, i, j]
+            return None if np.isnan(v) else float(v)
+
+        return {
+            "lag_days": lag,
+            "pearson": value(self.pearson),
+            "spearman": value(self.spearman),
+            "p_value": value(self.pearson_p),
+            "spearman_p_value": value(self.spearman_p),
+            "sample_size": int(self.samples[lag, i, j]),
+        }
+
+
+def compute(dates: List[str], values: np.ndarray, max_lag: int = MAX_LAG) -> CorrelationMatrix:
+    """All-pairs correlations of `values` (metrics x days) for lags 0..max_lag."""
+    ranks = rank(values)
+    days = values.shape[1]
+    out = {name: [] for name in ("pearson", "spearman", "pearson_p", "spearman_p", "samples")}
+    for lag in range(max_lag + 1):
+        if lag >= days:
+            nan = np.full((len(values), len(values)), np.nan)
+            for name in out:
+                out[name].append(np.zeros_like(nan) if name == "samples" else nan)
+            continue
+        end = days - lag
+        r, n = pairwise_pearson(values[:, :end], values[:, lag:])
+        rho, _ = pairwise_pearson(ranks[:, :end], ranks[:, lag:])
+        out["pearson"].append(r)
+        out["spearman"].append(rho)
+        out["pearson_p"].append(p_values(r, n))
+        out["spearman_p"].append(p_values(rho, n, spearman=True))
+        out["samples"].append(n)
+    return CorrelationMatrix(dates, values, **{name: np.stack(arrays) for name, arrays in out.items()})
+
+
+async def load_values(db, user_id: str, start: str, end: str) -> Tuple[List[str], np.ndarray]:
+    """Daily rollups of every metric between start and end as a (metrics, days) array."""
+    await metric_rollups.ensure_fresh(db, user_id, start, end)
+    first = date.fromisoformat(start)
+    days = (date.fromisoformat(end) - first).days + 1
+    dates = [(first + timedelta(days=i)).isoformat() for i in range(days)]
+    values = np.full((len(METRIC_NAMES), days), np.nan)
+    async for doc in db.metric_rollups_daily.find(
+        {"user_id": user_id, "date": {"$gte": start, "$lte": end}},
+        {"_id": 0, "metric": 1, "date": 1, "value": 1},
+    ):
+        i = METRIC_INDEX.get(doc["metric"])
+        if i is not None:
+            values[i, (date.fromisoformat(doc["date"]) - first).days] = doc["value"]
+    return dates, values
+
+
+async def data_version(db, user_id: str) -> Optional[datetime]:
+    doc = await db.daily_totals.find_one({"user_id": user_id}, {"updated_at": 1}, sort=[("updated_at", -1)])
+    return doc["updated_at"] if doc else None
+
+
+class CorrelationEngine:
+    def __init__(self, maxsize: int = CORRELATION_CACHE_SIZE, ttl: float = CORRELATION_CACHE_TTL_S):
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def matrix(self, db, user_id: str, period: str, start: str, end: str) -> CorrelationMatrix:
+        version = await data_version(db, user_id)
+        key = (user_id, period, end)
+        cached = self._memory.get(key)
+        if cached is not None and cached.version == version:
+            CORRELATION_CACHE_LOOKUPS.labels(result="hit").inc()
+            return cached
+        CORRELATION_CACHE_LOOKUPS.labels(result="stale" if cached is not None else "miss").inc()
+        matrix = compute(*await load_values(db, user_id, start, end))
+        matrix.version = version
+        self._memory.set(key, matrix)
+        return matrix
+
+
+_engine: Optional[CorrelationEngine] = None
+
+
+def get_correlation_engine() -> CorrelationEngine:
+    global _engine
+    if _engine is None:
+        _engine = CorrelationEngine()
+    return _engine
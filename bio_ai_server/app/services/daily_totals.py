@@ -0,0 +1,183 @@
+"""Incrementally maintained per-user, per-day totals of timeline entries (`daily_totals`).
+
+One document per (user, date), `_id = "<user_id>:<date>"`:
+
+    {user_id, date, count, value, protein, carbs, fat, fiber, sugar, sodium,
+     types: {MEAL: {count, value}, EXERCISE: {...}, ...}, updated_at}
+
+`value`, `count` and the nutrients are summed over all live entries of the day, like the aggregation
+`confirm_entry` used to run; `types` breaks `count`/`value` down per entry type.
+
+Every write to `analytics_entries` applies its contribution with a single atomic `$inc`, so reading
+a day's totals is one `_id` lookup however many entries it has. Bulk writes sum their entries'
+contributions per day and apply them with `apply_many()`, one `$inc` per affected day in a single
+round-trip.
+
+A day without a document (its first write, or a day logged before `daily_totals` existed) is
+backfilled instead: the `$inc` does not upsert, and on a miss the day is computed from
+`analytics_entries`, which already holds the write, and inserted. Reads backfill missing days the
+same way, so no migration is needed. The entry write and the `$inc` are separate operations; if the
+process dies between them, or a write races the backfill of its day, the day drifts until
+`rebuild()` recomputes it (`tools/rebuild_daily_totals.py`).
+"""
+from datetime import datetime
+from numbers import Number
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+NUTRIENT_FIELDS = ("protein", "carbs", "fat", "fiber", "sugar", "sodium")
+TOTAL_FIELDS = ("count", "value") + NUTRIENT_FIELDS
+
+
+def totals_id(user_id: str, date: str) -> str:
+    return f"{user_id}:{date}"
+
+
+def _number(value) -> float:
+    return float(value) if isinstance(value, Number) and not isinstance(value, bool) else 0.0
+
+
+def contribution(entry: dict, sign: int = 1) -> Dict[str, float]:
+    """`$inc` document adding (sign=1) or removing (sign=-1) one entry from its day."""
+    metadata = entry.get("metadata") or {}
+    value = _number(entry.get("value"))
+    delta = {"count": sign, "value": sign * value}
+    for field in NUTRIENT_FIELDS:
+        delta[field] = sign * _number(metadata.get(field))
+    delta[f"types.{entry['type']}.count"] = sign
+    delta[f"types.{entry['type']}.value"] = sign * value
+    return delta
+
+
+async def apply(db, user_id: str, date: str, delta: Dict[str, float]) -> dict:
+    """Atomically add `delta` to the day's totals and return the updated document."""
+    if not any(delta.values()):
+        return await get_totals(db, user_id, date)
+    totals = await db.daily_totals.find_one_and_update(
+        {"_id": totals_id(user_id, date)},
+        {"$inc": delta, "$set": {"updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if totals is None:
+        # The entry write is already in analytics_entries, so the backfill includes `delta`
+        totals = (await _backfill(db, user_id, [date]))[date]
+    return totals
+
+
+def add(delta: Dict[str, float], other: Dict[str, float]) -> Dict[str, float]:
+    """Sum `other` into `delta` (in place) and return it."""
+    for key, value in other.items():
+        delta[key] = delta.get(key, 0) + value
+    return delta
+
+
+async def apply_many(db, user_id: str, deltas: Dict[str, Dict[str, float]]) -> None:
+    """Apply the `delta` of every date in `deltas` with one unordered bulk write."""
+    now = datetime.utcnow()
+    dates = [date for date, delta in deltas.items() if any(delta.values())]
+    if not dates:
+        return
+    ops = [
+        UpdateOne({"_id": totals_id(user_id, date)}, {"$inc": deltas[date], "$set": {"updated_at": now}})
+        for date in dates
+    ]
+    result = await db.daily_totals.bulk_write(ops, ordered=False)
+    if result.matched_count < len(ops):
+        found = set(await db.daily_totals.distinct("date", {"_id": {"$in": [totals_id(user_id, date) for date in dates]}}))
+        await _backfill(db, user_id, [date for date in dates if date not in found])
+
+
+async def record_created(db, entry: dict) -> dict:
+    return await apply(db, entry["user_id"], entry["date"], contribution(entry))
+
+
+async def record_deleted(db, entry: dict) -> dict:
+    return await apply(db, entry["user_id"], entry["date"], contribution(entry, sign=-1))
+
+
+async def record_updated(db, before: dict, after: dict) -> dict:
+    """Apply an edit given the entry before and after it (as returned by find_one_and_update)."""
+    if (before["user_id"], before["date"]) != (after["user_id"], after["date"]):
+        await record_deleted(db, before)
+        return await record_created(db, after)
+    delta = add(contribution(after), contribution(before, sign=-1))
+    return await apply(db, after["user_id"], after["date"], delta)
+
+
+def empty_totals(user_id: str, date: str) -> dict:
+    return {"_id": totals_id(user_id, date), "user_id": user_id, "date": date, "types": {}, **{f: 0 for f in TOTAL_FIELDS}}
+
+
+async def get_totals(db, user_id: str, date: str) -> dict:
+    totals = await db.daily_totals.find_one({"_id": totals_id(user_id, date)})
+    if totals is None:
+        # Days without entries are not stored; backfilling them finds nothing to insert
+        totals = (await _backfill(db, user_id, [date], keep_empty=False))[date]
+    return totals
+
+
+async def _compute(db, match: dict) -> Dict[str, dict]:
+    """Totals of the live entries matching `match`, by `totals_id`."""
+    group = {"_id": {"user_id": "$user_id", "date": "$date", "type": "$type"}, "count": {"$sum": 1}, "value": {"$sum": "$value"}}
+    for field in NUTRIENT_FIELDS:
+        group[field] = {"$sum": f"$metadata.{field}"}
+
+    days: Dict[str, dict] = {}
+    async for row in db.analytics_entries.aggregate([{"$match": {"is_deleted": False, **match}}, {"$group": group}]):
+        key = row["_id"]
+        day = days.get(totals_id(key["user_id"], key["date"]))
+        if day is None:
+            day = days[totals_id(key["user_id"], key["date"])] = empty_totals(key["user_id"], key["date"])
+        for field in TOTAL_FIELDS:
+            day[field] += row[field] or 0
+        day["types"][key["type"]] = {"count": row["count"], "value": row["value"] or 0}
+    return days
+
+
+async def _backfill(db, user_id: str, dates: List[str], keep_empty: bool = True) -> Dict[str, dict]:
+    """
+    Insert the documents of days that have none, computed from `analytics_entries`, and return
+    the totals by date. A day another writer created meanwhile is kept as it is. Days without live
+    entries are only stored with `keep_empty` (after a write, which `$inc`s them from then on).
+    """
+    computed = await _compute(db, {"user_id": user_id, "date": {"$in": dates}})
+    now = datetime.utcnow()
+    results = {}
+    for date in dates:
+        day = computed.get(totals_id(user_id, date)) or empty_totals(user_id, date)
+        if not keep_empty and not day["count"]:
+            results[date] = day
+            continue
+        fields = {k: v for k, v in day.items() if k != "_id"}
+        results[date] = await db.daily_totals.find_one_and_update(
+            {"_id": day["_id"]},
+            {"$setOnInsert": {**fields, "updated_at": now}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    return results
+
+
+async def rebuild(db, user_id: Optional[str] = None, start_date: Optional[str] = None, end_date: Optional[str] = None) -> int:
+    """
+    Recompute `daily_totals` from `analytics_entries` for the given scope (all users / all dates
+    by default). Days with no live entries left are removed. Returns the number of days written.
+
+    Entries written while a day is being recomputed can be lost from it; scope the rebuild to the
+    days that need repair, or run it while writes are quiet.
+    """
+    scope = {}
+    if user_id:
+        scope["user_id"] = user_id
+    if start_date or end_date:
+        scope["date"] = {k: v for k, v in (("$gte", start_date), ("$lte", end_date)) if v}
+    days = await _compute(db, scope)
+
+    started = datetime.utcnow()
+    for day in days.values():
+        day["updated_at"] = datetime.utcnow()
+        await db.daily_totals.replace_one({"_id": day["_id"]}, day, upsert=True)
+    # Days in scope that were neither rebuilt nor touched by a live write since have no entries left
+    await db.daily_totals.delete_many({**scope, "updated_at": {"$lt": started}})
+    return len(days)
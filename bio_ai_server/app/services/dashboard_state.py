@@ -0,0 +1,307 @@
+"""Per-user state of the current day behind `/dashboard/state`.
+
+The dashboard is built from a handful of numbers about today:
+
+- calories and protein eaten (the day's `daily_totals` document) and the time of the last meal;
+- steps walked (today's `Steps` samples in `health_metrics`, in bio_worker's database);
+- the targets implied by the user's goals (`users.goals`, see `targets_for()`) and the optional
+  fasting window (`users.fasting_window`, `{"start": "20:00", "end": "12:00"}`, set through
+  `PATCH /profile/me`).
+
+`DashboardEngine` keeps them in memory per user (`DayState`) and the writers keep them current as
+events arrive: entry writes pass the `daily_totals` document they just updated, goal writes the
+updated user document (bulk entry writes only report the days). A request therefore only renders
+the state against the clock (rings, schedule-aware status message, fasting flag), without touching
+Mongo.
+The state is loaded from Mongo on the first request of the user's day, after an event that cannot
+be applied incrementally (e.g. deleting the latest meal, a `/sync/batch` batch seen done), or when it
+expired (`DASHBOARD_STATE_TTL_S`, bounding drift from device data nobody reported, such as batches
+whose completion was not polled or samples written straight to `health_metrics`).
+
+Events are applied in the process that handled the write and published on the response cache
+invalidation channel, so the other processes reload the user's state on their next request.
+Days and times are UTC, like the rest of the API.
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+
+from app.config import DASHBOARD_STATE_CACHE_SIZE, DASHBOARD_STATE_TTL_S
+from app.db.mongodb import get_health_db
+from app.schemas import DashboardState, RingState
+from app.services import daily_totals, response_cache
+from app.services.cache import TTLCache
+from app.services.metric_rollups import METRICS
+from app.services.user_cache import get_user_cache
+
+NAMESPACE = "dashboard"
+
+# Calorie / protein target multipliers per goal of the profile (`goals.list`, `goals.primary`)
+GOAL_ADJUSTMENTS: Dict[str, Tuple[float, float]] = {
+    "Lose Fat": (0.85, 1.1),
+    "Build Muscle": (1.1, 1.25),
+    "Maintain & Cognitive": (1.0, 1.0),
+}
+
+# Intake is expected to go from 0 to the full target between these hours
+SCHEDULE_START_HOUR = 7
+SCHEDULE_END_HOUR = 21
+# How far (fraction of the target) intake may be off the schedule before the message says so
+SCHEDULE_TOLERANCE = 0.15
+
+DASHBOARD_STATE_LOOKUPS = Counter(
+    "bio_ai_dashboard_state_lookups_total", "Dashboard state lookups by outcome", ["result"]
+)
+DASHBOARD_STATE_SECONDS = Histogram(
+    "bio_ai_dashboard_state_seconds",
+    "Time to produce the dashboard state, by lookup outcome",
+    ["result"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+
+
+@dataclass(frozen=True)
+class Targets:
+    calories: float
+    protein: float
+    steps: float
+
+
+BASE_TARGETS = Targets(
+    calories=METRICS["calorie_intake"].goal,
+    protein=METRICS["protein_intake"].goal,
+    steps=METRICS["steps"].goal,
+)
+
+
+def targets_for(goals: Optional[dict]) -> Targets:
+    """
+    Daily targets for a `users.goals` document. The calorie target follows the primary goal (or
+    the first listed goal with an adjustment); protein takes the largest adjustment of any goal.
+    """
+    goals = goals or {}
+    listed = [g for g in [goals.get("primary"), *(goals.get("list") or [])] if g in GOAL_ADJUSTMENTS]
+    if not listed:
+        return BASE_TARGETS
+    calorie_factor = GOAL_ADJUSTMENTS[listed[0]][0]
+    protein_factor = max(GOAL_ADJUSTMENTS[g][1] for g in listed)
+    return Targets(
+        calories=round(BASE_TARGETS.calories * calorie_factor),
+        protein=round(BASE_TARGETS.protein * protein_factor),
+        steps=BASE_TARGETS.steps,
+    )
+
+
+def fasting_window_of(user: dict) -> Optional[Tuple[str, str]]:
+    window = user.get("fasting_window") or {}
+    if window.get("start") and window.get("end"):
+        return window["start"], window["end"]
+    return None
+
+
+@dataclass
+class DayState:
+    day: str
+    targets: Targets
+    fasting_window: Optional[Tuple[str, str]] = None
+    calories: float = 0.0
+    protein: float = 0.0
+    steps: float = 0.0
+    # HH:MM of the latest meal logged for the day
+    last_meal: Optional[str] = None
+
+    def apply_totals(self, totals: dict) -> None:
+        self.calories = float(((totals.get("types") or {}).get("MEAL") or {}).get("value") or 0)
+        self.protein = float(totals.get("protein") or 0)
+
+    def apply_user(self, user: dict) -> None:
+        self.targets = targets_for(user.get("goals"))
+        self.fasting_window = fasting_window_of(user)
+
+
+async def load(db, user_id: str, day: str) -> DayState:
+    """Read the day's state (the user document from the shared cache, three Mongo reads), concurrently."""
+    start = datetime.fromisoformat(day)
+    user, totals, last_meal, steps = await asyncio.gather(
+        get_user_cache().get(db, user_id),
+        daily_totals.get_totals(db, user_id, day),
+        db.analytics_entries.find_one(
+            {"user_id": user_id, "date": day, "is_deleted": False, "type": "MEAL"},
+            {"time": 1},
+            sort=[("time", -1)],
+        ),
+        get_health_db().health_metrics.aggregate([
+            {"$match": {
+                "metadata.user_id": user_id,
+                "metadata.sensor_type": METRICS["steps"].kind,
+                "timestamp": {"$gte": start, "$lt": start + timedelta(days=1)},
+            }},
+            {"$group": {"_id": None, "steps": {"$sum": METRICS["steps"].value}}},
+        ]).to_list(1),
+    )
+    state = DayState(day=day, targets=BASE_TARGETS)
+    state.apply_user(user or {})
+    state.apply_totals(totals)
+    state.last_meal = last_meal["time"] if last_meal else None
+    state.steps = float(steps[0]["steps"] or 0) if steps else 0.0
+    return state
+
+
+def _in_window(clock: str, start: str, end: str) -> bool:
+    """Whether HH:MM `clock` falls in [start, end), which may wrap past midnight."""
+    if start <= end:
+        return start <= clock < end
+    return clock >= start or clock < end
+
+
+def is_fasting(state: DayState, clock: str) -> bool:
+    """Inside the fasting window with no meal logged since it opened (today's meals only)."""
+    if state.fasting_window is None:
+        return False
+    start, end = state.fasting_window
+    if not _in_window(clock, start, end):
+        return False
+    if state.last_meal is None:
+        return True
+    # Before midnight of a wrapping window only meals after its start count; after midnight,
+    # any meal of the day up to now breaks the fast
+    if start > end and clock >= start:
+        return not start <= state.last_meal <= clock
+    return not (_in_window(state.last_meal, start, end) and state.last_meal <= clock)
+
+
+def expected_progress(now: datetime) -> float:
+    """Fraction of the day's intake expected by `now` (linear over the schedule hours)."""
+    hours = now.hour + now.minute / 60
+    span = SCHEDULE_END_HOUR - SCHEDULE_START_HOUR
+    return min(max((hours - SCHEDULE_START_HOUR) / span, 0.0), 1.0)
+
+
+def status_message(state: DayState, now: datetime, fasting: bool) -> str:
+    if fasting:
+        return f"Fasting - Your window ends at {state.fasting_window[1]}."
+    calories = state.calories / state.targets.calories
+    protein = state.protein / state.targets.protein
+    expected = expected_progress(now)
+    if calories > 1 + SCHEDULE_TOLERANCE / 2:
+        return "Over Target - Keep the rest of today light."
+    if calories >= 1:
+        return "Goal Reached - Calories on target for today."
+    if calories < expected - SCHEDULE_TOLERANCE:
+        return "Fuel Up - You are behind schedule."
+    if calories > expected + SCHEDULE_TOLERANCE:
+        return "Slow Down - You are ahead of schedule."
+    if protein < expected - SCHEDULE_TOLERANCE:
+        return "On Track - Add protein to your next meal."
+    return "On Track - Keep it up."
+
+
+def render(state: DayState, now: datetime) -> DashboardState:
+    """Outer ring: calories eaten vs target; inner ring: steps vs target."""
+    fasting = is_fasting(state, now.strftime("%H:%M"))
+    return DashboardState(
+        rings=RingState(
+            outer_percent=round(state.calories / state.targets.calories, 2),
+            inner_percent=round(state.steps / state.targets.steps, 2),
+        ),
+        status_msg=status_message(state, now, fasting),
+        fasting_active=fasting,
+        ai_card=None,
+    )
+
+
+class DashboardEngine:
+    def __init__(self, maxsize: int = DASHBOARD_STATE_CACHE_SIZE, ttl: float = DASHBOARD_STATE_TTL_S):
+        self._states = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Bumped on every event of a user; a load that raced with one is not kept
+        self._versions: Dict[str, int] = {}
+        response_cache.subscribe(NAMESPACE, self._on_invalidation)
+
+    def version(self, user_id: str) -> int:
+        return self._versions.get(user_id, 0)
+
+    def _changed(self, user_id: str) -> Optional[DayState]:
+        self._versions[user_id] = self.version(user_id) + 1
+        return self._states.get(user_id)
+
+    def _drop(self, user_id: str) -> None:
+        self._versions[user_id] = self.version(user_id) + 1
+        self._states.pop(user_id)
+
+    def _on_invalidation(self, user_id: Optional[str], key: Optional[str]) -> None:
+        if user_id is None:
+            self._states.clear()
+        else:
+            self._drop(user_id)
+
+    async def state(self, db, user_id: str, now: Optional[datetime] = None) -> DashboardState:
+        started = time.perf_counter()
+        now = now or datetime.utcnow()
+        day = now.date().isoformat()
+        state = self._states.get(user_id)
+        result = "hit"
+        if state is None or state.day != day:
+            result = "miss" if state is None else "new_day"
+            version = self.version(user_id)
+            state = await load(db, user_id, day)
+            if version == self.version(user_id):
+                self._states.set(user_id, state)
+        rendered = render(state, now)
+        DASHBOARD_STATE_LOOKUPS.labels(result).inc()
+        DASHBOARD_STATE_SECONDS.labels(result).observe(time.perf_counter() - started)
+        return rendered
+
+    async def entry_written(self, user_id: str, totals: Optional[dict], before: Optional[dict] = None, after: Optional[dict] = None) -> None:
+        """
+        After an entry write and its `daily_totals.record_*()`: `totals` is the updated day
+        document returned by it, `before` / `after` the entry before and after the write (None
+        for a create / delete).
+        """
+        state = self._changed(user_id)
+        if state is not None:
+            before_today = before is not None and before["date"] == state.day
+            # Neither the latest meal nor another day's totals can be rolled back from here
+            meal_moved = before_today and before["type"] == "MEAL" and not (
+                after is not None and (after["date"], after["type"], after["time"]) == (before["date"], "MEAL", before["time"])
+            )
+            if meal_moved or (before_today and (totals is None or totals["date"] != state.day)):
+                self._drop(user_id)
+            else:
+                if totals is not None and totals["date"] == state.day:
+                    state.apply_totals(totals)
+                if after is not None and after["date"] == state.day and after["type"] == "MEAL":
+                    state.last_meal = max(state.last_meal or after["time"], after["time"])
+        await response_cache.broadcast(NAMESPACE, user_id)
+
+    async def days_changed(self, user_id: str, days: Iterable[str]) -> None:
+        """After entry writes on `days` that are not reported one by one (bulk writes)."""
+        state = self._changed(user_id)
+        if state is not None and state.day in set(days):
+            self._drop(user_id)
+        await response_cache.broadcast(NAMESPACE, user_id)
+
+    async def user_changed(self, user_id: str, user: dict) -> None:
+        """After a write to the user document (goals, fasting window); `user` is the updated document."""
+        state = self._changed(user_id)
+        if state is not None:
+            state.apply_user(user)
+        await response_cache.broadcast(NAMESPACE, user_id)
+
+    async def invalidate(self, user_id: str) -> None:
+        """Reload the user's state on the next request (in every process)."""
+        self._drop(user_id)
+        await response_cache.broadcast(NAMESPACE, user_id)
+
+
+_engine: Optional[DashboardEngine] = None
+
+
+def get_dashboard_engine() -> DashboardEngine:
+    global _engine
+    if _engine is None:
+        _engine = DashboardEngine()
+    return _engine
@@ -0,0 +1,206 @@
+"""Async FatSecret Platform API client.
+
+One `httpx.AsyncClient` is shared by every request so connections to FatSecret are kept alive and
+pooled instead of opened per call, and no call blocks the event loop. Transient failures
+(connection errors, timeouts, 429 and 5xx answers) are retried with exponential backoff and full
+jitter. The OAuth token is refreshed single-flight: when it expires, one coroutine fetches a new
+token while concurrent callers wait for it rather than each requesting their own.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import httpx
+
+from app.config import (
+    FATSECRET_CLIENT_ID,
+    FATSECRET_CLIENT_SECRET,
+    FATSECRET_BASE_URL,
+    FATSECRET_TOKEN_URL,
+    FATSECRET_RECOGNITION_URL,
+    FATSECRET_TIMEOUT_S,
+    FATSECRET_MAX_CONNECTIONS,
+    FATSECRET_RETRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+FATSECRET_SCOPE = "basic premier barcode image-recognition"
+# Refresh the token this long before FatSecret expires it
+TOKEN_EXPIRY_MARGIN_S = 60
+RETRY_BACKOFF_S = 0.2
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class _NoTrace:
+    @contextmanager
+    def stage(self, name):
+        yield
+
+
+_NO_TRACE = _NoTrace()
+
+
+class FatSecretClient:
+    def __init__(
+        self,
+        client_id: Optional[str] = FATSECRET_CLIENT_ID,
+        client_secret: Optional[str] = FATSECRET_CLIENT_SECRET,
+        timeout_s: float = FATSECRET_TIMEOUT_S,
+        max_connections: int = FATSECRET_MAX_CONNECTIONS,
+        retries: int = FATSECRET_RETRIES,
+    ):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.timeout_s = timeout_s
+        self.max_connections = max_connections
+        self.retries = retries
+        self._http: Optional[httpx.AsyncClient] = None
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.client_id and self.client_secret)
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout_s, connect=min(self.timeout_s, 5.0)),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send with retries on transport errors and retryable statuses (429/5xx)."""
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = await self.http.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if last_attempt:
+                    raise
+                logger.warning("FatSecret %s %s failed (%s), retrying", method, url, e)
+            else:
+                if response.status_code not in RETRY_STATUSES or last_attempt:
+                    return response
+                logger.warning("FatSecret %s %s returned %s, retrying", method, url, response.status_code)
+            # Full jitter: spread retries of concurrent callers instead of stampeding together
+            await asyncio.sleep(random.uniform(0, RETRY_BACKOFF_S * 2 ** attempt))
+
+    async def get_token(self) -> Optional[str]:
+        """Cached OAuth token; None if FatSecret refused or could not be reached."""
+        if self._token and time.time() < self._token_expires_at:
+            return self._token
+        async with self._token_lock:
+            # Another caller may have refreshed it while we waited for the lock
+            if self._token and time.time() < self._token_expires_at:
+                return self._token
+            try:
+                response = await self._send(
+                    "POST",
+                    FATSECRET_TOKEN_URL,
+                    auth=(self.client_id or "", self.client_secret or ""),
+                    data={"grant_type": "client_credentials", "scope": FATSECRET_SCOPE},
+                )
+            except httpx.HTTPError as e:
+                logger.error("FatSecret auth exception: %s", e)
+                return None
+            if response.status_code != 200:
+                logger.error("FatSecret token error: %s", response.text)
+                return None
+            data = response.json()
+            self._token = data["access_token"]
+            self._token_expires_at = time.time() + data["expires_in"] - TOKEN_EXPIRY_MARGIN_S
+            return self._token
+
+    def invalidate_token(self):
+        self._token = None
+        self._token_expires_at = 0.0
+
+    async def request(self, method: str, params: dict, trace=None) -> dict:
+        """
+        Call a `server.api` method. Errors are returned in the body (`{"error": ...}`), as the
+        vision endpoints pass FatSecret answers through to the app unchanged. With a
+        `RequestTrace`, the upstream round-trip and JSON parsing are timed as stages.
+        """
+        trace = trace or _NO_TRACE
+        token = await self.get_token()
+        if not token:
+            return {"error": "Authentication failed"}
+
+        final_params = {"method": method, "format": "json"}
+        final_params.update(params)
+        # Remove empty params
+        final_params = {k: v for k, v in final_params.items() if v is not None and v != ""}
+
+        try:
+            with trace.stage("upstream"):
+                response = await self._send(
+                    "GET", FATSECRET_BASE_URL, headers={"Authorization": f"Bearer {token}"}, params=final_params
+                )
+            if response.status_code == 401:
+                # Token revoked or expired early: refresh once and replay
+                self.invalidate_token()
+                token = await self.get_token()
+                if not token:
+                    return {"error": "Authentication failed"}
+                with trace.stage("upstream"):
+                    response = await self._send(
+                        "GET", FATSECRET_BASE_URL, headers={"Authorization": f"Bearer {token}"}, params=final_params
+                    )
+        except httpx.HTTPError as e:
+            return {"error": str(e)}
+
+        if response.status_code != 200:
+            return {"error": f"API Error {response.status_code}", "details": response.text}
+        with trace.stage("parse"):
+            return response.json()
+
+    async def recognize(self, image_b64: bytes, region: str = "US", language: str = "en") -> httpx.Response:
+        """
+        POST a base64 JPEG to the image recognition API. Raises if no token can be obtained.
+
+        The body is assembled around the base64 bytes directly: no str decode of the image and no
+        JSON escaping pass over it (base64 never needs escaping).
+        """
+        token = await self.get_token()
+        if not token:
+            raise httpx.HTTPError("Authentication failed")
+        options = json.dumps({"include_food_data": True, "region": region, "language": language}).encode()
+        body = b"".join((b'{"image_b64":"', image_b64, b'",', options[1:]))
+        return await self._send(
+            "POST",
+            FATSECRET_RECOGNITION_URL,
+            headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
+            content=body,
+        )
+
+
+_client: Optional[FatSecretClient] = None
+
+
+def get_fatsecret_client() -> FatSecretClient:
+    global _client
+    if _client is None:
+        _client = FatSecretClient()
+    return _client
+
+
+async def close_fatsecret_client():
+    if _client is not None:
+        await _client.aclose()
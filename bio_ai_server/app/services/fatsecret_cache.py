@@ -0,0 +1,173 @@
+"""Tiered response cache for FatSecret lookups (search, autocomplete, barcode).
+
+- Tier 1: in-process LRU with TTL (`TTLCache`), so hot queries never leave the process.
+- Tier 2 (optional, `FATSECRET_SHARED_CACHE`): the `fatsecret_cache` Mongo collection, shared by all
+  API replicas; a TTL index drops entries once they are too old even to be served stale.
+
+Every entry has a fresh period and a longer stale period. Stale entries are still served, and a
+background refresh replaces them (stale-while-revalidate). "No food found" answers (FatSecret error
+211) are cached too, for a shorter time; other errors never are. Concurrent misses on the same key
+share one upstream call.
+"""
+import asyncio
+import logging
+import time
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from prometheus_client import Counter
+
+from app.config import FATSECRET_CACHE_SIZE, FATSECRET_SHARED_CACHE
+from app.db.mongodb import get_db
+from app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+FATSECRET_NOT_FOUND = 211
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    fresh_s: float
+    stale_s: float
+    negative_s: float
+
+
+# Product data changes rarely; search rankings and suggestions a bit more often
+POLICIES = {
+    "search": CachePolicy(fresh_s=3600, stale_s=24 * 3600, negative_s=3600),
+    "autocomplete": CachePolicy(fresh_s=6 * 3600, stale_s=7 * 24 * 3600, negative_s=6 * 3600),
+    "barcode": CachePolicy(fresh_s=24 * 3600, stale_s=30 * 24 * 3600, negative_s=6 * 3600),
+}
+
+FATSECRET_CACHE_LOOKUPS = Counter(
+    "bio_ai_fatsecret_cache_lookups_total",
+    "FatSecret response cache lookups by kind and outcome",
+    ["kind", "result"],
+)
+
+
+def normalize_query(query: str) -> str:
+    """Case-, width- and whitespace-insensitive form of a search expression."""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+def search_key(query: str, max_results: int) -> str:
+    return f"search:{max_results}:{normalize_query(query)}"
+
+
+def autocomplete_key(query: str) -> str:
+    return f"autocomplete:{normalize_query(query)}"
+
+
+def barcode_key(gtin13: str, region: str) -> str:
+    return f"barcode:{region.upper()}:{gtin13}"
+
+
+def is_not_found(result: dict) -> bool:
+    error = result.get("error") if isinstance(result, dict) else None
+    return isinstance(error, dict) and str(error.get("code")) == str(FATSECRET_NOT_FOUND)
+
+
+@dataclass
+class CacheEntry:
+    value: dict
+    fresh_until: float
+    stale_until: float
+
+
+class FatSecretCache:
+    def __init__(self, maxsize: int = FATSECRET_CACHE_SIZE, shared: bool = FATSECRET_SHARED_CACHE):
+        self._memory = TTLCache(maxsize=maxsize, ttl=max(p.stale_s for p in POLICIES.values()))
+        self.shared = shared
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def _shared_get(self, key: str) -> Optional[CacheEntry]:
+        try:
+            doc = await get_db().fatsecret_cache.find_one({"_id": key})
+        except Exception as e:
+            logger.warning("FatSecret shared cache read failed: %s", e)
+            return None
+        if doc is None:
+            return None
+        # Mongo hands back naive UTC datetimes
+        return CacheEntry(
+            doc["value"],
+            doc["fresh_until"].replace(tzinfo=timezone.utc).timestamp(),
+            doc["expires_at"].replace(tzinfo=timezone.utc).timestamp(),
+        )
+
+    async def _shared_set(self, key: str, entry: CacheEntry):
+        try:
+            await get_db().fatsecret_cache.replace_one(
+                {"_id": key},
+                {
+                    "value": entry.value,
+                    "fresh_until": datetime.fromtimestamp(entry.fresh_until, timezone.utc),
+                    "expires_at": datetime.fromtimestamp(entry.stale_until, timezone.utc),
+                },
+                upsert=True,
+            )
+        except Exception as e:
+            logger.warning("FatSecret shared cache write failed: %s", e)
+
+    async def _fetch_and_store(self, kind: str, key: str, fetch: Callable[[], Awaitable[dict]]) -> dict:
+        value = await fetch()
+        policy = POLICIES[kind]
+        if is_not_found(value):
+            fresh_s = stale_s = policy.negative_s
+        elif isinstance(value, dict) and "error" in value:
+            # Auth failures, quota errors, outages: never cache
+            return value
+        else:
+            fresh_s, stale_s = policy.fresh_s, policy.stale_s
+        now = time.time()
+        entry = CacheEntry(value, now + fresh_s, now + stale_s)
+        self._memory.set(key, entry, ttl=stale_s)
+        if self.shared:
+            await self._shared_set(key, entry)
+        return value
+
+    def _single_flight(self, kind: str, key: str, fetch: Callable[[], Awaitable[dict]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_and_store(kind, key, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        return task
+
+    async def get_or_fetch(self, kind: str, key: str, fetch: Callable[[], Awaitable[dict]]) -> dict:
+        """Return the cached answer for `key`, calling `fetch()` on a miss or refreshing it if stale."""
+        now = time.time()
+        entry = self._memory.get(key)
+        result = "hit"
+        if entry is None and self.shared:
+            entry = await self._shared_get(key)
+            if entry is not None and entry.stale_until > now:
+                self._memory.set(key, entry, ttl=entry.stale_until - now)
+                result = "shared_hit"
+
+        if entry is not None and entry.stale_until > now:
+            if entry.fresh_until <= now:
+                result = "stale"
+                task = self._single_flight(kind, key, fetch)
+                # Refresh failures are not the caller's problem: keep serving the stale answer
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            FATSECRET_CACHE_LOOKUPS.labels(kind, result).inc()
+            return entry.value
+
+        FATSECRET_CACHE_LOOKUPS.labels(kind, "miss").inc()
+        # shield: a client disconnect must not cancel a fetch other callers are waiting on
+        return await asyncio.shield(self._single_flight(kind, key, fetch))
+
+
+_cache: Optional[FatSecretCache] = None
+
+
+def get_fatsecret_cache() -> FatSecretCache:
+    global _cache
+    if _cache is None:
+        _cache = FatSecretCache()
+    return _cache
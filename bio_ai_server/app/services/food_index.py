@@ -0,0 +1,288 @@
+"""In-memory prefix index over the local food catalog (`food_products` and `global_foods`).
+
+Every name and brand is normalized (casefolded, punctuation to spaces) and indexed under each of its
+word suffixes ("coca cola zero", "cola zero", "zero"), so a query matches the start of any word.
+The keys live in one sorted list; a prefix lookup is two `bisect` calls plus ranking the matching
+range. Results for prefixes of up to `SHORT_PREFIX` characters, whose ranges are huge, are
+precomputed, and ranked longer prefixes are memoized until the index next changes.
+
+Ranking is by popularity: how often each food name was logged as a meal in `analytics_entries` over
+the last `POPULARITY_WINDOW_DAYS`.
+
+Refresh runs in the background: a delta scan every `FOOD_INDEX_REFRESH_S` picks up documents whose
+`updated_at` moved (writers should set it), and a full rebuild every `FOOD_INDEX_REBUILD_S` catches
+everything else (deletions, documents without `updated_at`) and refreshes popularity.
+"""
+import asyncio
+import heapq
+import logging
+import re
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+from app.config import (
+    FOOD_INDEX_ENABLED,
+    FOOD_INDEX_REFRESH_S,
+    FOOD_INDEX_REBUILD_S,
+)
+from app.db.mongodb import get_catalog_db, get_db
+from app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SHORT_PREFIX = 3
+SHORT_PREFIX_TOP_K = 50
+MAX_SUFFIXES = 8
+POPULARITY_WINDOW_DAYS = 90
+# Above this many changed documents a delta rebuilds the arrays instead of patching them
+INCREMENTAL_MAX = 500
+MEMO_SIZE = 10000
+
+FOOD_INDEX_SIZE = Gauge("bio_ai_food_index_records", "Foods held in the local prefix index")
+FOOD_INDEX_LOOKUPS = Counter("bio_ai_food_index_lookups_total", "Local food index lookups by outcome", ["result"])
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize(text: str) -> str:
+    return " ".join(_NON_WORD.sub(" ", (text or "").casefold()).split())
+
+
+def index_keys(*texts: Optional[str]) -> List[str]:
+    """Word-suffix keys for a name/brand ("coca-cola zero" -> "coca cola zero", "cola zero", "zero")."""
+    keys = set()
+    for text in texts:
+        words = normalize(text).split()
+        for i in range(min(len(words), MAX_SUFFIXES)):
+            keys.add(" ".join(words[i:]))
+    return sorted(keys)
+
+
+@dataclass
+class FoodRecord:
+    id: str
+    name: str
+    brand: Optional[str]
+    serving_size: str
+    calories: float
+    image_url: Optional[str]
+    source: str
+    popularity: int = 0
+
+    @property
+    def rank(self) -> Tuple[int, int]:
+        # Most logged first, then shorter (more generic) names
+        return (self.popularity, -len(self.name))
+
+
+def _serving_label(serving) -> str:
+    if isinstance(serving, dict):
+        if serving.get("description"):
+            return str(serving["description"])
+        if serving.get("amount") is not None:
+            return f"{serving['amount']}{serving.get('unit', '')}"
+    return str(serving) if serving else "100g"
+
+
+def record_from_doc(doc: dict, source: str) -> Optional[FoodRecord]:
+    if not doc.get("name"):
+        return None
+    if source == "food_products":
+        calories = (doc.get("nutrition") or {}).get("calories", 0)
+    else:
+        # global_foods (bio_nexus FoodItem) only carries macros per 100 g
+        calories = (doc.get("macros_per_100g") or {}).get("calories", 0)
+    return FoodRecord(
+        id=str(doc["_id"]),
+        name=doc["name"],
+        brand=doc.get("brand"),
+        serving_size=_serving_label(doc.get("serving_size")),
+        calories=float(calories or 0),
+        image_url=doc.get("image_url"),
+        source=source,
+    )
+
+
+class _Snapshot:
+    """Sorted (key, record key) arrays plus precomputed results for short prefixes."""
+
+    def __init__(self, records: Dict[str, FoodRecord]):
+        pairs = sorted((key, rid) for rid, rec in records.items() for key in index_keys(rec.name, rec.brand))
+        self.keys = [k for k, _ in pairs]
+        self.ids = [rid for _, rid in pairs]
+        self.short: Dict[str, List[str]] = {}
+        # (prefix, limit) -> ranked ids for longer prefixes; cleared whenever the arrays change
+        self.memo = TTLCache(maxsize=MEMO_SIZE, ttl=float("inf"))
+        self.rebuild_short(records)
+
+    def rebuild_short(self, records: Dict[str, FoodRecord], prefixes=None):
+        if prefixes is None:
+            prefixes = {key[:n] for key in self.keys for n in range(1, SHORT_PREFIX + 1) if len(key) >= n}
+        for prefix in prefixes:
+            lo = bisect_left(self.keys, prefix)
+            hi = bisect_left(self.keys, prefix + "\U0010ffff", lo)
+            if lo == hi:
+                self.short.pop(prefix, None)
+            else:
+                self.short[prefix] = heapq.nlargest(SHORT_PREFIX_TOP_K, set(self.ids[lo:hi]), key=lambda rid: records[rid].rank)
+
+    def add(self, key: str, rid: str):
+        i = bisect_left(self.keys, key)
+        # keep ids aligned with keys: insert at the same position
+        while i < len(self.keys) and self.keys[i] == key and self.ids[i] < rid:
+            i += 1
+        self.keys.insert(i, key)
+        self.ids.insert(i, rid)
+
+    def remove(self, key: str, rid: str):
+        i = bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i] == key:
+            if self.ids[i] == rid:
+                del self.keys[i]
+                del self.ids[i]
+                return
+            i += 1
+
+
+class FoodIndex:
+    def __init__(self):
+        self._records: Dict[str, FoodRecord] = {}
+        self._snapshot: Optional[_Snapshot] = None
+        self._popularity: Dict[str, int] = {}
+        self._watermark: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._snapshot is not None
+
+    def search(self, query: str, limit: int = 10) -> List[FoodRecord]:
+        """Best-ranked foods whose name or brand has a word starting with `query`."""
+        snapshot = self._snapshot
+        prefix = normalize(query)
+        if snapshot is None or not prefix:
+            return []
+        if len(prefix) <= SHORT_PREFIX:
+            rids = snapshot.short.get(prefix, [])[:limit]
+        else:
+            rids = snapshot.memo.get((prefix, limit))
+            if rids is None:
+                lo = bisect_left(snapshot.keys, prefix)
+                hi = bisect_left(snapshot.keys, prefix + "\U0010ffff", lo)
+                rids = heapq.nlargest(limit, set(snapshot.ids[lo:hi]), key=lambda rid: self._records[rid].rank)
+                snapshot.memo.set((prefix, limit), rids)
+        results = [self._records[rid] for rid in rids]
+        FOOD_INDEX_LOOKUPS.labels("hit" if results else "miss").inc()
+        return results
+
+    # --- Refresh -------------------------------------------------------------
+
+    async def _load_popularity(self) -> Dict[str, int]:
+        since = (datetime.utcnow() - timedelta(days=POPULARITY_WINDOW_DAYS)).strftime("%Y-%m-%d")
+        pipeline = [
+            {"$match": {"type": "MEAL", "is_deleted": False, "date": {"$gte": since}}},
+            {"$group": {"_id": "$title", "count": {"$sum": 1}}},
+        ]
+        popularity: Dict[str, int] = {}
+        async for row in get_db().analytics_entries.aggregate(pipeline):
+            name = normalize(row["_id"] or "")
+            popularity[name] = popularity.get(name, 0) + row["count"]
+        return popularity
+
+    async def _scan(self, query: dict) -> Dict[str, FoodRecord]:
+        # food_products is the app's own catalog; global_foods may live in bio_nexus's database
+        sources = {"food_products": get_db(), "global_foods": get_catalog_db()}
+        projection = {"name": 1, "brand": 1, "serving_size": 1, "nutrition.calories": 1, "macros_per_100g.calories": 1, "image_url": 1}
+        records = {}
+        for source, db in sources.items():
+            async for doc in db[source].find(query, projection):
+                record = record_from_doc(doc, source)
+                if record is not None:
+                    record.popularity = self._popularity.get(normalize(record.name), 0)
+                    records[f"{source}:{record.id}"] = record
+        return records
+
+    async def rebuild(self):
+        """Full scan of the catalog and popularity; the new arrays are swapped in at once."""
+        started = datetime.utcnow()
+        t0 = time.perf_counter()
+        self._popularity = await self._load_popularity()
+        records = await self._scan({})
+        snapshot = await asyncio.to_thread(_Snapshot, records)
+        self._records, self._snapshot, self._watermark = records, snapshot, started
+        FOOD_INDEX_SIZE.set(len(records))
+        logger.info("Food index rebuilt: %s foods, %s keys in %.2fs", len(records), len(snapshot.keys), time.perf_counter() - t0)
+
+    async def refresh(self):
+        """Apply documents changed since the last scan."""
+        if self._snapshot is None:
+            return await self.rebuild()
+        started = datetime.utcnow()
+        changed = await self._scan({"updated_at": {"$gt": self._watermark}})
+        self._watermark = started
+        if not changed:
+            return
+        if len(changed) > INCREMENTAL_MAX:
+            records = {**self._records, **changed}
+            snapshot = await asyncio.to_thread(_Snapshot, records)
+            self._records, self._snapshot = records, snapshot
+        else:
+            snapshot = self._snapshot
+            touched = set()
+            for rid, record in changed.items():
+                old = self._records.get(rid)
+                old_keys = index_keys(old.name, old.brand) if old else []
+                new_keys = index_keys(record.name, record.brand)
+                for key in set(old_keys) - set(new_keys):
+                    snapshot.remove(key, rid)
+                for key in set(new_keys) - set(old_keys):
+                    snapshot.add(key, rid)
+                self._records[rid] = record
+                touched.update(key[:n] for key in old_keys + new_keys for n in range(1, SHORT_PREFIX + 1))
+            snapshot.rebuild_short(self._records, touched)
+            snapshot.memo.clear()
+        FOOD_INDEX_SIZE.set(len(self._records))
+
+    async def _run(self):
+        last_rebuild = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_rebuild >= FOOD_INDEX_REBUILD_S:
+                    await self.rebuild()
+                    last_rebuild = time.monotonic()
+                else:
+                    await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Food index refresh failed: %s", e)
+            await asyncio.sleep(FOOD_INDEX_REFRESH_S)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+_index: Optional[FoodIndex] = None
+
+
+def get_food_index() -> Optional[FoodIndex]:
+    """The app-wide index, or None when disabled (FOOD_INDEX_ENABLED=false)."""
+    global _index
+    if _index is None and FOOD_INDEX_ENABLED:
+        _index = FoodIndex()
+    return _index
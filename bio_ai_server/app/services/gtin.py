@@ -0,0 +1,110 @@
+"""GTIN normalization and validation for scanned barcodes.
+
+Every supported symbology is mapped onto GTIN-13, the form FatSecret expects:
+
+- EAN-13 / GTIN-13: validated as-is;
+- UPC-A (12 digits): validated, then prefixed with 0;
+- GTIN-14 with a leading 0: the 0 is dropped;
+- EAN-8: validated, then left-padded with zeros;
+- UPC-E: 6 digits (number system 0, no check digit), 7 digits (number system + 6) or 8 digits
+  (number system + 6 + check digit), expanded to UPC-A with the GS1 zero-suppression rules.
+
+An 8-digit code starting with 0 or 1 is read as UPC-E when its UPC-E check digit is valid (EAN-8
+codes with those prefixes are restricted-circulation numbers), otherwise as EAN-8.
+"""
+import re
+from typing import List
+
+_SEPARATORS = re.compile(r"[\s-]+")
+
+
+class InvalidBarcode(ValueError):
+    pass
+
+
+def check_digit(body: str) -> str:
+    """GS1 mod-10 check digit for the digits of `body` (any GTIN length, check digit excluded)."""
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(body)))
+    return str((10 - total % 10) % 10)
+
+
+def has_valid_check_digit(code: str) -> bool:
+    return len(code) >= 2 and check_digit(code[:-1]) == code[-1]
+
+
+def expand_upce(code: str) -> str:
+    """Expand a UPC-E code (6, 7 or 8 digits) to the 12-digit UPC-A it encodes."""
+    if len(code) == 6:
+        number_system, digits, check = "0", code, None
+    elif len(code) == 7:
+        number_system, digits, check = code[0], code[1:], None
+    elif len(code) == 8:
+        number_system, digits, check = code[0], code[1:7], code[7]
+    else:
+        raise InvalidBarcode(f"UPC-E must have 6-8 digits, got {len(code)}")
+    if number_system not in "01":
+        raise InvalidBarcode("UPC-E number system must be 0 or 1")
+
+    d1, d2, d3, d4, d5, d6 = digits
+    if d6 in "012":
+        body = f"{d1}{d2}{d6}0000{d3}{d4}{d5}"
+    elif d6 == "3":
+        body = f"{d1}{d2}{d3}00000{d4}{d5}"
+    elif d6 == "4":
+        body = f"{d1}{d2}{d3}{d4}00000{d5}"
+    else:
+        body = f"{d1}{d2}{d3}{d4}{d5}0000{d6}"
+    upca = number_system + body
+    upca += check_digit(upca)
+    if check is not None and check != upca[-1]:
+        raise InvalidBarcode("UPC-E check digit mismatch")
+    return upca
+
+
+def to_gtin13(raw: str) -> str:
+    """Normalize a scanned code to a validated GTIN-13. Raises `InvalidBarcode`."""
+    code = _SEPARATORS.sub("", raw or "")
+    if not code.isdigit():
+        raise InvalidBarcode("Barcode must contain only numeric digits")
+
+    if len(code) > 14:
+        # Some scanners left-pad; anything beyond GTIN-14 must be padding
+        if code[:-14].strip("0"):
+            raise InvalidBarcode(f"Unsupported barcode length {len(code)}")
+        code = code[-14:]
+
+    if len(code) == 14:
+        if code[0] != "0":
+            # Indicator digit 1-8: a case/pallet GTIN, not a consumer unit
+            raise InvalidBarcode("GTIN-14 packaging codes are not supported")
+        code = code[1:]
+
+    if len(code) == 13:
+        gtin = code
+    elif len(code) == 12:
+        gtin = "0" + code
+    elif len(code) == 8:
+        if code[0] in "01":
+            try:
+                return "0" + expand_upce(code)
+            except InvalidBarcode:
+                pass
+        if not has_valid_check_digit(code):
+            raise InvalidBarcode("Check digit mismatch")
+        return code.zfill(13)
+    elif len(code) in (6, 7):
+        return "0" + expand_upce(code)
+    else:
+        raise InvalidBarcode(f"Unsupported barcode length {len(code)}")
+
+    if not has_valid_check_digit(gtin):
+        raise InvalidBarcode("Check digit mismatch")
+    return gtin
+
+
+def lookup_variants(gtin13: str) -> List[str]:
+    """Forms the same product may be stored under locally (GTIN-13, UPC-A, GTIN-14)."""
+    variants = [gtin13, "0" + gtin13]
+    if gtin13.startswith("0"):
+        variants.append(gtin13[1:])
+    return variants
@@ -0,0 +1,243 @@
+"""Health sync ingestion behind `/sync/batch` (write-behind through Redis Streams).
+
+The body is parsed as it arrives (`json_stream`), so its size does not matter:
+
+    {"device_source": "AppleHealth", "points": [{"timestamp": ..., "sensor_type": "Steps",
+                                                 "measurements": {"steps": 120}}, ...]}
+
+Top-level fields other than `points` must come before it. Every point is validated (`SyncPoint`;
+invalid points are counted and skipped), converted to the `health_metrics` time-series document
+bio_nexus uses (`{timestamp, metadata: {user_id, sensor_type, device_source}, measurements}`) and
+collected into chunks of `SYNC_CHUNK_POINTS`. Each chunk is pushed as one zlib-compressed JSON
+array onto the `ingest:health` stream as soon as it is full:
+
+    XADD ingest:health * batch_id <id> chunk <n> count <points> encoding zlib data <bytes>
+
+bio_worker inserts the chunk into `health_metrics` and counts it in the batch status hash
+(`ingest:batch:<id>`: status, points, rejected, chunks, processed_chunks, processed_points,
+failed_chunks, ...), which `/sync/batch/{batch_id}` reads. The batch is `queued` once the body has
+been read and `done` when the worker has processed every chunk. A body that turns out invalid
+part-way fails the batch, but chunks pushed before stay queued; a chunk the worker cannot insert
+fails it too. A failed batch is finished once every pushed chunk was processed or failed.
+
+Derived state only changes once the points are in `health_metrics`: the metric rollups keep the
+batch's days pending until `finished()` says so, and the dashboard reloads the user's state when the
+API first sees the batch done (`claim_completion()`).
+"""
+import json
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterable, Iterable, List, Optional, Set
+
+from pydantic import ValidationError
+
+from app.config import SYNC_CHUNK_POINTS, SYNC_MAX_POINT_BYTES, SYNC_MAX_POINTS, SYNC_STATUS_TTL_S
+from app.db.redis_client import get_redis
+from app.schemas import SyncBatchStatus, SyncPoint
+from app.services.json_stream import JSONStreamError, iter_object
+
+STREAM_KEY = "ingest:health"
+# Validation errors kept in the batch status
+MAX_ERRORS = 10
+# Samples this far in the future are rejected (device clocks drift)
+MAX_CLOCK_SKEW = timedelta(minutes=10)
+
+
+class IngestUnavailable(Exception):
+    pass
+
+
+class BatchRejected(ValueError):
+    """The body was not a valid batch; `result` is what was queued before the problem was found."""
+
+    def __init__(self, message: str, result: "Ingested"):
+        super().__init__(message)
+        self.result = result
+
+    @property
+    def status(self) -> SyncBatchStatus:
+        return self.result.status
+
+
+def status_key(batch_id: str) -> str:
+    return f"ingest:batch:{batch_id}"
+
+
+@dataclass
+class Ingested:
+    status: SyncBatchStatus
+    # Days (YYYY-MM-DD) with accepted points
+    days: Set[str] = field(default_factory=set)
+
+
+def _utc(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+
+def _error(errors: List[str], index: int, message: str) -> None:
+    if len(errors) < MAX_ERRORS:
+        errors.append(f"points[{index}]: {message}")
+
+
+async def ingest(chunks: AsyncIterable[bytes], user_id: str, batch_id: str) -> Ingested:
+    """Validate, chunk and queue the points of a sync body read from `chunks`."""
+    redis = get_redis()
+    if redis is None:
+        raise IngestUnavailable("Health sync needs Redis (REDIS_URL)")
+
+    key = status_key(batch_id)
+    result = Ingested(SyncBatchStatus(batch_id=batch_id, status="receiving", received_at=datetime.utcnow()))
+    status = result.status
+    await redis.hset(key, mapping={
+        "user_id": user_id,
+        "status": status.status,
+        "received_at": status.received_at.isoformat(),
+    })
+    await redis.expire(key, SYNC_STATUS_TTL_S)
+
+    pending: List[dict] = []
+
+    async def push() -> None:
+        data = zlib.compress(json.dumps(pending, separators=(",", ":")).encode())
+        await redis.xadd(STREAM_KEY, {
+            "batch_id": batch_id,
+            "chunk": status.chunks,
+            "count": len(pending),
+            "encoding": "zlib",
+            "data": data,
+        })
+        status.chunks += 1
+        status.points += len(pending)
+        pending.clear()
+
+    device_source = None
+    latest = datetime.utcnow() + MAX_CLOCK_SKEW
+    index = -1
+    try:
+        async for kind, name, value in iter_object(chunks, "points", max_value_bytes=SYNC_MAX_POINT_BYTES):
+            if kind == "field":
+                if name == "device_source" and isinstance(value, str):
+                    device_source = value
+                continue
+            index += 1
+            if index >= SYNC_MAX_POINTS:
+                raise JSONStreamError(f"More than {SYNC_MAX_POINTS} points in one batch")
+            try:
+                point = SyncPoint.model_validate(value)
+            except ValidationError as e:
+                status.rejected += 1
+                first = e.errors()[0]
+                _error(status.errors, index, f"{'.'.join(map(str, first['loc'])) or 'point'}: {first['msg']}")
+                continue
+            timestamp = _utc(point.timestamp)
+            if timestamp > latest:
+                status.rejected += 1
+                _error(status.errors, index, "timestamp is in the future")
+                continue
+
+            metadata = {"user_id": user_id, "sensor_type": point.sensor_type}
+            if point.device_source or device_source:
+                metadata["device_source"] = point.device_source or device_source
+            pending.append({"timestamp": timestamp.isoformat(), "metadata": metadata, "measurements": point.measurements})
+            result.days.add(timestamp.date().isoformat())
+            if len(pending) >= SYNC_CHUNK_POINTS:
+                await push()
+        if pending:
+            await push()
+    except JSONStreamError as e:
+        status.status = "failed"
+        status.errors.insert(0, str(e))
+        await _save(redis, key, status)
+        await _read_progress(redis, key, status)
+        raise BatchRejected(str(e), result) from e
+
+    status.status = "queued"
+    await _save(redis, key, status)
+    # The worker marks the batch done after its last chunk (or failed), unless it got there before
+    # `chunks` was known
+    await _read_progress(redis, key, status)
+    if status.failed_chunks:
+        status.status = "failed"
+        await redis.hset(key, "status", "failed")
+    elif status.processed_chunks >= status.chunks:
+        status.status = "done"
+        await redis.hset(key, "status", "done")
+    return result
+
+
+def is_finished(status: SyncBatchStatus) -> bool:
+    """Whether the worker is through with the batch: every chunk inserted (done), or failed with
+    every pushed chunk processed or failed."""
+    if status.status == "done":
+        return True
+    return status.status == "failed" and status.processed_chunks + status.failed_chunks >= status.chunks
+
+
+async def finished(batch_ids: Iterable[str]) -> Set[str]:
+    """The batches among `batch_ids` the worker is through with (`is_finished()`), or expired."""
+    batch_ids = list(batch_ids)
+    redis = get_redis()
+    if redis is None or not batch_ids:
+        return set(batch_ids)
+    async with redis.pipeline(transaction=False) as pipe:
+        for batch_id in batch_ids:
+            pipe.hmget(status_key(batch_id), "status", "chunks", "processed_chunks", "failed_chunks")
+        rows = await pipe.execute()
+    done = set()
+    for batch_id, (status, chunks, processed, failed) in zip(batch_ids, rows):
+        if status is None or is_finished(SyncBatchStatus(
+            batch_id=batch_id,
+            status=status.decode(),
+            chunks=int(chunks or 0),
+            processed_chunks=int(processed or 0),
+            failed_chunks=int(failed or 0),
+        )):
+            done.add(batch_id)
+    return done
+
+
+async def claim_completion(batch_id: str) -> bool:
+    """True for the first caller after the batch is finished (its completion is handled once)."""
+    redis = get_redis()
+    if redis is None:
+        return False
+    return bool(await redis.hsetnx(status_key(batch_id), "completion_claimed", 1))
+
+
+async def _read_progress(redis, key: str, status: SyncBatchStatus) -> None:
+    processed, points, failed = await redis.hmget(key, "processed_chunks", "processed_points", "failed_chunks")
+    status.processed_chunks = int(processed or 0)
+    status.processed_points = int(points or 0)
+    status.failed_chunks = int(failed or 0)
+
+
+async def _save(redis, key: str, status: SyncBatchStatus) -> None:
+    await redis.hset(key, mapping={
+        "status": status.status,
+        "points": status.points,
+        "rejected": status.rejected,
+        "chunks": status.chunks,
+        "errors": json.dumps(status.errors),
+    })
+
+
+async def get_status(batch_id: str, user_id: str) -> Optional[SyncBatchStatus]:
+    redis = get_redis()
+    if redis is None:
+        raise IngestUnavailable("Health sync needs Redis (REDIS_URL)")
+    fields = {k.decode(): v.decode() for k, v in (await redis.hgetall(status_key(batch_id))).items()}
+    if not fields or fields.get("user_id") != user_id:
+        return None
+    return SyncBatchStatus(
+        batch_id=batch_id,
+        status=fields["status"],
+        points=int(fields.get("points", 0)),
+        rejected=int(fields.get("rejected", 0)),
+        chunks=int(fields.get("chunks", 0)),
+        processed_chunks=int(fields.get("processed_chunks", 0)),
+        processed_points=int(fields.get("processed_points", 0)),
+        failed_chunks=int(fields.get("failed_chunks", 0)),
+        errors=json.loads(fields.get("errors", "[]")),
+        received_at=fields.get("received_at"),
+    )
@@ -0,0 +1,182 @@
+"""Process-pool inference service for the food scan pipeline (`detect_food.py`).
+
+Segmentation, depth estimation and the nutrient fan-out are CPU-heavy and blocking, so they run in
+worker processes that keep the models resident. The API process only tracks admission:
+
+- at most `workers + queue_size` scans are accepted at once; beyond that `InferenceSaturated` is
+  raised (the router answers 429);
+- every scan carries a deadline; queued scans past their deadline are dropped without running.
+"""
+import asyncio
+import logging
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.config import (
+    BASE_DIR,
+    INFERENCE_ENABLED,
+    INFERENCE_WORKERS,
+    INFERENCE_QUEUE_SIZE,
+    INFERENCE_TIMEOUT_S,
+)
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_QUEUE_DEPTH = Gauge("bio_ai_inference_queue_depth", "Scans admitted to the inference pool (queued + running)")
+INFERENCE_SECONDS = Histogram(
+    "bio_ai_inference_seconds",
+    "Time spent running a scan inside an inference worker",
+    buckets=(0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+INFERENCE_LATENCY_SECONDS = Histogram(
+    "bio_ai_inference_latency_seconds",
+    "End-to-end scan latency seen by the API, including queueing",
+    buckets=(0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+INFERENCE_REJECTED = Counter("bio_ai_inference_rejected_total", "Scans that did not complete", ["reason"])
+
+
+class InferenceError(RuntimeError):
+    pass
+
+
+class InferenceUnavailable(InferenceError):
+    pass
+
+
+class InferenceSaturated(InferenceError):
+    pass
+
+
+class InferenceTimeout(InferenceError):
+    pass
+
+
+# --- Worker process side ---------------------------------------------------
+
+_scanner = None
+
+
+def _init_worker():
+    """Load and warm the models once per worker process."""
+    global _scanner
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    import detect_food
+
+    detect_food.get_registry().warmup()
+    _scanner = detect_food.NutrientScanner()
+
+
+def _run_scan(image_bytes: bytes, deadline: float) -> dict:
+    """Run one scan in a worker. Returns plain, picklable data (no crops or composite)."""
+    if time.time() > deadline:
+        return {"expired": True}
+
+    import detect_food
+
+    start = time.perf_counter()
+    result = detect_food.process_and_extract(image_bytes)
+    items = [item for item in (result.items if result else []) if item["image_name"] != "item_rest.png"]
+    analyses = []
+    if items and _scanner is not None:
+        remaining = max(deadline - time.time(), 1.0)
+        analyses = asyncio.run(_scanner.analyze_items(items, timeout=min(_scanner.timeout, remaining)))
+    return {
+        "items": items,
+        "analyses": analyses,
+        "elapsed_s": time.perf_counter() - start,
+    }
+
+
+# --- API process side --------------------------------------------------------
+
+class InferenceService:
+    def __init__(self, workers: int = INFERENCE_WORKERS, queue_size: int = INFERENCE_QUEUE_SIZE, timeout_s: float = INFERENCE_TIMEOUT_S):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.timeout_s = timeout_s
+        self._executor: ProcessPoolExecutor | None = None
+        self._admitted = 0
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    def start(self):
+        if self._executor is None:
+            # spawn: never fork the event loop / Mongo client into the workers
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            logger.info("Inference pool started (workers=%s, capacity=%s)", self.workers, self.capacity)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _release(self, _future=None):
+        self._admitted -= 1
+        INFERENCE_QUEUE_DEPTH.set(self._admitted)
+
+    async def scan(self, image_bytes: bytes, timeout_s: float | None = None) -> dict:
+        """Run the pipeline on `image_bytes` in the pool, honouring capacity and the deadline."""
+        if self._executor is None:
+            raise InferenceUnavailable("Inference service is not running")
+        if self._admitted >= self.capacity:
+            INFERENCE_REJECTED.labels("saturated").inc()
+            raise InferenceSaturated("Inference queue is full")
+
+        timeout_s = timeout_s or self.timeout_s
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            future = self._executor.submit(_run_scan, image_bytes, time.time() + timeout_s)
+        except BrokenProcessPool:
+            self.shutdown()
+            self.start()
+            INFERENCE_REJECTED.labels("worker_crash").inc()
+            raise InferenceUnavailable("Inference workers crashed; pool restarted")
+
+        # The slot is held until the worker is really done, even if the caller gave up on it
+        self._admitted += 1
+        INFERENCE_QUEUE_DEPTH.set(self._admitted)
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._release, f))
+
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout_s)
+        except asyncio.TimeoutError:
+            INFERENCE_REJECTED.labels("timeout").inc()
+            raise InferenceTimeout(f"Scan exceeded {timeout_s:g}s")
+        except BrokenProcessPool:
+            self.shutdown()
+            self.start()
+            INFERENCE_REJECTED.labels("worker_crash").inc()
+            raise InferenceUnavailable("Inference workers crashed; pool restarted")
+
+        if result.get("expired"):
+            INFERENCE_REJECTED.labels("timeout").inc()
+            raise InferenceTimeout(f"Scan waited longer than {timeout_s:g}s for a worker")
+
+        INFERENCE_SECONDS.observe(result["elapsed_s"])
+        INFERENCE_LATENCY_SECONDS.observe(time.perf_counter() - start)
+        return result
+
+
+_service: InferenceService | None = None
+
+
+def get_inference_service() -> InferenceService | None:
+    """The app-wide service, or None when inference is disabled (INFERENCE_ENABLED=false)."""
+    global _service
+    if _service is None and INFERENCE_ENABLED:
+        _service = InferenceService()
+    return _service
@@ -0,0 +1,76 @@
+"""Per-request stage timing and sampled debug dumps for the vision endpoints.
+
+    trace = RequestTrace("barcode")
+    with trace.stage("upstream"):
+        result = await client.request(...)
+    trace.dump("fatsecret_response", result)
+    trace.finish(status="ok")
+
+Every stage is observed into the `bio_ai_vision_stage_seconds{endpoint,stage}` histogram. Full
+payload dumps are the expensive part (serializing upstream JSON), so they only happen for a random
+`VISION_DEBUG_SAMPLE_RATE` fraction of requests (0 = never, the default). The per-request summary is
+a single structured log line at DEBUG level.
+"""
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+from prometheus_client import Histogram
+
+from app.config import VISION_DEBUG_SAMPLE_RATE
+
+logger = logging.getLogger("bio_ai.vision")
+
+VISION_STAGE_SECONDS = Histogram(
+    "bio_ai_vision_stage_seconds",
+    "Time spent per stage of the vision endpoints (decode, resize, base64, upstream, parse, ...)",
+    ["endpoint", "stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+
+class RequestTrace:
+    def __init__(self, endpoint: str, sample_rate: float = VISION_DEBUG_SAMPLE_RATE):
+        self.endpoint = endpoint
+        self.stages: Dict[str, float] = {}
+        # Decided once per request so all dumps of a sampled request are kept together
+        self.sampled = sample_rate > 0 and random.random() < sample_rate
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            VISION_STAGE_SECONDS.labels(self.endpoint, name).observe(elapsed)
+
+    def dump(self, label: str, payload: Any):
+        """Log a full payload, only for sampled requests."""
+        if self.sampled:
+            logger.info(
+                "%s",
+                json.dumps({"endpoint": self.endpoint, "dump": label, "payload": payload}, ensure_ascii=False, default=str),
+            )
+
+    def finish(self, **fields):
+        total = time.perf_counter() - self._start
+        VISION_STAGE_SECONDS.labels(self.endpoint, "total").observe(total)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "%s",
+                json.dumps(
+                    {
+                        "endpoint": self.endpoint,
+                        "total_ms": round(total * 1000, 2),
+                        "stages_ms": {k: round(v * 1000, 2) for k, v in self.stages.items()},
+                        **fields,
+                    },
+                    default=str,
+                ),
+            )
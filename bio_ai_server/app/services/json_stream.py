@@ -0,0 +1,115 @@
+"""Incremental parsing of a JSON object with one large array, from a stream of byte chunks.
+
+    async for kind, key, value in iter_object(request.stream(), array_key="points"):
+        # ("field", "device_source", "AppleHealth") for the other top-level keys
+        # ("item", "points", {...}) for each element of body["points"]
+
+Only the current element is held in memory (plus the unparsed tail of the last chunk), so a body
+with hundreds of thousands of points is processed in constant memory. Elements are decoded with
+`json.JSONDecoder.raw_decode` once they are complete in the buffer; an element (or other value)
+larger than `max_value_bytes` is rejected instead of being buffered indefinitely.
+"""
+import codecs
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Optional, Tuple
+
+_WHITESPACE = " \t\n\r"
+_decoder = json.JSONDecoder()
+
+
+class JSONStreamError(ValueError):
+    pass
+
+
+class _Buffer:
+    def __init__(self, chunks: AsyncIterable[bytes], max_value_bytes: int):
+        self._chunks = chunks.__aiter__()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.max_value_bytes = max_value_bytes
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    async def fill(self) -> bool:
+        """Append the next chunk; False at the end of the stream."""
+        if self.eof:
+            return False
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            chunk, self.eof = b"", True
+        # Drop what was consumed; what is left is the start of a single value
+        pending = self.text[self.pos:]
+        if len(pending) > self.max_value_bytes:
+            raise JSONStreamError(f"JSON value larger than {self.max_value_bytes} bytes")
+        try:
+            self.text = pending + self._utf8.decode(chunk, final=self.eof)
+        except UnicodeDecodeError as e:
+            raise JSONStreamError("Body is not valid UTF-8") from e
+        self.pos = 0
+        return not self.eof
+
+    async def peek(self) -> str:
+        """Next non-whitespace character ("" at the end of the stream)."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not await self.fill():
+                return ""
+
+    async def expect(self, chars: str) -> str:
+        char = await self.peek()
+        if not char or char not in chars:
+            found = repr(char) if char else "end of body"
+            raise JSONStreamError(f"Expected one of {chars!r}, found {found}")
+        self.pos += 1
+        return char
+
+    async def value(self) -> Any:
+        await self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError as e:
+                if not await self.fill():
+                    raise JSONStreamError(f"Invalid JSON: {e.msg}") from e
+                continue
+            # A number (or literal) at the very end of the buffer may continue in the next chunk
+            if end == len(self.text) and not self.eof and self.text[end - 1] not in '}]"':
+                await self.fill()
+                continue
+            self.pos = end
+            return value
+
+
+async def iter_object(
+    chunks: AsyncIterable[bytes], array_key: str, max_value_bytes: int = 1 << 16
+) -> AsyncIterator[Tuple[str, Optional[str], Any]]:
+    """Yield ("field", key, value) for top-level keys and ("item", array_key, value) per element of `array_key`."""
+    buffer = _Buffer(chunks, max_value_bytes)
+    await buffer.expect("{")
+    if await buffer.peek() == "}":
+        buffer.pos += 1
+    else:
+        while True:
+            key = await buffer.value()
+            if not isinstance(key, str):
+                raise JSONStreamError("Expected an object key")
+            await buffer.expect(":")
+            if key == array_key and await buffer.peek() == "[":
+                buffer.pos += 1
+                if await buffer.peek() == "]":
+                    buffer.pos += 1
+                else:
+                    while True:
+                        yield "item", key, await buffer.value()
+                        if await buffer.expect(",]") == "]":
+                            break
+            else:
+                yield "field", key, await buffer.value()
+            if await buffer.expect(",}") == "}":
+                break
+    if await buffer.peek():
+        raise JSONStreamError("Unexpected data after the JSON object")
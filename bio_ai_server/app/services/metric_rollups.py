@@ -0,0 +1,293 @@
+"""Per-user daily and weekly metric rollups behind `/analytics/metrics/history`.
+
+Raw points live in three places: timeline entries (`analytics_entries`), device samples written by
+bio_worker / bio_nexus (`health_metrics`, a time-series collection in their database, see
+`get_health_db()`) and the per-day
+`daily_metrics` documents. `refresh()` `$group`s them by day into
+
+    metric_rollups_daily   {_id: "<user>:<metric>:<date>", user_id, metric, date, week, value, updated_at}
+    metric_rollups_weekly  {_id: "<user>:<metric>:<week>", user_id, metric, week, value, min, max, total, days, updated_at}
+
+where `value` is the day's sum or mean (see `METRICS`) and a week's `value` is the mean of its days
+(weeks start on Monday). History reads are then one indexed range read on a rollup collection,
+whatever the period.
+
+Rollups are refreshed lazily, per user, by `ensure_fresh()` before a read:
+
+- days outside the range already rolled up for the user (`metric_rollup_state`);
+- days whose `daily_totals` changed since the last check, i.e. entries written, edited or deleted;
+- days passed to `invalidate()` (e.g. backfilled device data); days of a `/sync/batch` batch only
+  once bio_worker has inserted its points (`health_sync.finished()`), so a read in between does
+  not settle them without the new samples;
+- the last `METRIC_ROLLUP_SETTLE_DAYS` days, which device syncs may still be filling in, at most
+  once every `METRIC_ROLLUP_SETTLE_INTERVAL_S` (`settled_at`).
+
+When none of these apply, a read costs the state lookup and the change check before the range read.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+
+from app.config import METRIC_ROLLUP_SETTLE_DAYS, METRIC_ROLLUP_SETTLE_INTERVAL_S
+from app.db.mongodb import get_health_db
+from app.services import health_sync
+
+
+@dataclass(frozen=True)
+class MetricSpec:
+    # "entries" (analytics_entries), "health" (health_metrics) or "daily" (daily_metrics)
+    source: str
+    # Entry type / sensor type the metric is read from (unused for "daily")
+    kind: Optional[str]
+    # Aggregation expression for the raw value
+    value: str
+    # "sum" (intake, burn, steps) or "mean" (scores, HRV)
+    reduce: str = "sum"
+    # Daily target used for `percentage` and the goal achievement rate
+    goal: Optional[float] = None
+
+
+METRICS: Dict[str, MetricSpec] = {
+    "calorie_intake": MetricSpec("entries", "MEAL", "$value", goal=2300),
+    "protein_intake": MetricSpec("entries", "MEAL", "$metadata.protein", goal=140),
+    "carb_intake": MetricSpec("entries", "MEAL", "$metadata.carbs", goal=250),
+    "fat_intake": MetricSpec("entries", "MEAL", "$metadata.fat", goal=75),
+    "active_burn": MetricSpec("entries", "EXERCISE", "$value"),
+    "hydration": MetricSpec("entries", "HYDRATION", "$value", goal=2500),
+    "sleep_quality": MetricSpec("entries", "SLEEP", "$value", reduce="mean"),
+    "steps": MetricSpec("health", "Steps", "$measurements.steps", goal=10000),
+    "hrv_stress": MetricSpec("health", "HR", "$measurements.hrv", reduce="mean"),
+    "mood": MetricSpec("health", "Mood", "$measurements.mood", reduce="mean"),
+    "energy_score": MetricSpec("daily", None, "$energy_score.value", reduce="mean"),
+}
+
+
+def week_of(day: str) -> str:
+    """Monday of the ISO week containing `day` (YYYY-MM-DD)."""
+    d = date.fromisoformat(day)
+    return (d - timedelta(days=d.weekday())).isoformat()
+
+
+def _day_range(start: str, end: str) -> List[str]:
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    return [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+
+
+def _spans(days: Iterable[str]) -> List[Tuple[str, str]]:
+    """Coalesce days into contiguous (start, end) spans."""
+    spans: List[List[date]] = []
+    for d in sorted({date.fromisoformat(day) for day in days}):
+        if spans and d - spans[-1][1] == timedelta(days=1):
+            spans[-1][1] = d
+        else:
+            spans.append([d, d])
+    return [(a.isoformat(), b.isoformat()) for a, b in spans]
+
+
+def _group_stage(source: str, kind_field: Optional[str], day_expr) -> dict:
+    """`$group` by day with a (sum, count) pair for every metric read from `source`."""
+    group = {"_id": day_expr}
+    for name, spec in METRICS.items():
+        if spec.source != source:
+            continue
+        matches = {"$eq": [kind_field, spec.kind]} if kind_field else True
+        group[f"{name}__sum"] = {"$sum": {"$cond": [matches, spec.value, 0]}}
+        group[f"{name}__n"] = {"$sum": {"$cond": [{"$and": [matches, {"$isNumber": spec.value}]}, 1, 0]}}
+    return {"$group": group}
+
+
+async def _collect(db, user_id: str, start: str, end: str) -> Dict[Tuple[str, str], float]:
+    """(metric, date) -> the day's value, for every metric with samples between start and end."""
+    start_ts = datetime.fromisoformat(start)
+    end_ts = datetime.fromisoformat(end) + timedelta(days=1)
+    pipelines = [
+        (db.analytics_entries, "entries", [
+            {"$match": {"user_id": user_id, "date": {"$gte": start, "$lte": end}, "is_deleted": False}},
+            _group_stage("entries", "$type", "$date"),
+        ]),
+        (get_health_db().health_metrics, "health", [
+            {"$match": {
+                "metadata.user_id": user_id,
+                "metadata.sensor_type": {"$in": sorted({s.kind for s in METRICS.values() if s.source == "health"})},
+                "timestamp": {"$gte": start_ts, "$lt": end_ts},
+            }},
+            _group_stage("health", "$metadata.sensor_type", {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}}),
+        ]),
+        (db.daily_metrics, "daily", [
+            {"$match": {"user_id": user_id, "date": {"$gte": start, "$lte": end}}},
+            _group_stage("daily", None, "$date"),
+        ]),
+    ]
+    values = {}
+    for coll, source, pipeline in pipelines:
+        async for row in coll.aggregate(pipeline):
+            for name, spec in METRICS.items():
+                n = row.get(f"{name}__n", 0) if spec.source == source else 0
+                if n:
+                    total = row[f"{name}__sum"]
+                    values[(name, row["_id"])] = total if spec.reduce == "sum" else total / n
+    return values
+
+
+async def refresh(db, user_id: str, start: str, end: str) -> int:
+    """Recompute the daily rollups of [start, end] and the weekly rollups of the weeks touching it."""
+    values = await _collect(db, user_id, start, end)
+    now = datetime.utcnow()
+    ops = [
+        UpdateOne(
+            {"_id": f"{user_id}:{metric}:{day}"},
+            {"$set": {
+                "user_id": user_id, "metric": metric, "date": day, "week": week_of(day),
+                "value": value, "updated_at": now,
+            }},
+            upsert=True,
+        )
+        for (metric, day), value in values.items()
+    ]
+    if ops:
+        await db.metric_rollups_daily.bulk_write(ops, ordered=False)
+    # Days in range that were not rewritten have no samples left
+    await db.metric_rollups_daily.delete_many({
+        "user_id": user_id, "date": {"$gte": start, "$lte": end}, "updated_at": {"$lt": now},
+    })
+
+    weeks = _day_range(week_of(start), week_of(end))[::7]
+    await db.metric_rollups_daily.aggregate([
+        {"$match": {"user_id": user_id, "week": {"$in": weeks}}},
+        {"$group": {
+            "_id": {"metric": "$metric", "week": "$week"},
+            "value": {"$avg": "$value"},
+            "min": {"$min": "$value"},
+            "max": {"$max": "$value"},
+            "total": {"$sum": "$value"},
+            "days": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": {"$concat": [{"$literal": user_id}, ":", "$_id.metric", ":", "$_id.week"]},
+            "user_id": {"$literal": user_id},
+            "metric": "$_id.metric",
+            "week": "$_id.week",
+            "value": 1, "min": 1, "max": 1, "total": 1, "days": 1,
+            "updated_at": {"$literal": now},
+        }},
+        {"$merge": {"into": "metric_rollups_weekly", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]).to_list(length=None)
+    await db.metric_rollups_weekly.delete_many({"user_id": user_id, "week": {"$in": weeks}, "updated_at": {"$lt": now}})
+    return len(values)
+
+
+async def invalidate(db, user_id: str, days: Iterable[str], batch_id: Optional[str] = None) -> None:
+    """
+    Mark days whose raw points changed outside the entry API (recomputed on the next read). With
+    `batch_id` (a queued `/sync/batch` batch) they stay pending until the batch is finished.
+    """
+    days = sorted(set(days))
+    if not days:
+        return
+    if batch_id is not None:
+        update = {"$push": {"pending": {"batch_id": batch_id, "days": days}}}
+    else:
+        update = {"$addToSet": {"dirty": {"$each": days}}}
+    await db.metric_rollup_state.update_one({"_id": user_id}, update, upsert=True)
+
+
+async def ensure_fresh(db, user_id: str, start: str, end: str, today: Optional[str] = None) -> None:
+    """Bring the rollups of [start, end] up to date (see the module docstring)."""
+    checked_at = datetime.utcnow()
+    state = await db.metric_rollup_state.find_one({"_id": user_id}) or {}
+    stale = set()
+
+    covered_from, covered_to = state.get("from"), state.get("to")
+    if covered_from is None:
+        stale.update(_day_range(start, end))
+    else:
+        # Extend the covered range contiguously, gap included
+        if start < covered_from:
+            stale.update(_day_range(start, covered_from))
+        if end > covered_to:
+            stale.update(_day_range(covered_to, end))
+
+    if state.get("checked_at"):
+        async for doc in db.daily_totals.find(
+            {"user_id": user_id, "updated_at": {"$gte": state["checked_at"]}}, {"date": 1}
+        ):
+            stale.add(doc["date"])
+    dirty = state.get("dirty", [])
+    stale.update(dirty)
+    pending = state.get("pending", [])
+    finished = await health_sync.finished(batch["batch_id"] for batch in pending) if pending else set()
+    for batch in pending:
+        if batch["batch_id"] in finished:
+            stale.update(batch["days"])
+
+    # Days outside the covered range are rolled up once a read reaches them
+    low, high = min(start, covered_from or start), max(end, covered_to or end)
+
+    today = today or checked_at.date().isoformat()
+    settle_from = (date.fromisoformat(today) - timedelta(days=METRIC_ROLLUP_SETTLE_DAYS - 1)).isoformat()
+    settled_at = state.get("settled_at")
+    settle = end >= settle_from and (
+        settled_at is None or (checked_at - settled_at).total_seconds() >= METRIC_ROLLUP_SETTLE_INTERVAL_S
+    )
+    if settle:
+        stale.update(_day_range(max(low, settle_from), high))
+
+    for span_start, span_end in _spans(d for d in stale if low <= d <= high):
+        await refresh(db, user_id, span_start, span_end)
+
+    if not stale and covered_from is not None:
+        # Nothing changed since checked_at, which can stay where it is
+        return
+    update = {
+        "$set": {"checked_at": checked_at},
+        "$min": {"from": start},
+        "$max": {"to": end},
+    }
+    if settle:
+        update["$set"]["settled_at"] = checked_at
+    if dirty:
+        update["$pull"] = {"dirty": {"$in": dirty}}
+    if finished:
+        update.setdefault("$pull", {})["pending"] = {"batch_id": {"$in": sorted(finished)}}
+    await db.metric_rollup_state.update_one({"_id": user_id}, update, upsert=True)
+
+
+@dataclass
+class History:
+    dates: List[str]
+    values: np.ndarray
+    goal: Optional[float]
+
+    def percentages(self) -> Optional[np.ndarray]:
+        return None if not self.goal else np.round(self.values / self.goal * 100, 1)
+
+    def statistics(self) -> dict:
+        if not self.values.size:
+            return {"average": 0.0, "min": 0.0, "max": 0.0, "goal_achievement_rate": None}
+        return {
+            "average": round(float(self.values.mean()), 1),
+            "min": round(float(self.values.min()), 1),
+            "max": round(float(self.values.max()), 1),
+            "goal_achievement_rate": round(float(np.mean(self.values >= self.goal)), 2) if self.goal else None,
+        }
+
+
+async def get_history(db, user_id: str, metric: str, start: str, end: str, granularity: str = "day") -> History:
+    """Rollup values of `metric` between start and end: one point per day, or per week (by Monday)."""
+    await ensure_fresh(db, user_id, start, end)
+    if granularity == "week":
+        coll, key, low = db.metric_rollups_weekly, "week", week_of(start)
+    else:
+        coll, key, low = db.metric_rollups_daily, "date", start
+    docs = await coll.find(
+        {"user_id": user_id, "metric": metric, key: {"$gte": low, "$lte": end}},
+        {"_id": 0, key: 1, "value": 1},
+    ).sort(key, 1).to_list(length=None)
+    return History(
+        dates=[doc[key] for doc in docs],
+        values=np.fromiter((doc["value"] for doc in docs), dtype=np.float64, count=len(docs)),
+        goal=METRICS[metric].goal,
+    )
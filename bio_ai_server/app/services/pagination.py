@@ -0,0 +1,65 @@
+"""Keyset (cursor) pagination.
+
+A page is read with `find(scope + after(sort, last)).sort(sort).limit(n + 1)` on an index that
+matches `sort`, so every page costs one index seek however deep it is. The sort must end with a
+unique field (`_id`) so the position is unambiguous; the client gets the position of the last
+document back as an opaque cursor.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+Sort = List[Tuple[str, int]]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values: Dict[str, Any]) -> str:
+    def default(value):
+        if isinstance(value, datetime):
+            return {"$dt": value.isoformat()}
+        raise TypeError(f"Cannot encode {type(value).__name__} in a cursor")
+
+    raw = json.dumps(values, default=default, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    def hook(obj):
+        return datetime.fromisoformat(obj["$dt"]) if set(obj) == {"$dt"} else obj
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw, object_hook=hook)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Malformed cursor") from e
+    if not isinstance(values, dict):
+        raise InvalidCursor("Malformed cursor")
+    return values
+
+
+def after(sort: Sort, values: Sequence) -> dict:
+    """
+    Filter for documents strictly after `values` (one per sort field) in `sort` order.
+
+    The leading field also gets a plain range bound, so the planner scans the index from the
+    cursor position instead of evaluating the `$or` branches separately.
+    """
+    first, direction = sort[0]
+    branches = []
+    for i, (field, field_direction) in enumerate(sort):
+        branch = {f: v for (f, _), v in zip(sort[:i], values[:i])}
+        branch[field] = {"$gt" if field_direction == 1 else "$lt": values[i]}
+        branches.append(branch)
+    return {first: {"$gte" if direction == 1 else "$lte": values[0]}, "$or": branches}
+
+
+def page(docs: List[dict], limit: int, cursor_of) -> Tuple[List[dict], Optional[str]]:
+    """Split a `limit + 1` read into the page and the cursor of the next one (None on the last page)."""
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(cursor_of(docs[-1]))
@@ -0,0 +1,144 @@
+"""Image preprocessing for FatSecret image recognition (shared by /vision/recognize and /vision/upload).
+
+FatSecret wants a base64 JPEG of at most `MAX_SIDE` px. The path avoids full-size intermediates:
+
+- small JPEG uploads (<= `MAX_SIDE` px, <= `PASSTHROUGH_MAX_BYTES`) are sent as-is, with no decode
+  or re-encode at all;
+- larger JPEGs are decoded in draft mode, so libjpeg scales by 1/2, 1/4 or 1/8 during the DCT and
+  never materializes the full-resolution bitmap;
+- in-memory uploads are read through a memoryview instead of being copied into a `BytesIO`;
+- the JPEG is encoded into a per-thread reusable buffer and base64-encoded straight from a
+  memoryview of it; the result stays `bytes` (see `FatSecretClient.recognize`).
+
+`tools/bench_preprocess.py` compares this against the previous open/convert/thumbnail/BytesIO path.
+"""
+import base64
+import io
+import os
+import threading
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Tuple, Union
+
+from PIL import Image
+
+MAX_SIDE = 512
+JPEG_QUALITY = 85
+PASSTHROUGH_MAX_BYTES = 256 * 1024
+
+ImageSource = Union[bytes, bytearray, memoryview, str, os.PathLike]
+
+_local = threading.local()
+
+
+class _MemoryReader(io.RawIOBase):
+    """Seekable read-only file over a buffer, so PIL reads the upload without a full copy."""
+
+    def __init__(self, data):
+        self.view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self.view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def read(self, size=-1):
+        end = len(self.view) if size is None or size < 0 else min(self._pos + size, len(self.view))
+        chunk = self.view[self._pos:end].tobytes()
+        self._pos = end
+        return chunk
+
+    def close(self):
+        if not self.closed:
+            self.view.release()
+        super().close()
+
+    def readinto(self, b):
+        n = min(len(b), len(self.view) - self._pos)
+        b[:n] = self.view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+
+@dataclass
+class PreparedImage:
+    b64: bytes
+    size: Tuple[int, int]
+    # True when the upload was forwarded without decoding / re-encoding
+    passthrough: bool
+    jpeg_bytes: int
+    # Size of the decoded bitmap (0 on passthrough), for the benchmark
+    decoded_bytes: int = 0
+
+
+def _encode_buffer() -> io.BytesIO:
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None:
+        buffer = _local.buffer = io.BytesIO()
+    buffer.seek(0)
+    buffer.truncate()
+    return buffer
+
+
+def _stage(trace, name):
+    return trace.stage(name) if trace is not None else nullcontext()
+
+
+def prepare_for_recognition(source: ImageSource, trace=None, max_side: int = MAX_SIDE, quality: int = JPEG_QUALITY) -> PreparedImage:
+    """Return the base64 JPEG FatSecret expects for `source` (raw bytes or a file path)."""
+    if isinstance(source, (str, os.PathLike)):
+        fp = open(source, "rb")
+        size_bytes = os.fstat(fp.fileno()).st_size
+    else:
+        fp = _MemoryReader(source)
+        size_bytes = len(fp.view)
+
+    with fp:
+        with _stage(trace, "decode"):
+            # Only the header is parsed here
+            img = Image.open(fp)
+            passthrough = (
+                img.format == "JPEG"
+                and max(img.size) <= max_side
+                and size_bytes <= PASSTHROUGH_MAX_BYTES
+                and img.mode in ("RGB", "L")
+            )
+            if not passthrough:
+                # JPEG only: pick the smallest DCT scale that still covers max_side
+                img.draft("RGB", (max_side, max_side))
+                img.load()
+                if img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+
+        if passthrough:
+            with _stage(trace, "base64"):
+                if isinstance(fp, _MemoryReader):
+                    raw = fp.view
+                else:
+                    fp.seek(0)
+                    raw = fp.read()
+                return PreparedImage(base64.b64encode(raw), img.size, True, len(raw))
+
+        decoded_bytes = img.width * img.height * len(img.getbands())
+        with _stage(trace, "resize"):
+            img.thumbnail((max_side, max_side))
+
+    with _stage(trace, "encode"):
+        buffer = _encode_buffer()
+        img.save(buffer, format="JPEG", quality=quality)
+    with _stage(trace, "base64"):
+        # The view must be released before the buffer is truncated for the next image
+        with buffer.getbuffer() as view:
+            b64 = base64.b64encode(view)
+            jpeg_bytes = len(view)
+    return PreparedImage(b64, img.size, False, jpeg_bytes, decoded_bytes)
@@ -0,0 +1,281 @@
+"""Per-user cache of serialized JSON responses with ETags and write-through invalidation.
+
+Used for endpoints the app polls (`/analytics/summary`). Entries are the response bytes, keyed by
+(user, key) (e.g. the date), in two tiers:
+
+- in-process LRU (`TTLCache`), so a hit costs neither Mongo nor serialization;
+- optional Redis hash per user (`<namespace>:<user_id>`, when REDIS_URL is set), shared by all
+  API processes.
+
+Writers call `invalidate()` after changing what a response is built from. It drops the entry
+locally and in Redis, bumps the user's version in Redis (`<namespace>:version:<user_id>`) and
+publishes the key on `INVALIDATION_CHANNEL`, which every process listens to (`start()`) to drop
+its own local copy. A response built from data read before an invalidation is not stored
+(`version()` / `put(version=...)`): locally the process compares its own counter, and in Redis the
+write is a compare-and-set on the user's version, so a process that has not received the message
+yet cannot put stale bytes back after another process's invalidation. Other per-user in-process
+state can follow the same channel with `subscribe()` / `broadcast()`.
+
+The ETag is a hash of the bytes, so it is the same in every process; a matching `If-None-Match`
+gets a 304 without a body.
+"""
+import asyncio
+import hashlib
+import logging
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import Response
+from prometheus_client import Counter
+
+from app.config import SUMMARY_CACHE_SIZE, SUMMARY_CACHE_TTL_S
+from app.db.redis_client import RedisError, get_redis
+from app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "bio_ai:response_cache:invalidate"
+# Lifetime of a user's version key after its last invalidation; far longer than building a response
+VERSION_TTL_S = 86400
+# Identifies this process's messages, which it has already applied locally
+_ORIGIN = uuid.uuid4().hex
+
+# Stores the response only if the user's version is still the one read before building it.
+# KEYS: version key, user hash; ARGV: expected version, field, body, TTL
+_PUT_IF_VERSION = """
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then return 0 end
+redis.call('HSET', KEYS[2], ARGV[2], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return 1
+"""
+
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "bio_ai_response_cache_lookups_total", "Cached response lookups by outcome", ["namespace", "result"]
+)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against `etag` (RFC 9110 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+
+    @classmethod
+    def of(cls, body: bytes) -> "CachedResponse":
+        return cls(body, f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"')
+
+    def response(self, if_none_match: Optional[str] = None) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(if_none_match, self.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+
+class ResponseCache:
+    def __init__(self, namespace: str, maxsize: int, ttl: float):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Bumped on every invalidation of a user; see put()
+        self._versions: Dict[str, int] = {}
+        subscribe(namespace, self._on_invalidation)
+
+    def _redis_key(self, user_id: str) -> str:
+        return f"{self.namespace}:{user_id}"
+
+    def _version_key(self, user_id: str) -> str:
+        return f"{self.namespace}:version:{user_id}"
+
+    def _local_version(self, user_id: str) -> int:
+        return self._versions.get(user_id, 0)
+
+    async def version(self, user_id: str) -> Tuple[int, Optional[bytes]]:
+        """The user's version (local counter, Redis version) to pass to `put()`."""
+        redis = get_redis()
+        shared = None
+        if redis is not None:
+            try:
+                shared = await redis.get(self._version_key(user_id)) or b"0"
+            except (RedisError, OSError) as e:
+                logger.warning("Response cache Redis read failed: %s", e)
+        return self._local_version(user_id), shared
+
+    async def get(self, user_id: str, key: str) -> Optional[CachedResponse]:
+        cached = self._memory.get((user_id, key))
+        if cached is not None:
+            RESPONSE_CACHE_LOOKUPS.labels(self.namespace, "memory_hit").inc()
+            return cached
+        redis = get_redis()
+        if redis is not None:
+            version = self._local_version(user_id)
+            try:
+                body = await redis.hget(self._redis_key(user_id), key)
+            except (RedisError, OSError) as e:
+                logger.warning("Response cache Redis read failed: %s", e)
+                body = None
+            if body is not None:
+                RESPONSE_CACHE_LOOKUPS.labels(self.namespace, "redis_hit").inc()
+                cached = CachedResponse.of(body)
+                if version == self._local_version(user_id):
+                    self._memory.set((user_id, key), cached)
+                return cached
+        RESPONSE_CACHE_LOOKUPS.labels(self.namespace, "miss").inc()
+        return None
+
+    async def put(
+        self, user_id: str, key: str, body: bytes, version: Optional[Tuple[int, Optional[bytes]]] = None
+    ) -> CachedResponse:
+        """
+        Cache `body`. Pass the `version()` taken before reading the data it was built from: if the
+        user was invalidated since (by any process), the (possibly stale) body is returned but not
+        stored.
+        """
+        cached = CachedResponse.of(body)
+        local, shared = version if version is not None else (None, None)
+        if local is not None and local != self._local_version(user_id):
+            return cached
+        redis = get_redis()
+        if redis is not None:
+            try:
+                if shared is not None:
+                    stored = await redis.eval(
+                        _PUT_IF_VERSION, 2, self._version_key(user_id), self._redis_key(user_id),
+                        shared, key, body, int(self.ttl),
+                    )
+                    if not stored:
+                        return cached
+                else:
+                    async with redis.pipeline(transaction=False) as pipe:
+                        pipe.hset(self._redis_key(user_id), key, body)
+                        pipe.expire(self._redis_key(user_id), int(self.ttl))
+                        await pipe.execute()
+            except (RedisError, OSError) as e:
+                logger.warning("Response cache Redis write failed: %s", e)
+        # The invalidation may have arrived while Redis was written
+        if local is None or local == self._local_version(user_id):
+            self._memory.set((user_id, key), cached)
+        return cached
+
+    def _drop_local(self, user_id: str, key: Optional[str]) -> None:
+        self._versions[user_id] = self._local_version(user_id) + 1
+        if key is not None:
+            self._memory.pop((user_id, key))
+        else:
+            for cache_key in [k for k, _ in self._memory.items() if k[0] == user_id]:
+                self._memory.pop(cache_key)
+
+    def _on_invalidation(self, user_id: Optional[str], key: Optional[str]) -> None:
+        if user_id is None:
+            self._memory.clear()
+        else:
+            self._drop_local(user_id, key)
+
+    async def invalidate(self, user_id: str, *keys: str) -> None:
+        """Drop the user's entries for `keys` (all of the user's entries when none are given)."""
+        for key in keys or (None,):
+            self._drop_local(user_id, key)
+        redis = get_redis()
+        if redis is None:
+            return
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                # Bumped first: a put() that read the old version no longer matches
+                pipe.incr(self._version_key(user_id))
+                pipe.expire(self._version_key(user_id), VERSION_TTL_S)
+                if keys:
+                    pipe.hdel(self._redis_key(user_id), *keys)
+                else:
+                    pipe.delete(self._redis_key(user_id))
+                for key in keys or ("",):
+                    pipe.publish(INVALIDATION_CHANNEL, _message(self.namespace, user_id, key))
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            logger.warning("Response cache Redis invalidation failed: %s", e)
+
+
+# namespace -> handler(user_id, key) called for invalidations published by other processes;
+# (None, None) means everything may be stale (the listener lost its connection)
+_subscribers: Dict[str, Callable[[Optional[str], Optional[str]], None]] = {}
+_listener: Optional[asyncio.Task] = None
+
+
+def _message(namespace: str, user_id: str, key: str) -> str:
+    return "\x00".join((namespace, user_id, key, _ORIGIN))
+
+
+def subscribe(namespace: str, handler: Callable[[Optional[str], Optional[str]], None]) -> None:
+    _subscribers[namespace] = handler
+
+
+async def broadcast(namespace: str, user_id: str, key: str = "") -> None:
+    """Tell the other processes that `namespace` state of the user is stale (no-op without Redis)."""
+    redis = get_redis()
+    if redis is None:
+        return
+    try:
+        await redis.publish(INVALIDATION_CHANNEL, _message(namespace, user_id, key))
+    except (RedisError, OSError) as e:
+        logger.warning("Response cache Redis invalidation failed: %s", e)
+
+
+async def _listen(redis) -> None:
+    while True:
+        try:
+            async with redis.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    # Messages from older processes have no origin field
+                    namespace, user_id, key, origin = (message["data"].decode().split("\x00") + [""])[:4]
+                    handler = _subscribers.get(namespace)
+                    if handler is not None and origin != _ORIGIN:
+                        handler(user_id, key or None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Invalidations may have been missed while disconnected
+            logger.warning("Response cache invalidation listener failed, resubscribing: %s", e)
+            for handler in _subscribers.values():
+                handler(None, None)
+            await asyncio.sleep(1)
+
+
+def start() -> None:
+    """Follow invalidations from other processes (no-op without Redis)."""
+    global _listener
+    redis = get_redis()
+    if redis is not None and _listener is None:
+        _listener = asyncio.create_task(_listen(redis))
+
+
+async def stop() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.cancel()
+        try:
+            await _listener
+        except asyncio.CancelledError:
+            pass
+        _listener = None
+
+
+_summary_cache: Optional[ResponseCache] = None
+
+
+def get_summary_cache() -> ResponseCache:
+    """`/analytics/summary` responses, keyed by (user, date)."""
+    global _summary_cache
+    if _summary_cache is None:
+        _summary_cache = ResponseCache("summary", maxsize=SUMMARY_CACHE_SIZE, ttl=SUMMARY_CACHE_TTL_S)
+    return _summary_cache
@@ -0,0 +1,88 @@
+"""Chunked ingestion of multipart uploads.
+
+Uploads are pulled in fixed-size chunks with the size limit enforced as bytes arrive (an oversized
+file is rejected after at most `max_bytes + chunk_size` bytes, not after buffering all of it) and
+hashed incrementally, so the SHA-256 used for dedup costs no extra pass over the data.
+"""
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+import aiofiles
+from fastapi import UploadFile
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Upload exceeds {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+@dataclass
+class IngestedUpload:
+    size: int
+    sha256: str
+    content_type: Optional[str]
+    # Exactly one of these is set: in-memory bytes (read_upload) or the saved file (save_upload)
+    data: Optional[bytearray] = None
+    path: Optional[str] = None
+
+
+async def _chunks(upload: UploadFile, max_bytes: int, digest, chunk_size: int) -> AsyncIterator[bytes]:
+    # Starlette knows the part size once the multipart body is parsed: reject without reading
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+    size = 0
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            return
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(max_bytes)
+        digest.update(chunk)
+        yield chunk
+
+
+async def read_upload(upload: UploadFile, max_bytes: int = MAX_IMAGE_BYTES, chunk_size: int = UPLOAD_CHUNK_SIZE) -> IngestedUpload:
+    """Read an upload into one growing buffer (no per-chunk copies), enforcing `max_bytes`."""
+    digest = hashlib.sha256()
+    data = bytearray()
+    async for chunk in _chunks(upload, max_bytes, digest, chunk_size):
+        data += chunk
+    return IngestedUpload(size=len(data), sha256=digest.hexdigest(), content_type=upload.content_type, data=data)
+
+
+async def save_upload(upload: UploadFile, directory: str, max_bytes: int = MAX_IMAGE_BYTES, chunk_size: int = UPLOAD_CHUNK_SIZE) -> IngestedUpload:
+    """
+    Stream an upload straight to `directory` without holding it in memory.
+
+    The file is stored under a content-addressed name (`<sha256[:16]>_<original name>`), so
+    re-uploads of the same bytes reuse the existing file instead of writing a copy.
+    """
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(directory, f".upload-{uuid.uuid4().hex}")
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            async for chunk in _chunks(upload, max_bytes, digest, chunk_size):
+                size += len(chunk)
+                await f.write(chunk)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    sha256 = digest.hexdigest()
+    name = os.path.basename(upload.filename or "upload")
+    final_path = os.path.join(directory, f"{sha256[:16]}_{name}")
+    if os.path.exists(final_path):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, final_path)
+    return IngestedUpload(size=size, sha256=sha256, content_type=upload.content_type, path=final_path)
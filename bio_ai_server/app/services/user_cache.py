@@ -0,0 +1,105 @@
+"""Shared per-user cache of `users` documents (profile, dietary profile, preferences, goals, subscription).
+
+Every `/profile` read and the dashboard state read the user document through `get()`, which
+serves it from memory; concurrent misses for a user share one `find_one` (single-flight).
+
+Writes go through `update_user()`, which adds `$inc: {version: 1}` to the update, so every
+document carries a version counter bumped by each PATCH/PUT, and stores the updated document in
+the cache (write-through). A document only replaces a cached one with a lower version, so
+concurrent writes and reads cannot leave an older document behind. Other processes drop their copy
+through the response cache invalidation channel and reload it on their next read.
+
+Cached documents are shared between requests and must not be modified.
+"""
+import asyncio
+from typing import Dict, Optional
+
+from prometheus_client import Counter
+
+from app.config import USER_CACHE_SIZE, USER_CACHE_TTL_S
+from app.services import response_cache
+from app.services.cache import TTLCache
+
+NAMESPACE = "user"
+
+USER_CACHE_LOOKUPS = Counter(
+    "bio_ai_user_cache_lookups_total", "User document cache lookups by outcome", ["result"]
+)
+
+
+class UserCache:
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL_S):
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        # user_id -> load in progress, awaited by concurrent misses
+        self._loading: Dict[str, asyncio.Future] = {}
+        # Bumped when a user is invalidated; a load that raced with it is not kept
+        self._generations: Dict[str, int] = {}
+        response_cache.subscribe(NAMESPACE, self._on_invalidation)
+
+    def _store(self, user_id: str, user: dict) -> None:
+        cached = self._memory.get(user_id)
+        if cached is None or user.get("version", 0) >= cached.get("version", 0):
+            self._memory.set(user_id, user)
+
+    def _drop(self, user_id: str) -> None:
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        self._memory.pop(user_id)
+
+    def _on_invalidation(self, user_id: Optional[str], key: Optional[str]) -> None:
+        if user_id is None:
+            self._memory.clear()
+        else:
+            self._drop(user_id)
+
+    async def _load(self, db, user_id: str) -> Optional[dict]:
+        generation = self._generations.get(user_id, 0)
+        user = await db.users.find_one({"_id": user_id})
+        if user is not None and generation == self._generations.get(user_id, 0):
+            self._store(user_id, user)
+        return user
+
+    async def get(self, db, user_id: str) -> Optional[dict]:
+        """The user document (None if there is none; absent users are not cached)."""
+        user = self._memory.get(user_id)
+        if user is not None:
+            USER_CACHE_LOOKUPS.labels("hit").inc()
+            return user
+        loading = self._loading.get(user_id)
+        if loading is not None:
+            USER_CACHE_LOOKUPS.labels("coalesced").inc()
+            return await asyncio.shield(loading)
+        USER_CACHE_LOOKUPS.labels("miss").inc()
+        loading = self._loading[user_id] = asyncio.ensure_future(self._load(db, user_id))
+        try:
+            return await asyncio.shield(loading)
+        finally:
+            if self._loading.get(user_id) is loading:
+                del self._loading[user_id]
+
+    async def updated(self, user_id: str, user: dict) -> None:
+        """Store the document returned by a write and tell the other processes to reload theirs."""
+        self._store(user_id, user)
+        await response_cache.broadcast(NAMESPACE, user_id)
+
+    async def invalidate(self, user_id: str) -> None:
+        self._drop(user_id)
+        await response_cache.broadcast(NAMESPACE, user_id)
+
+
+_cache: Optional[UserCache] = None
+
+
+def get_user_cache() -> UserCache:
+    global _cache
+    if _cache is None:
+        _cache = UserCache()
+    return _cache
+
+
+async def update_user(db, user_id: str, update: dict) -> Optional[dict]:
+    """Apply `update` to the user document, bumping its version; returns the updated document (None if absent)."""
+    update = {**update, "$inc": {**update.get("$inc", {}), "version": 1}}
+    user = await db.users.find_one_and_update({"_id": user_id}, update, return_document=True)
+    if user is not None:
+        await get_user_cache().updated(user_id, user)
+    return user
@@ -1,9 +1,13 @@
 import argparse
+import asyncio
+import hashlib
 import sys
 import random
 import json
 import os
-import gc
+import glob
+import io
+import uuid
 from pathlib import Path
 import cv2
 import numpy as np
@@ -11,7 +15,11 @@ import torch
 from PIL import Image, ImageDraw, ImageFont
 import traceback
 import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 from contextlib import contextmanager
+from dataclasses import dataclass, field
 
 # Small helper for consistent, flushed logs
 def p(msg):
@@ -33,10 +41,16 @@ PIXELS_PER_CM = 38.0
 FONT_SIZE = 10
 OUTPUT_FOLDER = "Extracted_Ingredients"
 JSON_OUTPUT_FILE = "nutrition_report.json"
+BATCH_SIZE = 4
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
 
 # Prefer server-local model weights directory when available
 MODEL_DIR = Path(__file__).parent / "models"
 SAM_WEIGHTS = MODEL_DIR / "FastSAM-x.pt" if (MODEL_DIR / "FastSAM-x.pt").exists() else "FastSAM-x.pt"
+DEPTH_MODEL_ID = "LiheYoung/depth-anything-small-hf"
+
+# Models stay resident for the life of the process; keep them on CPU unless told otherwise
+MODEL_DEVICE = os.getenv("DETECT_DEVICE", "cpu")
 
 # --- FINE TUNING PARAMETERS ---
 CONF_THRESHOLD = 0.2
@@ -45,6 +59,15 @@ RETINA_MASKS = True
 
 # --- AI MODEL CONFIG ---
 # Using OpenAI for vision-language analysis (model: gpt-5-nano-2025-08-07) when available.
+# OPENAI_BASE_URL can point at a local stub (tools/nutrient_stub_server.py) for offline runs.
+NUTRIENT_MODEL = os.getenv("NUTRIENT_MODEL", "gpt-5-nano-2025-08-07")
+NUTRIENT_MAX_CONCURRENCY = int(os.getenv("NUTRIENT_MAX_CONCURRENCY", "4"))
+NUTRIENT_TIMEOUT_S = float(os.getenv("NUTRIENT_TIMEOUT_S", "30"))
+NUTRIENT_CACHE_SIZE = int(os.getenv("NUTRIENT_CACHE_SIZE", "1024"))
+# Cache keys round volume/area so tiny segmentation jitter between re-scans still hits
+VOLUME_QUANTUM_ML = 5.0
+AREA_QUANTUM_CM2 = 1.0
+ANALYSIS_JSON_FILE = "nutrition_analysis.json"
 
 try:
     from ultralytics import SAM
@@ -53,38 +76,279 @@ try:
 except ImportError as e:
     p(f"Missing libraries for segmentation/depth pipeline: {e}")
     p("Run: pip install ultralytics transformers torch opencv-python pillow accelerate")
-    sys.exit(1)
+    if __name__ == "__main__":
+        sys.exit(1)
+    # Imported by the API's inference workers: let the caller handle it
+    raise
+
+try:
+    # Optional: faster per-label reductions; a pure NumPy fallback is used otherwise
+    from scipy import ndimage
+except ImportError:
+    ndimage = None
 
 # ==========================================
 # 1. COMPUTER VISION SECTION (SAM + DEPTH)
 # ==========================================
 
-def get_depth_map(pil_image):
+def _is_fastsam_weights(weights):
+    name = str(weights).lower()
+    return "fastsam" in name or "fast-sam" in name or name.endswith('.pt') and 'fast' in os.path.basename(name)
+
+
+class ModelRegistry:
+    """
+    Process-wide holder for the depth estimator and the SAM / FastSAM segmenter.
+
+    Each model is loaded once on first use (or eagerly via `load()` / `warmup()`) and then kept
+    resident, so per-image calls only pay for inference. Inference is serialized on a lock because
+    the ultralytics predictors are not safe to share between threads.
+    """
+
+    def __init__(self, sam_weights=SAM_WEIGHTS, depth_model=DEPTH_MODEL_ID, device=MODEL_DEVICE):
+        self.sam_weights = sam_weights
+        self.depth_model = depth_model
+        self.device = device
+        self.uses_fastsam = _is_fastsam_weights(sam_weights)
+        self.inference_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._depth_estimator = None
+        self._segmenter = None
+
+    def depth_estimator(self):
+        if self._depth_estimator is None:
+            with self._load_lock:
+                if self._depth_estimator is None:
+                    with timed_step(f"Load depth model ({self.depth_model} on {self.device})"):
+                        self._depth_estimator = pipeline(task="depth-estimation", model=self.depth_model, device=self.device)
+        return self._depth_estimator
+
+    def segmenter(self):
+        if self._segmenter is None:
+            with self._load_lock:
+                if self._segmenter is None:
+                    with timed_step(f"Load segmentation model ({self.sam_weights})"):
+                        if self.uses_fastsam:
+                            try:
+                                from fastsam import FastSAM
+                            except Exception:
+                                p("FastSAM weights requested but `fastsam` package is not installed.")
+                                p("Install with: pip install fastsam or git+https://github.com/yang-song/fastsam.git")
+                                raise
+                            self._segmenter = FastSAM(str(self.sam_weights))
+                        else:
+                            self._segmenter = SAM(str(self.sam_weights))
+        return self._segmenter
+
+    def load(self):
+        """Load every model up front so the first request does not pay for it."""
+        self.depth_estimator()
+        self.segmenter()
+        return self
+
+    def warmup(self, size=256):
+        """Load the models and push one synthetic image through each to prime kernels and caches."""
+        self.load()
+        dummy = np.random.randint(0, 255, (size, size, 3), dtype=np.uint8)
+        with timed_step("Model warm-up"):
+            try:
+                get_depth_map(Image.fromarray(dummy), registry=self)
+                segment_image(dummy, registry=self)
+            except Exception as e:
+                p(f"Warm-up failed (models stay loaded): {e}")
+        return self
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the process-wide `ModelRegistry`, creating it on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
+
+
+def load_image(image):
+    """
+    Normalize an input image to a BGR uint8 array.
+
+    Accepts a file path, encoded bytes (jpg/png/...), a BGR/grayscale NumPy array or a PIL image.
+    Returns None when the input cannot be decoded.
+    """
+    if isinstance(image, (str, Path)):
+        return cv2.imread(str(image))
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if isinstance(image, Image.Image):
+        return cv2.cvtColor(np.array(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+    if isinstance(image, np.ndarray):
+        if image.ndim == 2:
+            return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        if image.ndim == 3 and image.shape[2] == 4:
+            return cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+        return np.ascontiguousarray(image, dtype=np.uint8)
+    return None
+
+
+def get_depth_map(pil_image, registry=None):
     """Generates a normalized depth map (0.0 to 1.0)."""
-    p("Loading depth estimation model...")
-    device = 0 if torch.cuda.is_available() else -1
+    registry = registry or get_registry()
     try:
-        depth_estimator = pipeline(task="depth-estimation", model="LiheYoung/depth-anything-small-hf", device=device)
-        depth_result = depth_estimator(pil_image)
+        depth_estimator = registry.depth_estimator()
+        with registry.inference_lock:
+            depth_result = depth_estimator(pil_image)
         depth_map = np.array(depth_result["depth"])
     except Exception as e:
         p(f"Depth model failed: {e}")
         p(traceback.format_exc())
         raise
-    
-    # Normalize
+
+    p("Depth map ready")
+    return _normalize_depth(depth_map)
+
+
+def _normalize_depth(depth_map):
     d_min, d_max = depth_map.min(), depth_map.max()
-    depth_norm = (depth_map - d_min) / (d_max - d_min)
-    
-    # Cleanup to save VRAM for Qwen later
+    return (depth_map - d_min) / ((d_max - d_min) or 1.0)
+
+
+def get_depth_maps(pil_images, registry=None, batch_size=BATCH_SIZE):
+    """
+    Batched variant of `get_depth_map`: one normalized depth map per input image, in order.
+
+    Images are grouped by size so each forward pass stacks tensors of the same shape.
+    """
+    registry = registry or get_registry()
+    depth_estimator = registry.depth_estimator()
+
+    groups = {}
+    for idx, img in enumerate(pil_images):
+        groups.setdefault(img.size, []).append(idx)
+
+    depth_maps = [None] * len(pil_images)
+    for indices in groups.values():
+        for start in range(0, len(indices), batch_size):
+            chunk = indices[start:start + batch_size]
+            with registry.inference_lock:
+                results = depth_estimator([pil_images[i] for i in chunk], batch_size=len(chunk))
+            for i, result in zip(chunk, results):
+                depth_maps[i] = _normalize_depth(np.array(result["depth"]))
+    return depth_maps
+
+
+def _extract_fastsam_masks(fs_results):
+    """Pull an (N, H, W) uint8 mask stack out of the various FastSAM result shapes (None: no detections)."""
+    if isinstance(fs_results, (list, tuple)) and len(fs_results) == 0:
+        return None
+    fast_masks = None
+    if hasattr(fs_results, 'masks'):
+        # Ultralytics Results carry masks=None for an image without detections
+        if fs_results.masks is None:
+            return None
+        fast_masks = fs_results.masks
+    elif isinstance(fs_results, dict) and 'masks' in fs_results:
+        fast_masks = fs_results['masks']
+    elif isinstance(fs_results, (list, tuple)) and hasattr(fs_results[0], 'masks'):
+        if fs_results[0].masks is None:
+            return None
+        fast_masks = fs_results[0].masks
+
+    if fast_masks is None:
+        # Try common attribute names
+        if hasattr(fs_results, 'segmentation'):
+            fast_masks = fs_results.segmentation
+
+    # Ultralytics-style Masks object wraps the tensor in `.data`
+    if fast_masks is not None and hasattr(fast_masks, 'data') and isinstance(fast_masks.data, torch.Tensor):
+        fast_masks = fast_masks.data
+
+    # Convert to numpy (N, H, W) uint8
+    if fast_masks is None:
+        raise RuntimeError('Could not extract masks from FastSAM results')
+
+    if isinstance(fast_masks, torch.Tensor):
+        return fast_masks.cpu().numpy().astype('uint8')
+    if isinstance(fast_masks, np.ndarray):
+        return fast_masks.astype('uint8')
+    # assume iterable of masks
+    return np.stack([np.array(m, dtype='uint8') for m in fast_masks], axis=0)
+
+
+def segment_image(original_cv2, registry=None):
+    """Run SAM / FastSAM on a BGR image and return an (N, H, W) uint8 mask stack, or None."""
+    registry = registry or get_registry()
+    model = registry.segmenter()
+
+    if registry.uses_fastsam:
+        with registry.inference_lock:
+            # Predict; try a few common argument names for compatibility
+            try:
+                fs_results = model.predict(original_cv2, device=registry.device, retina_masks=RETINA_MASKS)
+            except TypeError:
+                fs_results = model.predict(original_cv2, device=registry.device)
+        return _extract_fastsam_masks(fs_results)
+
+    with registry.inference_lock:
+        results = model(original_cv2, retina_masks=RETINA_MASKS, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD, device=registry.device, verbose=False)
+    if not results or not getattr(results[0], 'masks', None):
+        return None
+    return results[0].masks.data.cpu().numpy().astype('uint8')
+
+
+def segment_images(images_cv2, registry=None, batch_size=BATCH_SIZE):
+    """
+    Batched variant of `segment_image`: one mask stack (or None) per input image, in order.
+
+    Falls back to per-image calls when the loaded predictor does not accept a list source.
+    """
+    registry = registry or get_registry()
+    model = registry.segmenter()
+
+    masks = []
+    for start in range(0, len(images_cv2), batch_size):
+        chunk = list(images_cv2[start:start + batch_size])
+        try:
+            with registry.inference_lock:
+                if registry.uses_fastsam:
+                    try:
+                        results = model.predict(chunk, device=registry.device, retina_masks=RETINA_MASKS)
+                    except TypeError:
+                        results = model.predict(chunk, device=registry.device)
+                else:
+                    results = model(chunk, retina_masks=RETINA_MASKS, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD, device=registry.device, verbose=False)
+            if results is None or len(results) != len(chunk):
+                raise RuntimeError(f"expected {len(chunk)} results, got {0 if results is None else len(results)}")
+        except Exception as e:
+            p(f"Batched segmentation unavailable ({e}); falling back to per-image calls")
+            masks.extend(_segment_or_none(img, registry) for img in chunk)
+            continue
+
+        for result in results:
+            # A result that cannot be read only loses its own image, not the batch
+            try:
+                if registry.uses_fastsam:
+                    masks.append(_extract_fastsam_masks(result))
+                elif getattr(result, 'masks', None):
+                    masks.append(result.masks.data.cpu().numpy().astype('uint8'))
+                else:
+                    masks.append(None)
+            except Exception as e:
+                p(f"Could not extract masks from a batched result: {e}")
+                masks.append(None)
+    return masks
+
+
+def _segment_or_none(original_cv2, registry):
     try:
-        del depth_estimator
-        torch.cuda.empty_cache()
-    except Exception:
-        pass
-    
-    p("Depth map ready")
-    return depth_norm
+        return segment_image(original_cv2, registry=registry)
+    except Exception as e:
+        p(f"Segmentation failed: {e}")
+        return None
 
 def draw_info_box(draw, text, x, y):
     """Draws a text box with a background."""
@@ -104,66 +368,324 @@ def draw_info_box(draw, text, x, y):
     )
     draw.text((x, y), text, font=font, fill=(255, 255, 255, 255))
 
-def save_single_item(mask, original_pil, depth_map_resized, img_w, img_h, output_dir, file_name, label_title):
+def build_label_image(masks_data, min_area_frac=0.0001, max_area_frac=0.9):
     """
-    Calculates physics, saves PNG, and RETURNS data for Qwen analysis.
+    Drop noise masks and paint the survivors into a single int32 label image.
+
+    Label 0 is the "rest" (background); kept masks get labels 1..K in their original order, and
+    where masks overlap the later one wins, matching the order they are drawn on the composite.
+    Returns (labels, K).
     """
-    
-    # --- Calculate Physics ---
-    mask_area_pixels = mask.sum()
-    real_area_cm2 = mask_area_pixels / (PIXELS_PER_CM ** 2)
-    
-    obj_depths = depth_map_resized[mask == 1]
-    if len(obj_depths) == 0: return None
+    n, img_h, img_w = masks_data.shape
+    total_pixels = img_w * img_h
+    areas = masks_data.reshape(n, -1).sum(axis=1, dtype=np.int64)
+    keep = np.flatnonzero((areas >= total_pixels * min_area_frac) & (areas <= total_pixels * max_area_frac))
+    p(f"Keeping {len(keep)} of {n} mask(s) after area filtering")
+
+    labels = np.zeros((img_h, img_w), dtype=np.int32)
+    binary = masks_data if masks_data.max() <= 1 else (masks_data > 0).astype(np.uint8)
+    for label, idx in enumerate(keep, start=1):
+        # In-place write through a boolean view: no per-mask temporaries
+        np.copyto(labels, label, where=binary[idx].view(np.bool_))
+    return labels, len(keep)
+
+
+def _label_minimum(values, labels, n_labels):
+    if ndimage is not None:
+        return np.asarray(ndimage.minimum(values, labels, index=np.arange(n_labels)), dtype=np.float64)
+    out = np.full(n_labels, np.inf)
+    np.minimum.at(out, labels, values)
+    return out
+
+
+def _label_bboxes(labels, n_labels):
+    """Return an (n_labels, 4) array of (x0, y0, x1, y1) boxes; empty labels get x1 <= x0."""
+    img_h, img_w = labels.shape
+    boxes = np.zeros((n_labels, 4), dtype=np.int64)
+    if ndimage is not None:
+        # find_objects skips label 0, which always spans the whole frame anyway
+        boxes[0] = (0, 0, img_w, img_h)
+        for label, sl in enumerate(ndimage.find_objects(labels, max_label=n_labels - 1), start=1):
+            if sl is not None:
+                boxes[label] = (sl[1].start, sl[0].start, sl[1].stop, sl[0].stop)
+        return boxes
+    rows = np.arange(img_h)[:, None]
+    cols = np.arange(img_w)[None, :]
+    y0 = np.full(n_labels, img_h); np.minimum.at(y0, labels, rows)
+    y1 = np.full(n_labels, -1); np.maximum.at(y1, labels, rows)
+    x0 = np.full(n_labels, img_w); np.minimum.at(x0, labels, cols)
+    x1 = np.full(n_labels, -1); np.maximum.at(x1, labels, cols)
+    boxes[:] = np.stack([x0, y0, x1 + 1, y1 + 1], axis=1)
+    return boxes
+
+
+def compute_label_physics(labels, n_labels, depth_map_resized):
+    """
+    Area, depth statistics and volume for every label at once.
 
-    local_min_depth = np.min(obj_depths)
-    avg_height_factor = (np.mean(obj_depths) - local_min_depth) 
-    if avg_height_factor < 0.01: avg_height_factor = 0.01
-    
+    Returns a dict of arrays indexed by label: area_px, area_cm2, volume_ml, bbox.
+    """
+    flat_labels = labels.ravel()
+    depth = depth_map_resized.astype(np.float64, copy=False)
+    area_px = np.bincount(flat_labels, minlength=n_labels)
+    depth_sum = np.bincount(flat_labels, weights=depth.ravel(), minlength=n_labels)
+    depth_min = _label_minimum(depth, labels, n_labels)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        depth_mean = np.where(area_px > 0, depth_sum / np.maximum(area_px, 1), 0.0)
+    avg_height_factor = np.maximum(depth_mean - np.where(np.isfinite(depth_min), depth_min, 0.0), 0.01)
+
+    area_cm2 = area_px / (PIXELS_PER_CM ** 2)
     estimated_height_cm = avg_height_factor * 25.0
-    estimated_vol_ml = real_area_cm2 * estimated_height_cm * 2.0 
+    volume_ml = area_cm2 * estimated_height_cm * 2.0
+    return {
+        "area_px": area_px,
+        "area_cm2": area_cm2,
+        "volume_ml": volume_ml,
+        "bbox": _label_bboxes(labels, n_labels),
+    }
+
+
+def render_composite(original_cv2, labels, n_labels):
+    """Tint every item with its own colour, grey out the rest and outline items — in one pass."""
+    palette = np.random.randint(0, 255, (n_labels, 3), dtype=np.uint8)
+    palette[0] = 100
+    alpha = np.full(n_labels, 0.4, dtype=np.float32)
+    alpha[0] = 0.3
+
+    a = alpha[labels][..., None]
+    composite = (original_cv2 * (1.0 - a) + palette[labels] * a).astype(np.uint8)
+
+    # Item outlines: pixels whose 4-neighbourhood crosses a label boundary (~2px wide, like drawContours)
+    edges = np.zeros(labels.shape, dtype=bool)
+    vertical = labels[:-1, :] != labels[1:, :]
+    horizontal = labels[:, :-1] != labels[:, 1:]
+    edges[:-1, :] |= vertical
+    edges[1:, :] |= vertical
+    edges[:, :-1] |= horizontal
+    edges[:, 1:] |= horizontal
+    edges &= labels > 0
+    composite[edges] = palette[labels[edges]]
+    return composite
+
+
+def render_item_crop(original_rgb, labels, label, physics, file_name, label_title):
+    """
+    Crop one labelled item out of the frame (bounding box only) as an annotated transparent image.
+
+    Returns (item_data, LazyImage) — the item data feeds the nutrient analysis — or None when the
+    label is empty. Nothing is written to disk here.
+    """
+    img_h, img_w = labels.shape
+    area_px = physics["area_px"][label]
+    if area_px == 0:
+        return None
+    x0, y0, x1, y1 = physics["bbox"][label]
+    if x1 <= x0 or y1 <= y0:
+        return None
 
-    # --- Create Transparent PNG ---
-    alpha_mask = Image.fromarray(mask * 255, mode='L')
-    item_img = original_pil.convert("RGBA")
-    item_img.putalpha(alpha_mask)
-    
-    bbox = alpha_mask.getbbox()
-    if not bbox: return None
-    
     pad = 10
-    crop_box = (max(0, bbox[0]-pad), max(0, bbox[1]-pad), min(img_w, bbox[2]+pad), min(img_h, bbox[3]+pad))
-    cropped_img = item_img.crop(crop_box)
-    
+    cx0, cy0 = max(0, x0 - pad), max(0, y0 - pad)
+    cx1, cy1 = min(img_w, x1 + pad), min(img_h, y1 + pad)
+
+    crop = np.empty((cy1 - cy0, cx1 - cx0, 4), dtype=np.uint8)
+    crop[..., :3] = original_rgb[cy0:cy1, cx0:cx1]
+    crop[..., 3] = (labels[cy0:cy1, cx0:cx1] == label) * np.uint8(255)
+    cropped_img = Image.fromarray(crop, mode="RGBA")
+    # Content address of the crop pixels (before annotation) for the nutrient cache
+    crop_hash = hashlib.sha256(crop.tobytes()).hexdigest()
+
+    real_area_cm2 = physics["area_cm2"][label]
+    estimated_vol_ml = physics["volume_ml"][label]
+
     # --- Draw Info ---
     draw = ImageDraw.Draw(cropped_img)
     data_text = f"Vol: {estimated_vol_ml:.1f} ml\nArea: {real_area_cm2:.1f} cm2"
     draw_info_box(draw, label_title, 10, 10)
     draw_info_box(draw, data_text, 10, 35)
 
-    save_path = output_dir / file_name
-    cropped_img.save(save_path)
-    p(f"Saved: {file_name}")
-
     # Return structured data for analysis
-    return {
+    item_data = {
         "id": label_title,
-        "image_path": str(save_path),
+        "image_name": file_name,
         "volume_ml": float(f"{estimated_vol_ml:.1f}"),
-        "area_cm2": float(f"{real_area_cm2:.1f}")
+        "area_cm2": float(f"{real_area_cm2:.1f}"),
+        "crop_hash": crop_hash,
     }
+    return item_data, LazyImage(cropped_img, ".png")
+
+class LazyImage:
+    """An in-memory image (PIL image or BGR array) that is encoded on first use and then cached."""
+
+    def __init__(self, image, ext):
+        self.image = image
+        self.ext = ext
+        self._encoded = None
+
+    def encode(self):
+        if self._encoded is None:
+            if isinstance(self.image, np.ndarray):
+                ok, buf = cv2.imencode(self.ext, self.image)
+                if not ok:
+                    raise ValueError(f"Could not encode image as {self.ext}")
+                self._encoded = buf.tobytes()
+            else:
+                out = io.BytesIO()
+                self.image.save(out, format="PNG" if self.ext == ".png" else "JPEG")
+                self._encoded = out.getvalue()
+        return self._encoded
+
+
+@dataclass
+class ScanResult:
+    """Everything one scan produces, held in memory: item records, item crops and the composite."""
+    items: list
+    crops: dict = field(default_factory=dict)
+    composite: LazyImage = None
+    elapsed_s: float = 0.0
+
+    def report(self, directory=None):
+        """Item records for the JSON report; `image_path` is filled in when written to `directory`."""
+        if directory is None:
+            return [dict(item) for item in self.items]
+        return [dict(item, image_path=str(Path(directory) / item["image_name"])) for item in self.items]
+
+    def report_json(self, directory=None):
+        return json.dumps(self.report(directory), indent=4).encode("utf-8")
+
+
+class ArtifactSink:
+    """
+    Optional on-disk output for scans: each request gets its own `<root>/<request_id>/` directory,
+    written on a background thread pool so encoding and file I/O stay off the request path.
+    """
+
+    def __init__(self, root=OUTPUT_FOLDER, max_workers=2):
+        self.root = Path(root)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="artifact-sink")
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def directory_for(self, request_id):
+        return self.root / request_id
+
+    def _track(self, future):
+        with self._lock:
+            self._pending = [f for f in self._pending if not f.done()]
+            self._pending.append(future)
+        return future
+
+    def submit(self, result, request_id=None):
+        """Queue `result` for writing; returns a Future resolving to the request directory."""
+        directory = self.directory_for(request_id or uuid.uuid4().hex[:12])
+        return self._track(self._executor.submit(self._write, result, directory))
+
+    def write_json(self, request_id, file_name, data):
+        directory = self.directory_for(request_id)
+        return self._track(self._executor.submit(self._write_file, directory / file_name, json.dumps(data, indent=4).encode("utf-8")))
+
+    @staticmethod
+    def _write_file(path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return path
+
+    def _write(self, result, directory):
+        directory.mkdir(parents=True, exist_ok=True)
+        for file_name, crop in result.crops.items():
+            (directory / file_name).write_bytes(crop.encode())
+        if result.composite is not None:
+            (directory / "TOTAL_SUMMARY.jpg").write_bytes(result.composite.encode())
+        (directory / JSON_OUTPUT_FILE).write_bytes(result.report_json(directory))
+        p(f"✨ Artifacts written to: {directory}")
+        return directory
+
+    def flush(self):
+        """Block until every queued write has finished; logs (and swallows) write failures."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        wait(pending)
+        for future in pending:
+            if future.exception() is not None:
+                p(f"Failed to write artifacts: {future.exception()}")
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
 
 # ==========================================
 # 2. VISION LANGUAGE MODEL (QWEN) SECTION
 # ==========================================
 
+class NutrientCache:
+    """
+    Thread-safe LRU of analysis results, content-addressed by crop hash + quantized volume/area.
+
+    Re-scans of the same dish produce identical crops (and near-identical physics), so they skip
+    the remote call entirely.
+    """
+
+    def __init__(self, maxsize=NUTRIENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(item_data):
+        crop_hash = item_data.get("crop_hash")
+        if not crop_hash:
+            image_path = item_data.get("image_path")
+            if not image_path or not os.path.exists(image_path):
+                return None
+            with open(image_path, "rb") as f:
+                crop_hash = hashlib.sha256(f.read()).hexdigest()
+        vol_q = round((item_data.get("volume_ml") or 0) / VOLUME_QUANTUM_ML)
+        area_q = round((item_data.get("area_cm2") or 0) / AREA_QUANTUM_CM2)
+        return f"{crop_hash}:{vol_q}:{area_q}"
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if key is None:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+def _is_timeout(exc):
+    """openai.APITimeoutError / httpx and requests timeouts, without importing either client."""
+    return isinstance(exc, TimeoutError) or "Timeout" in type(exc).__name__
+
+
 class NutrientScanner:
-    def __init__(self):
+    def __init__(self, base_url=None, max_concurrency=NUTRIENT_MAX_CONCURRENCY, timeout=NUTRIENT_TIMEOUT_S, cache=None):
         # Use OpenAI Responses API (gpt-5-nano-2025-08-07) for analysis when available.
         p("Initializing NutrientScanner (OpenAI)...")
         self.client = None
-        self.model = "gpt-5-nano-2025-08-07"
+        self.model = NUTRIENT_MODEL
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.cache = cache if cache is not None else NutrientCache()
         self.openai_key = os.getenv("OPENAI_KEY") or os.getenv("OPENAI_API_KEY")
+        if not self.openai_key and self.base_url:
+            # Local stub servers do not check credentials
+            self.openai_key = "stub"
         if not self.openai_key:
             p("⚠️ OPENAI_KEY not set; NutrientScanner will be unavailable.")
             return
@@ -171,10 +693,12 @@ class NutrientScanner:
             # Try modern OpenAI client
             try:
                 from openai import OpenAI
-                self.client = OpenAI(api_key=self.openai_key)
+                self.client = OpenAI(api_key=self.openai_key, base_url=self.base_url, timeout=self.timeout)
             except Exception:
                 import openai
                 openai.api_key = self.openai_key
+                if self.base_url:
+                    openai.api_base = self.base_url
                 self.client = openai
             p("OpenAI client initialized.")
         except Exception as e:
@@ -182,14 +706,17 @@ class NutrientScanner:
             p(traceback.format_exc())
             self.client = None
 
-    def analyze_item(self, item_data):
+    def analyze_item(self, item_data, timeout=None):
         """Send physics data + image path to OpenAI to request JSON nutritional analysis.
 
+        `timeout` (seconds, default `self.timeout`) bounds the HTTP request itself, so a timed-out
+        call does not keep running in its thread.
+
         Note: For now we pass the server-local image path and physics metrics in the prompt.
         A future improvement would upload the cropped image via the OpenAI files API and reference it
         so the model can see the image pixels directly.
         """
-        image_path = item_data.get("image_path")
+        image_path = item_data.get("image_path") or item_data.get("image_name")
         vol = item_data.get("volume_ml")
         area = item_data.get("area_cm2")
         item_id = item_data.get("id")
@@ -212,6 +739,7 @@ class NutrientScanner:
 
         if not self.client:
             return {"error": "openai_not_configured", "message": "OPENAI_KEY missing or client init failed"}
+        timeout = timeout or self.timeout
 
         try:
             p(f"Querying OpenAI for {item_id} (Vol: {vol}ml)...")
@@ -223,6 +751,7 @@ class NutrientScanner:
                     input=prompt_text,
                     max_output_tokens=512,
                     temperature=0.1,
+                    timeout=timeout,
                 )
                 # Extract text
                 out_text = None
@@ -239,6 +768,9 @@ class NutrientScanner:
                     # Fallback to str(resp)
                     out_text = getattr(resp, 'output_text', None) or str(resp)
             except Exception as e:
+                if _is_timeout(e):
+                    p(f"OpenAI analysis timed out for {item_id} after {timeout:g}s")
+                    return {"error": "timeout", "message": f"analysis exceeded {timeout:g}s"}
                 # Fallback for classic openai library usage
                 try:
                     resp = self.client.ChatCompletion.create(
@@ -246,9 +778,13 @@ class NutrientScanner:
                         messages=[{"role": "user", "content": prompt_text}],
                         max_tokens=512,
                         temperature=0.1,
+                        request_timeout=timeout,
                     )
                     out_text = resp.choices[0].message.content
                 except Exception as e2:
+                    if _is_timeout(e2):
+                        p(f"OpenAI analysis timed out for {item_id} after {timeout:g}s")
+                        return {"error": "timeout", "message": f"analysis exceeded {timeout:g}s"}
                     p(f"OpenAI request failed: {e2}")
                     p(traceback.format_exc())
                     return {"error": "openai_request_failed", "message": str(e2)}
@@ -275,6 +811,45 @@ class NutrientScanner:
             p(traceback.format_exc())
             return {"error": "openai_error", "message": str(e)}
 
+    async def analyze_items(self, items, max_concurrency=None, timeout=None):
+        """
+        Analyze all items concurrently and return results in input order.
+
+        At most `max_concurrency` requests are in flight: a slot is held until its thread returns,
+        and the HTTP client gives up after `timeout` seconds with an {"error": "timeout"} result.
+        Cached results are returned without a remote call, and duplicate crops within the same
+        batch share a single request.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+        timeout = timeout or self.timeout
+        in_flight = {}
+
+        async def fetch(item_data):
+            async with semaphore:
+                return await asyncio.to_thread(self.analyze_item, item_data, timeout)
+
+        async def analyze(item_data):
+            key = NutrientCache.key_for(item_data)
+            cached = self.cache.get(key)
+            if cached is None:
+                if key is None:
+                    return await fetch(item_data)
+                if key not in in_flight:
+                    in_flight[key] = asyncio.ensure_future(fetch(item_data))
+                cached = await in_flight[key]
+                if "error" in cached:
+                    return cached
+                self.cache.put(key, cached)
+            # Re-stamp the per-scan fields on the shared result
+            return {
+                **cached,
+                "measured_volume_ml": item_data.get("volume_ml"),
+                "measured_area_cm2": item_data.get("area_cm2"),
+                "source_image": item_data.get("image_path") or item_data.get("image_name"),
+            }
+
+        return await asyncio.gather(*(analyze(item) for item in items))
+
 # ==========================================
 # 3. MAIN WORKFLOW
 # ==========================================
@@ -282,225 +857,200 @@ class NutrientScanner:
 
     
 
-def process_and_extract(image_path):
-    output_dir = Path(OUTPUT_FOLDER)
-    output_dir.mkdir(exist_ok=True)
+def process_and_extract(image, registry=None, sink=None, request_id=None):
+    """
+    Segment a food photo and estimate per-item volume/area, entirely in memory.
 
-    # Clean old files
-    for f in output_dir.glob("*.png"): f.unlink()
-    for f in output_dir.glob("*.jpg"): f.unlink()
-    for f in output_dir.glob("*.json"): f.unlink()
+    `image` may be a file path, encoded image bytes, a BGR NumPy array or a PIL image. Models come
+    from `registry` (the process-wide `ModelRegistry` by default) and stay loaded after the call.
+    Returns a `ScanResult` (crops and composite are encoded lazily), or None when the image could
+    not be processed. Pass an `ArtifactSink` to also write the artifacts to `<root>/<request_id>/`
+    in the background.
+    """
+    registry = registry or get_registry()
 
-    p(f"⏳ Processing Image: {image_path}")
+    label = image if isinstance(image, (str, Path)) else type(image).__name__
+    p(f"⏳ Processing Image: {label}")
     start_time = time.perf_counter()
 
     # 1. Load Image
-    original_cv2 = cv2.imread(image_path)
+    original_cv2 = load_image(image)
     if original_cv2 is None:
         p("Error loading image.")
         return
 
-    composite_image = original_cv2.copy()
-    img_h, img_w = original_cv2.shape[:2]
     original_pil = Image.fromarray(cv2.cvtColor(original_cv2, cv2.COLOR_BGR2RGB))
 
     # 2. Get Depth Map
     try:
         with timed_step("Depth estimation"):
-            depth_map = get_depth_map(original_pil)
-            depth_map_resized = cv2.resize(depth_map, (img_w, img_h))
+            depth_map = get_depth_map(original_pil, registry=registry)
     except Exception as e:
         p(f"Depth estimation failed: {e}")
         return
 
     # 3. Run SAM / FastSAM
     p(f"⏳ Running Segmentation (Conf: {CONF_THRESHOLD}, IoU: {IOU_THRESHOLD})...")
-    p(f"Using SAM weights: {SAM_WEIGHTS}")
-
-    masks_data = None
-    model = None
-    results = None
+    p(f"Using SAM weights: {registry.sam_weights}")
 
     try:
-        sam_weight_name = str(SAM_WEIGHTS).lower()
-        # If FastSAM weights requested, use fastsam package
-        if "fastsam" in sam_weight_name or "fast-sam" in sam_weight_name or sam_weight_name.endswith('.pt') and 'fast' in os.path.basename(sam_weight_name):
-            try:
-                from fastsam import FastSAM
-            except Exception:
-                p("FastSAM weights requested but `fastsam` package is not installed.")
-                p("Install with: pip install fastsam or git+https://github.com/yang-song/fastsam.git")
-                raise
-
-            with timed_step("FastSAM segmentation"):
-                p("Loading FastSAM model...")
-                model = FastSAM(str(SAM_WEIGHTS))
-                device = "cuda" if torch.cuda.is_available() else "cpu"
-                # Predict; try a few common argument names for compatibility
-                try:
-                    fs_results = model.predict(original_cv2, device=device, retina_masks=RETINA_MASKS)
-                except TypeError:
-                    fs_results = model.predict(original_cv2, device=device)
-
-                # Extract masks robustly
-                fast_masks = None
-                if hasattr(fs_results, 'masks'):
-                    fast_masks = fs_results.masks
-                elif isinstance(fs_results, dict) and 'masks' in fs_results:
-                    fast_masks = fs_results['masks']
-                elif isinstance(fs_results, (list, tuple)) and len(fs_results) > 0 and hasattr(fs_results[0], 'masks'):
-                    fast_masks = fs_results[0].masks
-
-                if fast_masks is None:
-                    # Try common attribute names
-                    if hasattr(fs_results, 'segmentation'):
-                        fast_masks = fs_results.segmentation
-
-                # Convert to numpy (N, H, W) uint8
-                if fast_masks is None:
-                    raise RuntimeError('Could not extract masks from FastSAM results')
-
-                if isinstance(fast_masks, torch.Tensor):
-                    masks_data = fast_masks.cpu().numpy().astype('uint8')
-                elif isinstance(fast_masks, np.ndarray):
-                    masks_data = fast_masks.astype('uint8')
-                else:
-                    # assume iterable of masks
-                    masks_data = np.stack([np.array(m, dtype='uint8') for m in fast_masks], axis=0)
+        with timed_step("FastSAM segmentation" if registry.uses_fastsam else "SAM segmentation"):
+            masks_data = segment_image(original_cv2, registry=registry)
+    except Exception as e:
+        p(f"SAM segmentation failed: {e}")
+        p(traceback.format_exc())
+        return
+
+    result = extract_items(original_cv2, depth_map, masks_data)
+    if result is None:
+        return
+
+    result.elapsed_s = time.perf_counter() - start_time
+    p(f"⏱ TOTAL processing time: {result.elapsed_s:.2f}s")
+    if sink is not None:
+        sink.submit(result, request_id)
+    return result
 
-        else:
-            with timed_step("SAM segmentation"):
-                model = SAM(str(SAM_WEIGHTS))
-                results = model(image_path, retina_masks=RETINA_MASKS, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD, verbose=False)
 
-            if not results or not getattr(results[0], 'masks', None):
-                p("❌ No objects detected.")
-                return
+def process_batch(images, registry=None, batch_size=BATCH_SIZE, sink=None):
+    """
+    Run the pipeline over N images with batched depth and segmentation forward passes.
+
+    Per-image extraction then fans out in memory. Returns one entry per input, in order: a
+    `ScanResult`, or None for images that failed to load or segment. With a `sink`, each result is
+    written to `<root>/<image name>/` in the background.
+    """
+    registry = registry or get_registry()
+    images = list(images)
+    p(f"⏳ Processing batch of {len(images)} image(s) (batch size {batch_size})")
+    start_time = time.perf_counter()
 
-            masks_data = results[0].masks.data.cpu().numpy().astype('uint8')
+    loaded = [load_image(img) for img in images]
+    valid = [i for i, img in enumerate(loaded) if img is not None]
+    for i in set(range(len(images))) - set(valid):
+        p(f"Error loading image #{i + 1}.")
 
+    results = [None] * len(images)
+    if not valid:
+        return results
+
+    bgr_images = [loaded[i] for i in valid]
+    pil_images = [Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)) for img in bgr_images]
+
+    try:
+        with timed_step(f"Batched depth estimation ({len(valid)} images)"):
+            depth_maps = get_depth_maps(pil_images, registry=registry, batch_size=batch_size)
+        with timed_step(f"Batched segmentation ({len(valid)} images)"):
+            masks_list = segment_images(bgr_images, registry=registry, batch_size=batch_size)
     except Exception as e:
-        p(f"SAM segmentation failed: {e}")
+        p(f"Batched inference failed: {e}")
         p(traceback.format_exc())
-        return
+        return results
+
+    for n, i in enumerate(valid):
+        name = batch_item_name(images[i], i)
+        with timed_step(f"Extract {name}"):
+            results[i] = extract_items(bgr_images[n], depth_maps[n], masks_list[n])
+        if results[i] is not None and sink is not None:
+            sink.submit(results[i], name)
+
+    elapsed = time.perf_counter() - start_time
+    p(f"⏱ Batch processed {len(images)} image(s) in {elapsed:.2f}s — {len(images) / elapsed:.2f} images/sec")
+    return results
+
 
+def batch_item_name(source, index):
+    return Path(source).stem if isinstance(source, (str, Path)) else f"image_{index + 1}"
+
+
+def extract_items(original_cv2, depth_map, masks_data):
+    """Turn a mask stack + depth map into item records, item crops and a composite image."""
     if masks_data is None or masks_data.size == 0:
         p("❌ No masks extracted.")
-        return
+        return None
 
     p(f"✅ Found {masks_data.shape[0]} mask(s).")
 
-    # Clean up models to free memory
-    try:
-        if 'model' in locals() and model is not None:
-            del model
-        if 'results' in locals() and results is not None:
-            del results
-        gc.collect()
-        torch.cuda.empty_cache()
-    except Exception:
-        pass
-
-    # --- Accumulator for the "Rest" item ---
-    total_mask_accumulator = np.zeros((img_h, img_w), dtype=np.uint8)
-
-    items = []
-
-    count = 0
-    p(f"✅ Extracting items...")
-
-    for i, mask in enumerate(masks_data):
-        with timed_step(f"Item {i+1} processing"):
-            # --- Filter Noise ---
-            mask_area_pixels = mask.sum()
-            total_pixels = img_w * img_h
-
-            if mask_area_pixels < (total_pixels * 0.0001) or mask_area_pixels > (total_pixels * 0.9):
-                p(f"Skipping item {i+1}: area {mask_area_pixels} px")
-                continue
+    img_h, img_w = original_cv2.shape[:2]
+    depth_map_resized = cv2.resize(depth_map, (img_w, img_h))
 
-            total_mask_accumulator = np.maximum(total_mask_accumulator, mask)
-
-            # Update Composite Image
-            color = np.random.randint(0, 255, (3,), dtype=np.uint8).tolist()
-            colored_layer = np.zeros_like(original_cv2, dtype=np.uint8)
-            colored_layer[mask == 1] = color
-
-            mask_indices = mask == 1
-            composite_image[mask_indices] = cv2.addWeighted(
-                composite_image[mask_indices], 0.6, 
-                colored_layer[mask_indices], 0.4, 
-                0
-            )
-            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            cv2.drawContours(composite_image, contours, -1, color, 2)
-
-            # Save and collect data
-            item_data = save_single_item(
-                mask, original_pil, depth_map_resized, img_w, img_h, 
-                output_dir, 
-                f"item_{count+1}.png", 
-                f"Item {count+1}"
-            )
-            if item_data:
-                items.append(item_data)
-
-            count += 1
-
-    # --- PROCESS THE REST (BACKGROUND) ---
-    p("⏳ Calculating the 'Rest'...")
-    rest_mask = 1 - total_mask_accumulator
-
-    with timed_step("Background / Rest"):
-        if rest_mask.sum() > 0:
-            rest_data = save_single_item(
-                rest_mask, original_pil, depth_map_resized, img_w, img_h,
-                output_dir,
-                f"item_rest.png",
-                "Background / Rest"
-            )
-            if rest_data:
-                items.append(rest_data)
-
-    # Apply grey overlay to rest area in composite
-    grey_layer = np.full_like(original_cv2, 100, dtype=np.uint8)
-    rest_indices = rest_mask == 1
-    composite_image[rest_indices] = cv2.addWeighted(
-        composite_image[rest_indices], 0.7,
-        grey_layer[rest_indices], 0.3,
-        0
-    )
+    with timed_step("Label image + per-item physics"):
+        labels, n_items = build_label_image(masks_data)
+        n_labels = n_items + 1
+        physics = compute_label_physics(labels, n_labels, depth_map_resized)
 
-    # Save Total Image
-    with timed_step("Save composite image"):
-        total_image_path = output_dir / "TOTAL_SUMMARY.jpg"
-        cv2.imwrite(str(total_image_path), composite_image)
-        p(f"   -> Saved Composite Image: {total_image_path}")
+    with timed_step("Composite overlay"):
+        composite_image = render_composite(original_cv2, labels, n_labels)
 
-    # Save simple JSON report with volumes/areas
-    json_path = output_dir / JSON_OUTPUT_FILE
-    try:
-        with timed_step("Write JSON report"):
-            with open(json_path, 'w') as f:
-                json.dump(items, f, indent=4)
-        p(f"✨ COMPLETE! Physics data saved to: {json_path}")
-    except Exception as e:
-        p(f"Failed to write JSON report: {e}")
+    result = ScanResult(items=[], composite=LazyImage(composite_image, ".jpg"))
+    original_rgb = cv2.cvtColor(original_cv2, cv2.COLOR_BGR2RGB)
+    # Items first, then the "rest" (background) as the final entry
+    crops = [(label, f"item_{label}.png", f"Item {label}") for label in range(1, n_labels)]
+    crops.append((0, "item_rest.png", "Background / Rest"))
+    with timed_step(f"Crop {n_items} item(s)"):
+        for label, file_name, title in crops:
+            rendered = render_item_crop(original_rgb, labels, label, physics, file_name, title)
+            if rendered:
+                item_data, crop = rendered
+                result.items.append(item_data)
+                result.crops[file_name] = crop
+
+    p(f"✨ COMPLETE! Extracted {len(result.items)} item(s).")
+    return result
+
+
+def collect_images(spec):
+    """Expand a directory or glob pattern into a sorted list of image paths."""
+    path = Path(spec)
+    candidates = path.iterdir() if path.is_dir() else (Path(m) for m in glob.glob(spec))
+    return sorted(str(c) for c in candidates if c.is_file() and c.suffix.lower() in IMAGE_EXTENSIONS)
 
-    total_elapsed = time.perf_counter() - start_time
-    p(f"⏱ TOTAL processing time: {total_elapsed:.2f}s")
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--image", default="food.jpg")
+    parser.add_argument("--images", help="Directory or glob of images to process in batched mode")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--no-warmup", action="store_true", help="Skip the model warm-up pass")
+    parser.add_argument("--analyze", action="store_true", help="Run the nutrient analysis on the extracted items")
     args = parser.parse_args()
 
-    image_path = Path(args.image)
-    if not image_path.exists():
-        p("Image not found.")
-        return
+    if args.images:
+        image_paths = collect_images(args.images)
+        if not image_paths:
+            p("No images matched.")
+            return
+    else:
+        image_path = Path(args.image)
+        if not image_path.exists():
+            p("Image not found.")
+            return
+
+    registry = get_registry()
+    if args.no_warmup:
+        registry.load()
+    else:
+        registry.warmup()
+
+    sink = ArtifactSink(OUTPUT_FOLDER)
+    if args.images:
+        batches = process_batch(image_paths, registry=registry, batch_size=max(1, args.batch_size), sink=sink)
+        scans = [(batch_item_name(path, i), result) for i, (path, result) in enumerate(zip(image_paths, batches))]
+    else:
+        request_id = image_path.stem
+        scans = [(request_id, process_and_extract(str(image_path), registry=registry, sink=sink, request_id=request_id))]
+
+    if args.analyze:
+        scanner = NutrientScanner()
+        for request_id, result in scans:
+            if not result or not result.items:
+                continue
+            with timed_step(f"Nutrient analysis ({len(result.items)} items)"):
+                analyses = asyncio.run(scanner.analyze_items(result.report(sink.directory_for(request_id))))
+            sink.write_json(request_id, ANALYSIS_JSON_FILE, analyses)
+        p(f"Nutrient cache: {scanner.cache.hits} hit(s), {scanner.cache.misses} miss(es)")
 
-    process_and_extract(str(image_path))
+    sink.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""Benchmark entry inserts/sec per ID allocator (`app/db/ids.py`) under concurrent writers.
+
+Each writer allocates an ID and inserts an `ent_<id>` document, the way `/analytics/entries` does.
+Writers run as asyncio tasks spread over several processes (like uvicorn workers), each process
+with its own client and allocator:
+
+    python tools/bench_id_allocation.py --processes 4 --writers 32 --inserts 2000
+
+Needs a MongoDB at MONGODB_URI; writes to a scratch database (`--db`, dropped afterwards). The
+insert uses `_id = ent_<id>`, so a duplicate ID fails the run.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+from app.config import MONGODB_URI  # noqa: E402
+from app.db.ids import make_allocator  # noqa: E402
+
+KINDS = ("counter", "hilo", "time")
+
+
+async def run_process(kind, node_id, db_name, writers, inserts, block_size):
+    client = AsyncIOMotorClient(MONGODB_URI)
+    db = client[db_name]
+    allocator = make_allocator(kind, lambda: db.counters, block_size=block_size, node_id=node_id)
+
+    async def writer(n):
+        for _ in range(n):
+            seq = await allocator.next_id("bench_entries")
+            await db[f"entries_{kind}"].insert_one({"_id": f"ent_{seq}", "user_id": "bench", "value": 1})
+
+    per_writer = inserts // writers
+    await asyncio.gather(*(writer(per_writer) for _ in range(writers)))
+    client.close()
+    return per_writer * writers
+
+
+def process_main(args):
+    return asyncio.run(run_process(*args))
+
+
+def bench(kind, args):
+    jobs = [(kind, i, args.db, args.writers, args.inserts, args.block_size) for i in range(args.processes)]
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.processes) as pool:
+        total = sum(pool.map(process_main, jobs))
+    return total, time.perf_counter() - start
+
+
+async def reset(db_name):
+    client = AsyncIOMotorClient(MONGODB_URI)
+    await client.drop_database(db_name)
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=32, help="Concurrent writers per process")
+    parser.add_argument("--inserts", type=int, default=2000, help="Inserts per process")
+    parser.add_argument("--block-size", type=int, default=100)
+    parser.add_argument("--kinds", default=",".join(KINDS))
+    parser.add_argument("--db", default="bio_ai_bench_ids")
+    args = parser.parse_args()
+
+    print(f"{args.processes} process(es) x {args.writers} writer(s), {args.inserts} inserts per process")
+    print(f"{'allocator':<10} {'inserts':>8} {'seconds':>8} {'inserts/s':>10}")
+    for kind in args.kinds.split(","):
+        asyncio.run(reset(args.db))
+        total, elapsed = bench(kind, args)
+        print(f"{kind:<10} {total:>8} {elapsed:>8.2f} {total / elapsed:>10.0f}")
+    asyncio.run(reset(args.db))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Benchmark the recognition preprocessing path (`app/services/preprocess.py`).
+
+Compares it with the previous per-endpoint path (BytesIO copy, full-resolution decode, thumbnail,
+re-encode, read back, base64 to str, json.dumps of the payload) on synthetic photos:
+
+    python tools/bench_preprocess.py --runs 20
+
+Reports milliseconds per image and the bytes held in intermediate buffers (upload copies, decoded
+bitmap, encoded JPEG, base64 and request body) for each path.
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.preprocess import prepare_for_recognition  # noqa: E402
+
+
+def synthetic_photo(width, height, seed=0):
+    """Smooth noise upscaled to `width` x `height`, which compresses like a real photo."""
+    rng = np.random.default_rng(seed)
+    small = (rng.random((max(height // 40, 2), max(width // 40, 2), 3)) * 255).astype("uint8")
+    return Image.fromarray(small).resize((width, height), Image.Resampling.BICUBIC)
+
+
+def encode(img, fmt="JPEG", **kwargs):
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def legacy(data):
+    """The pre-refactor path; returns the JSON body and bytes held in intermediates."""
+    copied = len(data)  # BytesIO(bytearray) copies the upload
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    copied += img.width * img.height * len(img.getbands())
+    if img.mode in ("RGBA", "P"):
+        img = img.convert("RGB")
+    img.thumbnail((512, 512))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=85)
+    buffer.seek(0)
+    image_data = buffer.read()
+    encoded = base64.b64encode(image_data).decode("utf-8")
+    body = json.dumps({"image_b64": encoded, "include_food_data": True, "region": "US", "language": "en"}).encode()
+    copied += 2 * len(image_data) + 2 * len(encoded) + len(body)
+    return body, copied
+
+
+def current(data):
+    prepared = prepare_for_recognition(data)
+    options = json.dumps({"include_food_data": True, "region": "US", "language": "en"}).encode()
+    body = b"".join((b'{"image_b64":"', prepared.b64, b'",', options[1:]))
+    copied = prepared.decoded_bytes + (0 if prepared.passthrough else prepared.jpeg_bytes) + len(prepared.b64) + len(body)
+    return body, copied
+
+
+def bench(fn, data, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        _, copied = fn(data)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), copied
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    cases = {
+        "12MP phone JPEG": bytearray(encode(synthetic_photo(4032, 3024), quality=90)),
+        "1080p JPEG": bytearray(encode(synthetic_photo(1920, 1080), quality=90)),
+        "small JPEG (passthrough)": bytearray(encode(synthetic_photo(480, 360), quality=85)),
+        "1080p PNG": bytearray(encode(synthetic_photo(1920, 1080), fmt="PNG")),
+    }
+
+    print(f"{'case':<26}{'upload':>10}{'legacy ms':>11}{'new ms':>9}{'legacy MB':>11}{'new MB':>9}")
+    for name, data in cases.items():
+        legacy_ms, legacy_bytes = bench(legacy, data, args.runs)
+        new_ms, new_bytes = bench(current, data, args.runs)
+        print(
+            f"{name:<26}{len(data) / 1e6:>9.2f}M{legacy_ms:>11.1f}{new_ms:>9.1f}"
+            f"{legacy_bytes / 1e6:>11.2f}{new_bytes / 1e6:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Run bio_ai_server's hot queries through `explain()` and fail if any of them scans a collection.
+
+    python tools/check_query_plans.py              # ensure_indexes(), then explain every query
+    python tools/check_query_plans.py --no-create  # only explain (e.g. against a live database)
+    python tools/check_query_plans.py --runs 50    # also time each query (executionStats)
+
+The queries mirror the routers and services (same filters, sorts and projections; the sort and
+projection constants are imported from them) with sample parameters. Exit status is 1 when a
+winning plan contains a COLLSCAN. Queries on a collection that does not exist (e.g.
+health_metrics before bio_nexus created it) are reported as skipped. Uses MONGODB_URI /
+MONGO_DB_NAME / FOOD_CATALOG_DB_NAME / HEALTH_DB_NAME like the API.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.indexes import ensure_indexes  # noqa: E402
+from app.db.mongodb import get_catalog_db, get_db, get_health_db  # noqa: E402
+from app.routers.analytics import ENTRY_PROJECTION, ENTRY_SORT  # noqa: E402
+from app.routers.capture import HISTORY_PROJECTION, HISTORY_SORT  # noqa: E402
+from app.services.pagination import after  # noqa: E402
+
+USER = "user_123"
+TODAY = datetime.utcnow().date().isoformat()
+MONTH_AGO = (datetime.utcnow() - timedelta(days=29)).date().isoformat()
+NOW = datetime.utcnow()
+
+
+def find(collection, filter, sort=None, projection=None, limit=None):
+    cmd = {"find": collection, "filter": filter}
+    if sort:
+        cmd["sort"] = dict(sort)
+    if projection:
+        cmd["projection"] = projection if isinstance(projection, dict) else {f: 1 for f in projection}
+    if limit:
+        cmd["limit"] = limit
+    return cmd
+
+
+def aggregate(collection, pipeline):
+    return {"aggregate": collection, "pipeline": pipeline, "cursor": {}}
+
+
+# (name, database, command)
+QUERIES = [
+    ("analytics.entries", "app", find(
+        "analytics_entries", {"user_id": USER, "date": TODAY, "is_deleted": False},
+        ENTRY_SORT, ENTRY_PROJECTION, 101)),
+    ("analytics.entries type+cursor", "app", find(
+        "analytics_entries",
+        {"user_id": USER, "date": TODAY, "is_deleted": False, "type": "MEAL", **after(ENTRY_SORT, ["12:00", "ent_1"])},
+        ENTRY_SORT, ENTRY_PROJECTION, 101)),
+    ("analytics.update_entry", "app", {
+        "findAndModify": "analytics_entries", "query": {"_id": "ent_1", "user_id": USER, "is_deleted": False},
+        "update": [{"$set": {"title": {"$literal": "x"}}}]}),
+    ("dashboard_state.last_meal", "app", find(
+        "analytics_entries", {"user_id": USER, "date": TODAY, "is_deleted": False, "type": "MEAL"},
+        [("time", -1)], ["time"], 1)),
+    ("dashboard_state.steps", "health", aggregate("health_metrics", [
+        {"$match": {"metadata.user_id": USER, "metadata.sensor_type": "Steps",
+                    "timestamp": {"$gte": NOW - timedelta(days=1), "$lt": NOW}}},
+        {"$group": {"_id": None, "steps": {"$sum": "$measurements.steps"}}}])),
+    ("analytics.summary", "app", find("daily_metrics", {"user_id": USER, "date": TODAY}, limit=1)),
+    ("analytics.insights", "app", find(
+        "ai_insights", {"user_id": USER, "type": "weekly", "end_date": {"$lte": TODAY}},
+        [("generated_at", -1)], limit=1)),
+    ("capture.history", "app", find("food_analyses", {"user_id": USER}, HISTORY_SORT, HISTORY_PROJECTION, 11)),
+    ("capture.history cursor", "app", find(
+        "food_analyses", {"user_id": USER, **after(HISTORY_SORT, [NOW, "scan_1"])}, HISTORY_SORT, HISTORY_PROJECTION, 11)),
+    ("capture.history count", "app", {"count": "food_analyses", "query": {"user_id": USER}}),
+    ("capture.barcode", "app", find("food_products", {"barcode": "5449000000996"}, limit=1)),
+    ("capture.search $text", "app", find(
+        "food_products", {"$text": {"$search": "chicken"}}, [("score", {"$meta": "textScore"})],
+        {"score": {"$meta": "textScore"}}, 10)),
+    ("analysis_cache.sha256", "app", find(
+        "food_analyses", {"user_id": USER, "image_sha256": "0" * 64, "uploaded_at": {"$gte": NOW - timedelta(days=1)}}, limit=1)),
+    ("analysis_cache.phash", "app", find(
+        "food_analyses", {"user_id": USER, "image_phash_bands": {"$in": ["0:00", "1:00"]}, "uploaded_at": {"$gte": NOW - timedelta(days=1)}},
+        [("uploaded_at", -1)], limit=20)),
+    ("vision.barcode_batch products", "app", find("food_products", {"barcode": {"$in": ["5449000000996", "05449000000996"]}})),
+    ("vision.barcode_batch global_foods", "catalog", find(
+        "global_foods", {"external_source_id": {"$in": ["fatsecret:5449000000996"]}}, projection={"embedding_vector": 0})),
+    ("food_index.refresh products", "app", find("food_products", {"updated_at": {"$gt": NOW - timedelta(minutes=1)}})),
+    ("food_index.refresh global_foods", "catalog", find("global_foods", {"updated_at": {"$gt": NOW - timedelta(minutes=1)}})),
+    ("daily_totals.backfill", "app", aggregate("analytics_entries", [
+        {"$match": {"is_deleted": False, "user_id": USER, "date": {"$in": [TODAY]}}},
+        {"$group": {"_id": {"user_id": "$user_id", "date": "$date", "type": "$type"}, "count": {"$sum": 1}}}])),
+    ("daily_totals.changes", "app", find("daily_totals", {"user_id": USER, "updated_at": {"$gte": NOW}}, projection=["date"])),
+    ("correlation.version", "app", find("daily_totals", {"user_id": USER}, [("updated_at", -1)], ["updated_at"], 1)),
+    ("metric_rollups.history", "app", find(
+        "metric_rollups_daily", {"user_id": USER, "metric": "steps", "date": {"$gte": MONTH_AGO, "$lte": TODAY}},
+        [("date", 1)], {"_id": 0, "date": 1, "value": 1})),
+    ("metric_rollups.history weekly", "app", find(
+        "metric_rollups_weekly", {"user_id": USER, "metric": "steps", "week": {"$gte": MONTH_AGO, "$lte": TODAY}},
+        [("week", 1)], {"_id": 0, "week": 1, "value": 1})),
+    ("correlation.load", "app", find("metric_rollups_daily", {"user_id": USER, "date": {"$gte": MONTH_AGO, "$lte": TODAY}})),
+    ("metric_rollups.refresh entries", "app", aggregate("analytics_entries", [
+        {"$match": {"user_id": USER, "date": {"$gte": MONTH_AGO, "$lte": TODAY}, "is_deleted": False}},
+        {"$group": {"_id": "$date", "n": {"$sum": 1}}}])),
+    ("metric_rollups.refresh health", "health", aggregate("health_metrics", [
+        {"$match": {"metadata.user_id": USER, "metadata.sensor_type": {"$in": ["HR", "Steps"]},
+                    "timestamp": {"$gte": NOW - timedelta(days=30), "$lt": NOW}}},
+        {"$group": {"_id": None, "n": {"$sum": 1}}}])),
+    ("metric_rollups.refresh daily_metrics", "app", aggregate("daily_metrics", [
+        {"$match": {"user_id": USER, "date": {"$gte": MONTH_AGO, "$lte": TODAY}}},
+        {"$group": {"_id": "$date", "n": {"$sum": 1}}}])),
+    ("metric_rollups.weekly regroup", "app", aggregate("metric_rollups_daily", [
+        {"$match": {"user_id": USER, "week": {"$in": [MONTH_AGO]}}},
+        {"$group": {"_id": "$metric", "n": {"$sum": 1}}}])),
+    ("pantry.leftovers", "app", find("leftovers", {"id": 1}, limit=1)),
+]
+
+
+def plan_stages(explain, found=None):
+    """Stage names of the winning plan(s) anywhere in an explain document (rejected plans excluded)."""
+    found = [] if found is None else found
+    if isinstance(explain, dict):
+        if isinstance(explain.get("stage"), str):
+            found.append(explain["stage"])
+        for key, value in explain.items():
+            if key != "rejectedPlans":
+                plan_stages(value, found)
+    elif isinstance(explain, list):
+        for item in explain:
+            plan_stages(item, found)
+    return found
+
+
+def execution_ms(explain):
+    stats = explain.get("executionStats") or {}
+    if "executionTimeMillis" in stats:
+        return stats["executionTimeMillis"]
+    for stage in explain.get("stages", []):
+        cursor = stage.get("$cursor", {})
+        if "executionStats" in cursor:
+            return cursor["executionStats"].get("executionTimeMillis")
+    return None
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--no-create", action="store_true", help="Do not run ensure_indexes() first")
+    parser.add_argument("--runs", type=int, default=0, help="Also run each query this many times with executionStats")
+    args = parser.parse_args()
+
+    databases = {"app": get_db(), "catalog": get_catalog_db(), "health": get_health_db()}
+    if not args.no_create:
+        await ensure_indexes(databases["app"], databases["catalog"], databases["health"])
+    existing = {name: set(await db.list_collection_names()) for name, db in databases.items()}
+
+    failures = 0
+    for name, database, command in QUERIES:
+        collection = next(iter(command.values()))
+        if collection not in existing[database]:
+            print(f"SKIP      {name}: {collection} does not exist")
+            continue
+        explain = await databases[database].command("explain", command, verbosity="queryPlanner")
+        stages = plan_stages(explain.get("queryPlanner", explain))
+        status = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+        failures += status != "ok"
+        timing = ""
+        if args.runs:
+            times = []
+            for _ in range(args.runs):
+                stats = await databases[database].command("explain", command, verbosity="executionStats")
+                times.append(execution_ms(stats) or 0)
+            timing = f"  max {max(times)} ms over {args.runs} runs"
+        print(f"{status:<9} {name}: {' > '.join(dict.fromkeys(stages))}{timing}")
+
+    if failures:
+        print(f"{failures} quer{'y' if failures == 1 else 'ies'} scan a whole collection")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""Offline stand-in for the OpenAI endpoints used by `NutrientScanner`.
+
+Run it, then point the scanner at it:
+
+    python tools/nutrient_stub_server.py --port 8089 --delay 0.2
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python detect_food.py --image food.jpg --analyze
+
+Answers `POST /v1/responses` and `POST /v1/chat/completions` with a deterministic nutrition JSON
+derived from the volume in the prompt. `--delay` simulates upstream latency (useful for exercising
+the scanner's concurrency limit and per-item timeouts).
+"""
+import argparse
+import json
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VOLUME_RE = re.compile(r"Volume:\s*([0-9.]+)")
+
+
+def fake_analysis(prompt):
+    match = VOLUME_RE.search(prompt or "")
+    volume = float(match.group(1)) if match else 100.0
+    calories = round(volume * 1.2)
+    return {
+        "name": "Stub Food",
+        "calories": calories,
+        "macros": {"p": f"{round(volume * 0.05)}g", "f": f"{round(volume * 0.04)}g", "c": f"{round(volume * 0.15)}g"},
+        "reasoning": "Deterministic stub response derived from the measured volume.",
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.delay:
+            time.sleep(self.delay)
+
+        if self.path.endswith("/responses"):
+            text = json.dumps(fake_analysis(body.get("input") if isinstance(body.get("input"), str) else json.dumps(body.get("input"))))
+            payload = {
+                "id": "resp_stub",
+                "object": "response",
+                "created_at": int(time.time()),
+                "model": body.get("model"),
+                "status": "completed",
+                "output": [{
+                    "type": "message",
+                    "id": "msg_stub",
+                    "status": "completed",
+                    "role": "assistant",
+                    "content": [{"type": "output_text", "text": text, "annotations": []}],
+                }],
+                "parallel_tool_calls": False,
+                "tool_choice": "auto",
+                "tools": [],
+            }
+        elif self.path.endswith("/chat/completions"):
+            prompt = " ".join(m.get("content", "") for m in body.get("messages", []) if isinstance(m.get("content"), str))
+            payload = {
+                "id": "chatcmpl_stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": json.dumps(fake_analysis(prompt))},
+                }],
+            }
+        else:
+            self.send_error(404)
+            return
+
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        print(f"[stub] {fmt % args}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to sleep before answering")
+    args = parser.parse_args()
+
+    StubHandler.delay = args.delay
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"[stub] listening on http://{args.host}:{args.port}/v1", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
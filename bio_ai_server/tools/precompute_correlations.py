@@ -0,0 +1,51 @@
+"""Nightly job: bring every user's metric rollups up to date for the longest correlation window.
+
+    python tools/precompute_correlations.py                     # every user, ending today
+    python tools/precompute_correlations.py --user user_123 --end 2026-01-31
+
+`/analytics/correlation` computes its matrices from the daily rollups and caches them in the API
+process, so this job does not store matrices: it runs `metric_rollups.ensure_fresh` over the
+longest period, so that the first request of the day only reads the rollups and computes. Uses
+MONGODB_URI / MONGO_DB_NAME like the API.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.mongodb import get_db  # noqa: E402
+from app.services import metric_rollups  # noqa: E402
+
+PERIODS = {"1W": 7, "1M": 30, "3M": 90, "6M": 180, "1Y": 365}
+
+
+async def precompute_user(db, user_id, end):
+    end_date = datetime.fromisoformat(end).date()
+    # Rolling up the longest window covers every shorter period
+    start = (end_date - timedelta(days=max(PERIODS.values()) - 1)).isoformat()
+    await metric_rollups.ensure_fresh(db, user_id, start, end)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user", help="Only this user_id")
+    parser.add_argument("--end", help="Last date (YYYY-MM-DD), default today (UTC)")
+    args = parser.parse_args()
+
+    db = get_db()
+    end = args.end or datetime.utcnow().date().isoformat()
+    users = [args.user] if args.user else await db.daily_totals.distinct("user_id")
+
+    start = time.perf_counter()
+    for user_id in users:
+        await precompute_user(db, user_id, end)
+    elapsed = time.perf_counter() - start
+    print(f"Rolled up {max(PERIODS.values())} days for {len(users)} user(s) in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,33 @@
+"""Recompute the `daily_totals` view from `analytics_entries` (repair job).
+
+    python tools/rebuild_daily_totals.py                      # every user, every day
+    python tools/rebuild_daily_totals.py --user user_123 --start 2026-01-01 --end 2026-01-31
+
+Uses MONGODB_URI / MONGO_DB_NAME like the API.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.mongodb import get_db  # noqa: E402
+from app.services import daily_totals  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user", help="Only this user_id")
+    parser.add_argument("--start", help="First date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last date (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    days = await daily_totals.rebuild(get_db(), user_id=args.user, start_date=args.start, end_date=args.end)
+    print(f"Rebuilt {days} day(s) in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,7 @@
 import asyncio
 import json
+import zlib
+from datetime import datetime
 from typing import Any
 import logging
 import threading
@@ -30,6 +32,35 @@ async def process_health_point(point: dict, db) -> None:
     logger.debug("Inserted health metric for user %s", point.get("user_id"))
 
 
+async def process_health_chunk(data: bytes, db) -> int:
+    """Insert a chunk queued by bio_ai_server's /sync/batch: zlib-compressed JSON list of health_metrics documents."""
+    docs = json.loads(zlib.decompress(data))
+    for doc in docs:
+        doc["timestamp"] = datetime.fromisoformat(doc["timestamp"])
+    if docs:
+        await db.get_collection("health_metrics").insert_many(docs, ordered=False)
+    logger.debug("Inserted %d health metrics", len(docs))
+    return len(docs)
+
+
+async def record_chunk_processed(redis, batch_id: str, count: int) -> None:
+    """Count a processed chunk in the batch status hash; the last one marks the batch done."""
+    key = f"ingest:batch:{batch_id}"
+    processed = await redis.hincrby(key, "processed_chunks", 1)
+    await redis.hincrby(key, "processed_points", count)
+    status, chunks = await redis.hmget(key, "status", "chunks")
+    # Until the API has read the whole body the batch is "receiving" and chunks is not final
+    if status in (b"queued", "queued") and chunks is not None and processed >= int(chunks):
+        await redis.hset(key, "status", "done")
+
+
+async def record_chunk_failed(redis, batch_id: str) -> None:
+    """Count a chunk that could not be inserted and fail the batch (it can no longer reach done)."""
+    key = f"ingest:batch:{batch_id}"
+    await redis.hincrby(key, "failed_chunks", 1)
+    await redis.hset(key, "status", "failed")
+
+
 async def handle_stream_message(message: Any, db) -> None:
     """Handle raw XREAD-style message. Message is assumed to be dict with fields."""
     # message expected: {"user_id":..., "timestamp":..., "sensor_type":..., "measurements": {...}}
@@ -87,19 +118,24 @@ class Worker:
                 # resp is list of (stream_name, [(id, {b'field': b'value'}), ...])
                 for stream_name, messages in resp:
                     for msg_id, fields in messages:
-                        # Convert bytes keys/values to string
-                        data = {k.decode() if isinstance(k, bytes) else k: v.decode() if isinstance(v, bytes) else v for k, v in fields.items()}
+                        # Convert bytes keys/values to string (chunk data stays binary)
+                        data = {k.decode() if isinstance(k, bytes) else k: v for k, v in fields.items()}
+                        data = {k: v.decode() if isinstance(v, bytes) and k != "data" else v for k, v in data.items()}
                         try:
-                            # assume a JSON payload under "payload" or direct fields
-                            if "payload" in data:
-                                payload = json.loads(data["payload"])
+                            # a compressed chunk of points, a JSON payload under "payload", or direct fields
+                            if data.get("encoding") == "zlib":
+                                count = await process_health_chunk(data["data"], self.db)
+                                await record_chunk_processed(self.redis, data["batch_id"], count)
+                            elif "payload" in data:
+                                await handle_stream_message(json.loads(data["payload"]), self.db)
                             else:
-                                payload = data
-                            await handle_stream_message(payload, self.db)
+                                await handle_stream_message(data, self.db)
                             # Acknowledge
                             await self.redis.xack(self.stream_key, self.group, msg_id)
                         except Exception as e:
                             logger.exception("Failed to process message %s: %s", msg_id, e)
+                            if data.get("encoding") == "zlib":
+                                await record_chunk_failed(self.redis, data["batch_id"])
                             # Do not ack so the message can be retried/inspected
             except Exception as e:
                 logger.exception("Worker loop error: %s", e)
@@ -1,12 +1,15 @@
 import pytest
 import asyncio
-from unittest.mock import AsyncMock
-from app.worker import process_health_point
+import json
+import zlib
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+from app.worker import process_health_chunk, process_health_point, record_chunk_failed, record_chunk_processed
 
 @pytest.mark.asyncio
 async def test_process_health_point_calls_insert_one(mocker):
     fake_coll = AsyncMock()
-    db = AsyncMock()
+    db = MagicMock()
     db.get_collection.return_value = fake_coll
 
     point = {"user_id": "u1", "timestamp": "2026-02-02T00:00:00Z", "sensor_type": "HR", "measurements": {"hr": 70}}
@@ -16,4 +19,43 @@ async def test_process_health_point_calls_insert_one(mocker):
     fake_coll.insert_one.assert_awaited_once()
     args = fake_coll.insert_one.await_args.args[0]
     assert args["metadata"]["user_id"] == "u1"
-    assert args["measurements"]["hr"] == 70
\ No newline at end of file
+    assert args["measurements"]["hr"] == 70
+
+@pytest.mark.asyncio
+async def test_process_health_chunk_inserts_all_points():
+    fake_coll = AsyncMock()
+    db = MagicMock()
+    db.get_collection.return_value = fake_coll
+
+    docs = [
+        {"timestamp": "2026-02-02T00:00:00", "metadata": {"user_id": "u1", "sensor_type": "Steps"}, "measurements": {"steps": 120}},
+        {"timestamp": "2026-02-02T00:01:00", "metadata": {"user_id": "u1", "sensor_type": "Steps"}, "measurements": {"steps": 80}},
+    ]
+
+    count = await process_health_chunk(zlib.compress(json.dumps(docs).encode()), db)
+
+    assert count == 2
+    inserted = fake_coll.insert_many.await_args.args[0]
+    assert [d["measurements"]["steps"] for d in inserted] == [120, 80]
+    assert inserted[0]["timestamp"] == datetime(2026, 2, 2, 0, 0)
+
+
+@pytest.mark.asyncio
+async def test_last_chunk_marks_batch_done():
+    redis = AsyncMock()
+    redis.hincrby.return_value = 3
+    redis.hmget.return_value = [b"queued", b"3"]
+
+    await record_chunk_processed(redis, "sync_1", 500)
+
+    redis.hset.assert_awaited_once_with("ingest:batch:sync_1", "status", "done")
+
+
+@pytest.mark.asyncio
+async def test_failed_chunk_fails_batch():
+    redis = AsyncMock()
+
+    await record_chunk_failed(redis, "sync_1")
+
+    redis.hincrby.assert_awaited_once_with("ingest:batch:sync_1", "failed_chunks", 1)
+    redis.hset.assert_awaited_once_with("ingest:batch:sync_1", "status", "failed")